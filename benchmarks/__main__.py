@@ -0,0 +1,44 @@
+import sys
+import argparse
+from benchmarks import runner
+from benchmarks import bench_pagination, bench_serializer, bench_resource, bench_parsing, bench_roundtrip  # noqa
+from benchmarks import bench_models  # noqa
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Times the stages of the request path')
+    parser.add_argument('-k', '--filter', help='only run the benchmarks whose name or group contain this text')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.1, help='min seconds per round')
+    parser.add_argument('--save', help='save the results as json, to be used as baseline')
+    parser.add_argument('--compare', help='baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown (median) from which a benchmark is a regression, 0.1 is 10%%')
+    args = parser.parse_args(argv)
+
+    benchmarks = [b for b in runner.registry if not args.filter or args.filter in b.name or args.filter in b.group]
+
+    print('{:<40} {:>12} {:>12}'.format('benchmark', 'median', 'best'))
+    results = runner.run(benchmarks, repeat=args.repeat, min_time=args.min_time)
+
+    if args.save:
+        runner.save(results, args.save)
+
+    if args.compare:
+        changes, regressions = runner.compare(results, runner.load(args.compare), threshold=args.threshold)
+
+        print('\n{:<40} {:>12} {:>12} {:>9}'.format('compared with {}'.format(args.compare),
+                                                   'median', 'best', 'change'))
+        for bench in benchmarks:
+            if bench.name in changes:
+                print(runner.format_row(bench.name, results[bench.name], changes[bench.name]))
+
+        if regressions:
+            print('\nRegressions over {:.0%}: {}'.format(args.threshold, ', '.join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+from peach import Peach
+from peach.handlers.falcon import FalconHandler
+from peach.handlers.flask import FlaskHandler
+
+
+# The data is kept by the in memory proxy, so the timings don't depend on a database server
+DATABASE = {
+    'proxy': 'peach.database.memory_proxy.MemoryDBProxy',
+    'name': 'benchmarks',
+    'indexes': 'off'
+}
+
+
+def api_config(resource_class, ids_url):
+    return {
+        'APIS': {
+            'api': {
+                'prefix': '/api',
+                'name': 'Benchmark Api',
+                'version': '0.0.1',
+                'endpoints': [
+                    {
+                        'name': 'people',
+                        'class': resource_class,
+                        'urls': ['/people', ids_url]
+                    }
+                ]
+            }
+        },
+        'DATABASE': DATABASE
+    }
+
+
+flask_config = api_config('benchmarks.app.FlaskPeopleResource', '/people/<string:ids>')
+falcon_config = api_config('benchmarks.app.FalconPeopleResource', '/people/{ids}')
+
+# Models get their database proxy when they are defined, so peach has to be initialized first
+Peach.init(falcon_config, FalconHandler())
+
+
+from marshmallow import fields
+from peach.models import BaseModel, CompactModel, LazyModel
+from peach.filters import BaseFilter
+from peach.filters.mongo import NameFilter
+from peach.database.memory_proxy import drop_database
+from peach.rest.serializers import ModelSerializer
+from peach.rest.resource import BaseResource, RequestHelper
+from peach.rest.pagination import Pagination
+from peach.rest.response import ResponseDocumentFactory
+from peach.handlers.flask.resource import FlaskBaseResource
+from peach.handlers.falcon.resource import FalconBaseResource
+from benchmarks import datasets
+
+
+class People(BaseModel):
+
+    collection_name = 'people'
+    memory_indexes = [('age', 'sorted')]
+
+    @classmethod
+    def build(cls, doc):
+        return People(**doc) if doc else None
+
+
+class CompactPeople(CompactModel):
+
+    collection_name = 'people'
+    fields = ('name', 'age', 'address')
+
+
+class PeopleListing(LazyModel):
+
+    collection_name = 'people'
+
+
+class PeopleSerializer(ModelSerializer):
+
+    model = People
+
+    name = fields.Str(required=True)
+    age = fields.Int(required=True)
+    address = fields.Str()
+
+
+class AgeFilter(BaseFilter):
+
+    name = 'age'
+    value_type = int
+    allow_multiple = False
+
+    @classmethod
+    def condition(cls, age):
+        return {'age': age}
+
+
+class PeopleResource(BaseResource):
+    model = People
+    serializer = PeopleSerializer
+    filters = [NameFilter, AgeFilter]
+
+
+class FlaskPeopleResource(PeopleResource, FlaskBaseResource):
+    pass
+
+
+class FalconPeopleResource(PeopleResource, FalconBaseResource):
+    pass
+
+
+class StaticRequestHelper(RequestHelper):
+
+    """
+    Request helper with already parsed arguments, to time the resource without any web framework
+    """
+
+    def __init__(self, args, base_url='/api/people', querystring=''):
+        super().__init__()
+        self._parsed_args = args
+        self._base_url = base_url
+        self._querystring = querystring
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    @property
+    def querystring(self):
+        return self._querystring
+
+
+def load_people(n):
+    """
+    Replaces the stored people with n of them
+    """
+    drop_database(DATABASE['name'])
+    People.db.add_many(People, datasets.people_docs(n))
+
+
+def resource(args):
+    return PeopleResource(StaticRequestHelper(args),
+                          prefix='/api',
+                          database=People.db,
+                          pagination=Pagination,
+                          response_factory=ResponseDocumentFactory)
+
+
+def flask_app():
+    handler = FlaskHandler()
+    return handler.create_app(handler.get_config(flask_config))
+
+
+def falcon_app():
+    return FalconHandler().create_app(falcon_config)
@@ -0,0 +1,60 @@
+from bson import decode
+from benchmarks.runner import benchmark
+from benchmarks.app import People, CompactPeople, PeopleListing, PeopleSerializer
+from benchmarks import datasets
+
+
+MODELS = (('base', People, datasets.people), ('compact', CompactPeople, datasets.compact_people))
+
+
+def build(model, docs):
+    return [model.build(doc) for doc in docs]
+
+
+for label, model, people in MODELS:
+    benchmark('models-100k-{}'.format(label), memory=True)(
+        lambda model=model: (lambda docs=datasets.people_docs(100000): build(model, docs)))
+
+    benchmark('build-1k-{}'.format(label))(
+        lambda model=model: (lambda docs=datasets.people_docs(1000): build(model, docs)))
+
+    benchmark('attribute-access-1k-{}'.format(label))(
+        lambda people=people: (lambda models=people(1000): [(p.name, p.age, p.address) for p in models]))
+
+    benchmark('serialize-1k-{}'.format(label))(
+        lambda people=people: (lambda models=people(1000): PeopleSerializer.serialize(models, many=True)))
+
+
+# All of them start from raw BSON, decoding it into dicts is what the proxies do for the other models. Lazy
+# models decode the whole document once a field is read, so reading only the serialized fields (a projection)
+# is the fair comparison for them
+
+@benchmark('decode-serialize-1k-base')
+def decode_serialize_base():
+    docs = datasets.raw_people_docs(1000)
+    return lambda: PeopleSerializer.serialize([People.build(decode(d.raw)) for d in docs], many=True)
+
+
+@benchmark('decode-serialize-1k-projected')
+def decode_serialize_projected():
+    docs = datasets.raw_people_docs(1000, fields=PeopleSerializer.field_names())
+    return lambda: PeopleSerializer.serialize([People.build(decode(d.raw)) for d in docs], many=True)
+
+
+@benchmark('decode-serialize-1k-lazy')
+def decode_serialize_lazy():
+    docs = datasets.raw_people_docs(1000)
+    return lambda: PeopleSerializer.serialize([PeopleListing.build(d) for d in docs], many=True)
+
+
+@benchmark('decode-build-1k-base')
+def decode_build_base():
+    docs = datasets.raw_people_docs(1000)
+    return lambda: [People.build(decode(d.raw)) for d in docs]
+
+
+@benchmark('decode-build-1k-lazy')
+def decode_build_lazy():
+    # nothing is decoded until a field is read
+    docs = datasets.raw_people_docs(1000)
+    return lambda: [PeopleListing.build(d) for d in docs]
@@ -0,0 +1,36 @@
+from peach.rest.pagination import Pagination
+from peach.rest.response import DataDocument, ResponseDocumentFactory
+from benchmarks.runner import benchmark
+
+
+QUERYSTRING = 'filter[name]=Foo&sort=<age&page[number]=3&page[size]=24'
+
+
+def pagination(page=3, size=24, total=10000):
+    pagination = Pagination(page_number=page, page_size=size)
+    pagination.total = total
+    return pagination
+
+
+@benchmark('pagination-math')
+def pagination_math():
+    def run():
+        for page in range(100):
+            p = pagination(page=page)
+            p.skip, p.limit, p.last, p.has_next
+
+    return run
+
+
+@benchmark('pagination-links')
+def pagination_links():
+    document = DataDocument('/people', '/api/people', QUERYSTRING)
+    p = pagination()
+    return lambda: document._build_pagination_links('/people', '/api/people', QUERYSTRING, p)
+
+
+@benchmark('pagination-document')
+def pagination_document():
+    p = pagination()
+    return lambda: ResponseDocumentFactory.data_response('/people', '/api/people', QUERYSTRING, data=[],
+                                                         pagination=p).data()
@@ -0,0 +1,35 @@
+import flask
+import falcon
+from falcon import testing
+from peach.handlers.flask.resource import FlaskRequestHelper, FlaskQueryStringHelper
+from peach.handlers.falcon.resource import FalconRequestHelper, FalconQueryStringHelper
+from benchmarks.runner import benchmark
+from peach.rest.pagination import Pagination
+from benchmarks.app import PeopleResource
+
+
+QUERYSTRING = 'filter[name]=Foo&filter[age]=22&sort=<age,name&page[number]=2&page[size]=10&fields[people]=name,age'
+
+
+def request_args():
+    return PeopleResource.compile_request_args(Pagination)
+
+
+def parse_flask(helper_class):
+    args = request_args()
+    context = flask.Flask(__name__).test_request_context('/api/people?{}'.format(QUERYSTRING))
+    context.push()
+
+    return (lambda: helper_class().parse(flask.request, args)), context.pop
+
+
+def parse_falcon(helper_class):
+    args = request_args()
+    req = falcon.Request(testing.create_environ(path='/api/people', query_string=QUERYSTRING))
+    return lambda: helper_class().parse(req, args)
+
+
+benchmark('parse-flask')(lambda: parse_flask(FlaskRequestHelper))
+benchmark('parse-flask-querystring')(lambda: parse_flask(FlaskQueryStringHelper))
+benchmark('parse-falcon')(lambda: parse_falcon(FalconRequestHelper))
+benchmark('parse-falcon-querystring')(lambda: parse_falcon(FalconQueryStringHelper))
@@ -0,0 +1,34 @@
+from peach.utils import ObjectDict
+from peach.rest.pagination import Pagination
+from benchmarks.runner import benchmark
+from benchmarks.app import resource, load_people
+
+
+@benchmark('requested-filters')
+def requested_filters():
+    people = resource(ObjectDict(name=['Foo'], age=22, sort=['<age'], page_size=24))
+    return lambda: people.requested_filters
+
+
+def get_by_filters(args):
+    load_people(1000)
+    people = resource(ObjectDict(args, page_size=24))
+    filters = people.requested_filters
+    return lambda: people.get_by_filters(filters, Pagination(page_size=24))
+
+
+@benchmark('get-by-filters-1k')
+def get_by_age():
+    return get_by_filters({'age': 30})
+
+
+@benchmark('get-by-filters-1k-two-filters')
+def get_by_name_and_age():
+    return get_by_filters({'age': 30, 'name': ['Maria']})
+
+
+@benchmark('resource-get-1k')
+def resource_get():
+    load_people(1000)
+    people = resource(ObjectDict(age=30, sort=['name'], page_size=24))
+    return people.get
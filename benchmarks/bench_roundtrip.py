@@ -0,0 +1,40 @@
+from falcon import testing
+from benchmarks.runner import benchmark
+from benchmarks.app import flask_app, falcon_app, load_people
+
+
+LISTING = '/api/people?page[size]=24&sort=name'
+FILTERED = '/api/people?filter[age]=30&page[size]=24'
+
+
+def flask_get(url):
+    load_people(1000)
+    client = flask_app().test_client()
+    return lambda: client.get(url).data
+
+
+def falcon_get(url):
+    load_people(1000)
+    client = testing.TestClient(falcon_app())
+    path, _, query = url.partition('?')
+    return lambda: client.simulate_get(path, query_string=query).content
+
+
+@benchmark('flask-get-listing')
+def flask_listing():
+    return flask_get(LISTING)
+
+
+@benchmark('flask-get-filtered')
+def flask_filtered():
+    return flask_get(FILTERED)
+
+
+@benchmark('falcon-get-listing')
+def falcon_listing():
+    return falcon_get(LISTING)
+
+
+@benchmark('falcon-get-filtered')
+def falcon_filtered():
+    return falcon_get(FILTERED)
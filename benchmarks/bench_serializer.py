@@ -0,0 +1,24 @@
+from benchmarks.runner import benchmark
+from benchmarks.app import PeopleSerializer
+from benchmarks import datasets
+
+
+def serialize(n, fields=None):
+    people = datasets.people(n)
+    return lambda: PeopleSerializer.serialize(people, filters=fields, many=True)
+
+
+for n, label in ((10, '10'), (1000, '1k'), (10000, '10k')):
+    benchmark('serialize-{}'.format(label))(lambda n=n: serialize(n))
+
+
+@benchmark('serialize-1k-sparse-fields')
+def serialize_sparse():
+    return serialize(1000, fields=['name'])
+
+
+@benchmark('deserialize')
+def deserialize():
+    doc = datasets.people_docs(1)[0]
+    doc.pop('_id')
+    return lambda: PeopleSerializer.deserialize(doc)
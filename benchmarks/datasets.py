@@ -0,0 +1,62 @@
+import random
+
+
+SEED = 20180611
+
+FIRST_NAMES = ['Ana', 'David', 'Foo', 'Jean', 'John', 'Laura', 'Maria', 'Paul', 'Sofia', 'Tomas']
+LAST_NAMES = ['Garcia', 'Smith', 'Martin', 'Rossi', 'Muller', 'Dubois', 'Silva', 'Novak']
+STREETS = ['Main St', 'High St', 'Park Ave', 'Oak Rd', 'Pine St', 'Elm Way']
+
+
+def people_docs(n, seed=SEED):
+    """
+    :return: n people documents, always the same ones for the same n and seed
+    """
+    rng = random.Random(seed)
+
+    return [{
+        '_id': '{:024x}'.format(i),
+        'name': '{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+        'age': rng.randint(18, 90),
+        'address': '{} {}'.format(rng.randint(1, 2000), rng.choice(STREETS))
+    } for i in range(n)]
+
+
+def people(n, seed=SEED):
+    """
+    :return: n People models, see people_docs
+    """
+    from benchmarks.app import People
+    return [People(**doc) for doc in people_docs(n, seed)]
+
+
+def compact_people(n, seed=SEED):
+    """
+    :return: n CompactPeople models, see people_docs
+    """
+    from benchmarks.app import CompactPeople
+    return [CompactPeople.build(doc) for doc in people_docs(n, seed)]
+
+
+def raw_people_docs(n, seed=SEED, fields=None):
+    """
+    Stored documents usually have more fields than the listings show, so these also have a bio and the
+    last visits, which the serializer doesn't dump
+
+    :param fields: fields to keep (besides the id), as a query with a projection returns them
+    :return: n people documents as raw BSON, the way mongo gives them to lazy models
+    """
+    from bson import encode
+    from bson.raw_bson import RawBSONDocument
+    rng = random.Random(seed)
+    docs = []
+
+    for doc in people_docs(n, seed):
+        doc['bio'] = ' '.join(rng.choice(FIRST_NAMES + LAST_NAMES + STREETS) for _ in range(40))
+        doc['visits'] = [rng.randint(0, 10 ** 9) for _ in range(20)]
+        if fields:
+            doc = {k: v for k, v in doc.items() if k == '_id' or k in fields}
+
+        docs.append(RawBSONDocument(encode(doc)))
+
+    return docs
@@ -0,0 +1,171 @@
+import gc
+import json
+import time
+import platform
+import tracemalloc
+import statistics
+from peach.utils import ObjectDict
+
+
+registry = []
+
+
+def benchmark(name, group=None, memory=False):
+    """
+    Registers a benchmark. The decorated function prepares the case and returns the function to time,
+    or a tuple (function, teardown) when something has to be undone afterwards. Memory benchmarks measure
+    the bytes held by what the function returns instead of timing it
+
+    Ex:
+       >> @benchmark('serialize-1k')
+       >> def serialize_1k():
+       >>     people = datasets.people(1000)
+       >>     return lambda: PeopleSerializer.serialize(people, many=True)
+    """
+    def decorator(setup):
+        registry.append(ObjectDict(name=name, group=group or setup.__module__.split('.')[-1], setup=setup,
+                                   memory=memory))
+        return setup
+
+    return decorator
+
+
+def measure(fn, repeat=5, min_time=0.1):
+    """
+    Times fn in rounds of as many calls as needed to last at least min_time seconds
+
+    :return: ObjectDict with the best and median seconds per call, and the calls per round
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+
+        if time.perf_counter() - start >= min_time:
+            break
+
+        number *= 2
+
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return ObjectDict(best=min(times), median=statistics.median(times), number=number)
+
+
+def measure_memory(fn, repeat=5):
+    """
+    Traces the allocations of fn and keeps the bytes still used by its result
+
+    :return: ObjectDict with the best and median bytes, like measure does with seconds
+    """
+    sizes = []
+
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            result = fn()
+            sizes.append(tracemalloc.get_traced_memory()[0])
+        finally:
+            tracemalloc.stop()
+
+        del result
+
+    return ObjectDict(best=min(sizes), median=statistics.median(sizes), number=1, unit='bytes')
+
+
+def run(benchmarks, repeat=5, min_time=0.1, report=print):
+    """
+    :return: dict {name: measure}
+    """
+    results = {}
+
+    for bench in benchmarks:
+        prepared = bench.setup()
+        fn, teardown = prepared if isinstance(prepared, tuple) else (prepared, None)
+
+        try:
+            if bench.memory:
+                results[bench.name] = measure_memory(fn, repeat=repeat)
+            else:
+                results[bench.name] = measure(fn, repeat=repeat, min_time=min_time)
+        finally:
+            if teardown:
+                teardown()
+
+        report(format_row(bench.name, results[bench.name]))
+
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    :param baseline: results of a previous run, as saved by save
+    :param threshold: slowdown ratio (median per call) from which a benchmark is considered a regression
+    :return: dict {name: change ratio} and the list of regressions
+    """
+    changes = {}
+    regressions = []
+
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+
+        # the ratio means the same for seconds and bytes, more is worse
+        changes[name] = result.median / previous['median'] - 1
+        if changes[name] > threshold:
+            regressions.append(name)
+
+    return changes, regressions
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': {name: {'best': r.best, 'median': r.median, 'number': r.number, 'unit': r.get('unit', 'seconds')}
+                    for name, r in results.items()}
+        }, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '{:.2f} {}'.format(seconds * scale, unit)
+
+    return '{:.0f} ns'.format(seconds * 1e9)
+
+
+def format_size(size):
+    for unit, scale in (('GB', 1e9), ('MB', 1e6), ('KB', 1e3)):
+        if size >= scale:
+            return '{:.2f} {}'.format(size / scale, unit)
+
+    return '{:.0f} B'.format(size)
+
+
+def format_row(name, result, change=None):
+    formatter = format_size if result.get('unit') == 'bytes' else format_time
+    row = '{:<40} {:>12} {:>12}'.format(name, formatter(result.median), formatter(result.best))
+    return row if change is None else '{} {:>+9.1%}'.format(row, change)
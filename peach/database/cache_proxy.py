@@ -0,0 +1,315 @@
+import sys
+import copy
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from .proxy import DBProxy, collection_name
+
+
+def approximate_size(value):
+    """
+    :return: rough amount of bytes used by a value and everything it contains
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, (dict, Mapping)):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(approximate_size(v) for v in value)
+
+    return size
+
+
+def freeze(value):
+    """
+    :return: hashable version of a query argument, equivalent queries give the same result
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+
+    # the type is part of the key, True and 1 are equal in python but not for the database
+    return value.__class__, value
+
+
+class QueryCache(object):
+
+    """
+    LRU cache with expiration and a memory bound. Entries are grouped by collection so a write
+    drops every cached result of the collection it touched.
+
+    :param max_entries: max amount of cached results
+    :param ttl: seconds a result is kept
+    :param max_bytes: approximate max amount of memory used by the cached results, unbounded if not set
+    """
+
+    def __init__(self, max_entries=1000, ttl=60, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._collections = {}
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, evictions=0, invalidations=0)
+
+    def generation(self, collection):
+        return self._generations.get(collection, 0)
+
+    def get(self, key):
+        """
+        :return: tuple (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[1]
+
+    def put(self, collection, key, value, generation, ttl=None):
+        """
+        Stores a result unless the collection was written after the result was read (generation changed)
+        """
+        size = approximate_size(value) if self.max_bytes else 0
+
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self.generation(collection):
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value, collection, size)
+            self._collections.setdefault(collection, set()).add(key)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        _, _, collection, size = self._entries.pop(key)
+        self._bytes -= size
+
+        keys = self._collections.get(collection)
+        if keys is not None:
+            keys.discard(key)
+
+    def invalidate(self, collection):
+        with self._lock:
+            self._generations[collection] = self.generation(collection) + 1
+            self._stats['invalidations'] += 1
+
+            for key in self._collections.pop(collection, ()):
+                _, _, _, size = self._entries.pop(key)
+                self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            for collection in list(self._collections):
+                self._generations[collection] = self.generation(collection) + 1
+
+            self._entries.clear()
+            self._collections.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Every proxy of the same database uses the same cache, otherwise a write done through one proxy
+# wouldn't invalidate the results cached by the others
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_cache(key, **options):
+    with caches_lock:
+        if key not in caches:
+            caches[key] = QueryCache(**options)
+
+        return caches[key]
+
+
+class CachedDBProxy(DBProxy):
+
+    """
+    Read through cache in front of another proxy. The results of find, find_with_count, count, by_attr,
+    by_id and by_ids are kept until they expire or a write (add, add_many, upsert, delete) goes through
+    any proxy of the same database. Writes done by other processes are only seen once the results expire.
+
+    It is enabled with a 'cache' entry in the database config
+
+    Ex:
+       >> DATABASE = {
+       >>     'proxy': 'peach.database.mongo_proxy.MongoDBProxy',
+       >>     'uri': 'mongodb://localhost:27017/',
+       >>     'name': 'PeopleDB',
+       >>     'cache': {
+       >>         'max_entries': 10000,
+       >>         'ttl': 30,
+       >>         'max_bytes': 64 * 1024 * 1024
+       >>     }
+       >> }
+
+    Models can set their own ttl with 'cache_ttl' (0 disables the cache for them). Cached models are
+    copied before being returned unless 'copy_results' is False, which is faster but the models must not
+    be modified then. Read only models (read_only = True, like LazyModel) are never copied.
+    """
+
+    @classmethod
+    def build(cls, proxy, db_conf):
+        options = dict(db_conf['cache'])
+        copy_results = options.pop('copy_results', True)
+        cache = get_cache((db_conf['proxy'], db_conf.get('uri'), db_conf.get('name')), **options)
+        return cls(proxy, cache, copy_results=copy_results)
+
+    def __init__(self, proxy, cache, copy_results=True):
+        self._proxy = proxy
+        self._cache = cache
+        self._copy_results = copy_results
+
+    def __getattr__(self, name):
+        # anything else the wrapped proxy offers (pool_stats, collection...)
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return getattr(self._proxy, name)
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _cached(self, model, key, query):
+        ttl = getattr(model, 'cache_ttl', None)
+        if ttl == 0:
+            return query()
+
+        # models sharing a collection build different instances from the same documents
+        collection = collection_name(model)
+        key = (collection, model) + key
+
+        found, value = self._cache.get(key)
+        if not found:
+            generation = self._cache.generation(collection)
+            value = query()
+            self._cache.put(collection, key, value, generation, ttl=ttl)
+
+        return copy.deepcopy(value) if self._copy_results and not getattr(model, 'read_only', False) else value
+
+    def _invalidate(self, model):
+        self._cache.invalidate(collection_name(model))
+
+    def add(self, model, doc):
+        try:
+            return self._proxy.add(model, doc)
+        finally:
+            self._invalidate(model)
+
+    def add_many(self, model, docs, batch_size=None):
+        try:
+            return self._proxy.add_many(model, docs, batch_size=batch_size)
+        finally:
+            self._invalidate(model)
+
+    def upsert(self, model, *docs, batch_size=None):
+        try:
+            return self._proxy.upsert(model, *docs, batch_size=batch_size)
+        finally:
+            self._invalidate(model)
+
+    def delete(self, model, *doc_ids, batch_size=None):
+        try:
+            return self._proxy.delete(model, *doc_ids, batch_size=batch_size)
+        finally:
+            self._invalidate(model)
+
+    def count(self, model, condition, **kwargs):
+        return self._cached(model,
+                            ('count', freeze(condition), freeze(kwargs)),
+                            lambda: self._proxy.count(model, condition, **kwargs))
+
+    def estimated_count(self, model):
+        return self._cached(model, ('estimated_count',), lambda: self._proxy.estimated_count(model))
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        key = ('find', freeze(condition), skip, limit, freeze(sort), freeze(after), freeze(fields), freeze(kwargs))
+        query = lambda: list(self._proxy.find(model,
+                                              condition,
+                                              skip=skip,
+                                              limit=limit,
+                                              sort=sort,
+                                              after=after,
+                                              fields=fields,
+                                              **kwargs))
+        yield from self._cached(model, key, query)
+
+    def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        key = ('find_with_count',
+               freeze(condition), skip, limit, freeze(sort), freeze(after), freeze(fields), freeze(kwargs))
+        query = lambda: self._proxy.find_with_count(model,
+                                                    condition,
+                                                    skip=skip,
+                                                    limit=limit,
+                                                    sort=sort,
+                                                    after=after,
+                                                    fields=fields,
+                                                    **kwargs)
+        return self._cached(model, key, query)
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        key = ('by_attr', attr, freeze(value), exact, many, skip, limit, freeze(sort), freeze(fields))
+        query = lambda: list(self._proxy.by_attr(model,
+                                                 attr,
+                                                 value,
+                                                 exact,
+                                                 many,
+                                                 skip=skip,
+                                                 limit=limit,
+                                                 sort=sort,
+                                                 fields=fields))
+        yield from self._cached(model, key, query)
+
+    def by_id(self, model, id):
+        return self._cached(model, ('by_id', freeze(id)), lambda: self._proxy.by_id(model, id))
+
+    def by_ids(self, model, ids, fields=None):
+        return self._cached(model,
+                            ('by_ids', freeze(ids), freeze(fields)),
+                            lambda: self._proxy.by_ids(model, ids, fields=fields))
+
+    def indexes(self, model):
+        return self._proxy.indexes(model)
+
+    def index_usage(self, model):
+        return self._proxy.index_usage(model)
+
+    def create_indexes(self, model, indexes):
+        return self._proxy.create_indexes(model, indexes)
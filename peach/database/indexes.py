@@ -0,0 +1,148 @@
+import logging
+from peach.utils import ObjectDict
+from .proxy import parse_sort, collection_name
+
+
+logger = logging.getLogger(__name__)
+
+
+TEXT = 'text'
+
+
+class Index(object):
+
+    """
+    Index a model or a filter relies on. Keys follow the sort syntax, prefixed with < (descending) or
+    > (ascending, the default)
+
+    Ex:
+       >> class People(BaseModel):
+       >>     indexes = [
+       >>         Index('name', unique=True),
+       >>         Index('<age', 'name'),
+       >>         Index.ttl('created_at', expire_after=3600),
+       >>         Index.text('name', 'address', weights={'name': 10})
+       >>     ]
+
+       >> class DateRangeFilter(BaseFilter):
+       >>     indexes = [Index('date')]
+    """
+
+    def __init__(self, *keys, name=None, **options):
+        """
+        :param keys: attributes of the index, or (attribute, direction) tuples
+        :param name: index name, by default it's built from the keys the way MongoDB does
+        :param options: any other index option (unique, sparse, expireAfterSeconds, partialFilterExpression...)
+        """
+        self.keys = [k if isinstance(k, tuple) else parse_sort([k])[0] for k in keys]
+        self.name = name or '_'.join('{}_{}'.format(attr, direction) for attr, direction in self.keys)
+        self.options = options
+
+    @classmethod
+    def ttl(cls, key, expire_after, **options):
+        return cls(key, expireAfterSeconds=expire_after, **options)
+
+    @classmethod
+    def text(cls, *keys, weights=None, **options):
+        if weights:
+            options['weights'] = weights
+
+        return cls(*[(k, TEXT) for k in keys], **options)
+
+    @property
+    def is_text(self):
+        return any(direction == TEXT for _, direction in self.keys)
+
+    @property
+    def signature(self):
+        """
+        What makes two indexes the same one. Text indexes are defined by the attributes they cover, their
+        order doesn't matter
+        """
+        if self.is_text:
+            return TEXT, tuple(sorted(attr for attr, _ in self.keys))
+
+        return tuple(self.keys)
+
+    @classmethod
+    def from_info(cls, name, info):
+        """
+        Builds the index out of the description given by pymongo's index_information
+        """
+        if 'weights' in info:
+            return cls(*[(attr, TEXT) for attr in info['weights']], name=name, weights=dict(info['weights']))
+
+        options = {k: v for k, v in info.items() if k in ('unique', 'sparse', 'expireAfterSeconds')}
+        return cls(*[(attr, int(direction) if isinstance(direction, float) else direction)
+                     for attr, direction in info['key']], name=name, **options)
+
+    def __eq__(self, other):
+        return isinstance(other, Index) and self.signature == other.signature
+
+    def __hash__(self):
+        return hash(self.signature)
+
+    def __repr__(self):
+        return 'Index({})'.format(self.name)
+
+
+def declared_indexes(resources):
+    """
+    :param resources: resource classes
+    :return: dict {model: [Index]} with the indexes declared by the models of the resources and their filters
+    """
+    declared = {}
+
+    for resource in resources:
+        model = getattr(resource, 'model', None)
+        if model is None:
+            continue
+
+        indexes = declared.setdefault(model, [])
+        for index in list(getattr(model, 'indexes', None) or []) + \
+                [i for f in getattr(resource, 'filters', None) or [] for i in getattr(f, 'indexes', None) or []]:
+            if index not in indexes:
+                indexes.append(index)
+
+    return declared
+
+
+def reconcile_indexes(db, declared, dry_run=False):
+    """
+    Compares the declared indexes with the ones the database has, creating the missing ones unless
+    it is a dry run.
+
+    :param db: database proxy
+    :param declared: dict {model: [Index]}, see declared_indexes
+    :param dry_run: only report, don't create anything
+    :return: dict {collection: report}. Reports list the missing indexes, the existing ones nobody declared
+             (undeclared) and, when the database keeps usage stats, the undeclared ones never used (unused)
+    """
+    reports = {}
+
+    for model, indexes in declared.items():
+        if not indexes:
+            continue
+
+        existing = [i for i in db.indexes(model) if i.name != '_id_']
+        usage = db.index_usage(model)
+
+        report = ObjectDict(missing=[i for i in indexes if i not in existing],
+                            undeclared=[i for i in existing if i not in indexes],
+                            created=[])
+        report.unused = [i for i in report.undeclared if usage is not None and not usage.get(i.name)]
+
+        if report.missing and not dry_run:
+            db.create_indexes(model, report.missing)
+            report.created = report.missing
+
+        for index in report.missing:
+            logger.warning("%s index %s on '%s'", 'Created' if report.created else 'Missing', index.name,
+                           collection_name(model))
+
+        for index in report.unused:
+            logger.warning("Unused index %s on '%s'", index.name, collection_name(model))
+
+        reports[collection_name(model)] = report
+
+    return reports
@@ -0,0 +1,537 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from peach.utils import ObjectDict, load_resource_class
+from .proxy import DBProxy, AsyncDBProxy, collection_name, attr_condition
+from .cache_proxy import approximate_size
+
+try:
+    from bson import BSON
+except ImportError:
+    BSON = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def query_shape(condition, sort=None):
+    """
+    :return: the condition with its values replaced by '?', so the queries that only differ in the
+             values get the same shape
+    Ex:
+       >> query_shape({'age': {'$gt': 20}, 'name': {'$in': ['a', 'b']}}, sort=['<age'])
+       >> '{"age": {"$gt": "?"}, "name": {"$in": "?"}} sort=<age'
+    """
+    def shape(value):
+        if isinstance(value, dict):
+            return {k: [shape(c) for c in v] if k in ('$and', '$or', '$nor') and isinstance(v, list) else shape(v)
+                    for k, v in value.items()}
+
+        return '?'
+
+    expr = json.dumps(shape(condition or {}), sort_keys=True)
+    return '{} sort={}'.format(expr, ','.join(sort)) if sort else expr
+
+
+def document_size(doc):
+    """
+    :return: size of the document once encoded as BSON, approximated when bson isn't available
+    """
+    raw = getattr(doc, 'raw', None)
+    if isinstance(raw, bytes):
+        return len(raw)
+
+    if BSON is not None:
+        try:
+            return len(BSON.encode(doc))
+        except Exception:
+            pass
+
+    return approximate_size(doc)
+
+
+class Histogram(object):
+
+    """
+    Latencies (milliseconds) grouped in fixed buckets, percentiles are given by the upper bound of the bucket
+    """
+
+    BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+
+        self.count += other.count
+        self.sum += other.sum
+
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        :param q: percentile, between 0 and 100
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+
+        return self.max
+
+    def summary(self):
+        return ObjectDict(count=self.count,
+                          total=self.sum,
+                          mean=self.sum / self.count if self.count else None,
+                          min=self.min,
+                          max=self.max,
+                          p50=self.percentile(50),
+                          p95=self.percentile(95),
+                          p99=self.percentile(99))
+
+
+class QueryStats(object):
+
+    """
+    In process aggregation of the proxy calls: a latency histogram plus documents and bytes counters per
+    collection, operation and query shape. Every instrumented proxy exports to the module level query_stats
+    unless configured otherwise
+
+    Ex:
+       >> for stats in query_stats.top(10, by='count'):     # the same shape called many times is usually an N+1
+       >>     print(stats.collection, stats.operation, stats.shape, stats.count, stats.p95)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def export(self, event):
+        key = (event.collection, event.operation, event.shape)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ObjectDict(latency=Histogram(), documents=0, bytes=0, errors=0)
+
+            stats.latency.record(event.duration * 1000)
+            stats.documents += event.documents or 0
+            stats.bytes += event.bytes or 0
+            stats.errors += 1 if event.error else 0
+
+    def stats(self):
+        """
+        :return: list with the stats of every collection, operation and query shape
+        """
+        with self._lock:
+            return [ObjectDict(collection=collection,
+                               operation=operation,
+                               shape=shape,
+                               documents=stats.documents,
+                               bytes=stats.bytes,
+                               errors=stats.errors,
+                               **stats.latency.summary())
+                    for (collection, operation, shape), stats in self._stats.items()]
+
+    def top(self, n=10, by='total'):
+        """
+        :param by: count, total (time), mean, p95, p99, max, documents or bytes
+        """
+        return sorted(self.stats(), key=lambda s: s[by] or 0, reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats()
+
+
+class SlowQueryLogger(object):
+
+    """
+    Exporter that logs the calls taking more than threshold_ms
+    """
+
+    def __init__(self, threshold_ms=100):
+        self.threshold_ms = threshold_ms
+
+    def export(self, event):
+        if event.duration * 1000 >= self.threshold_ms:
+            logger.warning("Slow %s on '%s' (%.1f ms, %s documents): %s", event.operation, event.collection,
+                           event.duration * 1000, event.documents, event.shape)
+
+
+class Instrumentation(object):
+
+    """
+    Builds an event for every proxy call and hands it to the exporters. Exporters are objects with an
+    export(event) method, events are ObjectDicts with collection, operation, shape, duration (seconds),
+    documents, bytes (None unless measure_bytes) and error
+    """
+
+    def __init__(self, exporters=None, measure_bytes=False):
+        self.exporters = [query_stats] if exporters is None else list(exporters)
+        self.measure_bytes = measure_bytes
+
+    @classmethod
+    def build(cls, db_conf):
+        """
+        Builds it out of the 'instrumentation' entry of the database config
+        """
+        options = db_conf['instrumentation']
+        options = options if isinstance(options, dict) else {}
+
+        exporters = [query_stats] if options.get('aggregate', True) else []
+        for exporter in options.get('exporters') or []:
+            exporters.append(load_resource_class(exporter)() if isinstance(exporter, str) else exporter)
+
+        return cls(exporters, measure_bytes=options.get('bytes', False))
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def size(self, docs):
+        return sum(document_size(d) for d in docs if d is not None) if self.measure_bytes else None
+
+    def record(self, model, operation, shape, duration, documents=None, size=None, error=None):
+        event = ObjectDict(collection=collection_name(model),
+                           operation=operation,
+                           shape=shape,
+                           duration=duration,
+                           documents=documents,
+                           bytes=size,
+                           error=error)
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(event)
+            except Exception:
+                logger.exception("Exporter %s failed", exporter)
+
+
+ID_SHAPE = query_shape({'_id': 0})
+IDS_SHAPE = query_shape({'_id': {'$in': 0}})
+WRITE_SHAPE = ''
+
+
+class InstrumentedDBProxy(DBProxy):
+
+    """
+    Proxy that times every call to another proxy and reports it to the exporters of its instrumentation
+    (see Instrumentation). It is enabled with an 'instrumentation' entry in the database config
+
+    Ex:
+       >> DATABASE = {
+       >>     'proxy': 'peach.database.mongo_proxy.MongoDBProxy',
+       >>     'uri': 'mongodb://localhost:27017/',
+       >>     'name': 'PeopleDB',
+       >>     'instrumentation': {
+       >>         'bytes': True,
+       >>         'exporters': ['myapp.metrics.StatsdExporter']
+       >>     }
+       >> }
+
+    Only the time spent in the wrapped proxy is measured, for find and by_attr that's the time spent
+    getting every element out of the cursor, not the time the caller spends between them.
+    """
+
+    @classmethod
+    def build(cls, proxy, db_conf):
+        return cls(proxy, Instrumentation.build(db_conf))
+
+    def __init__(self, proxy, instrumentation=None):
+        self._proxy = proxy
+        self._instrumentation = instrumentation or Instrumentation()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return getattr(self._proxy, name)
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    def _call(self, model, operation, shape, call, documents=None):
+        """
+        :param documents: function giving the documents involved out of the result
+        """
+        result = error = None
+        start = time.perf_counter()
+
+        try:
+            result = call()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            docs = documents(result) if documents and error is None else []
+            self._instrumentation.record(model, operation, shape, duration,
+                                         documents=len(docs) if documents else None,
+                                         size=self._instrumentation.size(docs),
+                                         error=error)
+
+    def _iterate(self, model, operation, shape, iterator):
+        duration = 0
+        documents = size = 0
+        error = None
+
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    duration += time.perf_counter() - start
+
+                documents += 1
+                size += self._instrumentation.size([item]) or 0
+                yield item
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._instrumentation.record(model, operation, shape, duration,
+                                         documents=documents,
+                                         size=size if self._instrumentation.measure_bytes else None,
+                                         error=error)
+
+    def add(self, model, doc):
+        return self._call(model, 'add', WRITE_SHAPE, lambda: self._proxy.add(model, doc), lambda _: [doc])
+
+    def add_many(self, model, docs, batch_size=None):
+        docs = list(docs)
+        return self._call(model, 'add_many', WRITE_SHAPE,
+                          lambda: self._proxy.add_many(model, docs, batch_size=batch_size), lambda _: docs)
+
+    def upsert(self, model, *docs, batch_size=None):
+        return self._call(model, 'upsert', WRITE_SHAPE,
+                          lambda: self._proxy.upsert(model, *docs, batch_size=batch_size), lambda _: docs)
+
+    def delete(self, model, *doc_ids, batch_size=None):
+        return self._call(model, 'delete', IDS_SHAPE,
+                          lambda: self._proxy.delete(model, *doc_ids, batch_size=batch_size))
+
+    def count(self, model, condition, **kwargs):
+        return self._call(model, 'count', query_shape(condition), lambda: self._proxy.count(model, condition, **kwargs))
+
+    def estimated_count(self, model):
+        return self._call(model, 'estimated_count', WRITE_SHAPE, lambda: self._proxy.estimated_count(model))
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        return self._iterate(model, 'find', query_shape(condition, sort),
+                             self._proxy.find(model,
+                                              condition,
+                                              skip=skip,
+                                              limit=limit,
+                                              sort=sort,
+                                              after=after,
+                                              fields=fields,
+                                              **kwargs))
+
+    def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        return self._call(model, 'find_with_count', query_shape(condition, sort),
+                          lambda: self._proxy.find_with_count(model,
+                                                              condition,
+                                                              skip=skip,
+                                                              limit=limit,
+                                                              sort=sort,
+                                                              after=after,
+                                                              fields=fields,
+                                                              **kwargs),
+                          lambda result: result[0])
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        return self._iterate(model, 'by_attr', query_shape(attr_condition(attr, value, exact, model), sort),
+                             self._proxy.by_attr(model,
+                                                 attr,
+                                                 value,
+                                                 exact,
+                                                 many,
+                                                 skip=skip,
+                                                 limit=limit,
+                                                 sort=sort,
+                                                 fields=fields))
+
+    def by_id(self, model, id):
+        return self._call(model, 'by_id', ID_SHAPE, lambda: self._proxy.by_id(model, id),
+                          lambda m: [m] if m is not None else [])
+
+    def by_ids(self, model, ids, fields=None):
+        return self._call(model, 'by_ids', IDS_SHAPE, lambda: self._proxy.by_ids(model, ids, fields=fields), list)
+
+    def indexes(self, model):
+        return self._proxy.indexes(model)
+
+    def index_usage(self, model):
+        return self._proxy.index_usage(model)
+
+    def create_indexes(self, model, indexes):
+        return self._proxy.create_indexes(model, indexes)
+
+
+class AsyncInstrumentedDBProxy(AsyncDBProxy):
+
+    """
+    Asyncio version of InstrumentedDBProxy, used for the 'async_proxy' when the database config has
+    an 'instrumentation' entry
+    """
+
+    @classmethod
+    def build(cls, proxy, db_conf):
+        return cls(proxy, Instrumentation.build(db_conf))
+
+    def __init__(self, proxy, instrumentation=None):
+        self._proxy = proxy
+        self._instrumentation = instrumentation or Instrumentation()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return getattr(self._proxy, name)
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    async def _call(self, model, operation, shape, call, documents=None):
+        result = error = None
+        start = time.perf_counter()
+
+        try:
+            result = await call()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            docs = documents(result) if documents and error is None else []
+            self._instrumentation.record(model, operation, shape, duration,
+                                         documents=len(docs) if documents else None,
+                                         size=self._instrumentation.size(docs),
+                                         error=error)
+
+    async def _iterate(self, model, operation, shape, iterator):
+        duration = 0
+        documents = size = 0
+        error = None
+
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    duration += time.perf_counter() - start
+
+                documents += 1
+                size += self._instrumentation.size([item]) or 0
+                yield item
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._instrumentation.record(model, operation, shape, duration,
+                                         documents=documents,
+                                         size=size if self._instrumentation.measure_bytes else None,
+                                         error=error)
+
+    async def add(self, model, doc):
+        return await self._call(model, 'add', WRITE_SHAPE, lambda: self._proxy.add(model, doc), lambda _: [doc])
+
+    async def add_many(self, model, docs, batch_size=None):
+        docs = list(docs)
+        return await self._call(model, 'add_many', WRITE_SHAPE,
+                                lambda: self._proxy.add_many(model, docs, batch_size=batch_size), lambda _: docs)
+
+    async def upsert(self, model, *docs, batch_size=None):
+        return await self._call(model, 'upsert', WRITE_SHAPE,
+                                lambda: self._proxy.upsert(model, *docs, batch_size=batch_size), lambda _: docs)
+
+    async def delete(self, model, *doc_ids, batch_size=None):
+        return await self._call(model, 'delete', IDS_SHAPE,
+                                lambda: self._proxy.delete(model, *doc_ids, batch_size=batch_size))
+
+    async def count(self, model, condition, **kwargs):
+        return await self._call(model, 'count', query_shape(condition),
+                                lambda: self._proxy.count(model, condition, **kwargs))
+
+    async def estimated_count(self, model):
+        return await self._call(model, 'estimated_count', WRITE_SHAPE, lambda: self._proxy.estimated_count(model))
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        return self._iterate(model, 'find', query_shape(condition, sort),
+                             self._proxy.find(model,
+                                              condition,
+                                              skip=skip,
+                                              limit=limit,
+                                              sort=sort,
+                                              after=after,
+                                              fields=fields,
+                                              **kwargs))
+
+    async def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        return await self._call(model, 'find_with_count', query_shape(condition, sort),
+                                lambda: self._proxy.find_with_count(model,
+                                                                    condition,
+                                                                    skip=skip,
+                                                                    limit=limit,
+                                                                    sort=sort,
+                                                                    after=after,
+                                                                    fields=fields,
+                                                                    **kwargs),
+                                lambda result: result[0])
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        return self._iterate(model, 'by_attr', query_shape(attr_condition(attr, value, exact, model), sort),
+                             self._proxy.by_attr(model,
+                                                 attr,
+                                                 value,
+                                                 exact,
+                                                 many,
+                                                 skip=skip,
+                                                 limit=limit,
+                                                 sort=sort,
+                                                 fields=fields))
+
+    async def by_id(self, model, id):
+        return await self._call(model, 'by_id', ID_SHAPE, lambda: self._proxy.by_id(model, id),
+                                lambda m: [m] if m is not None else [])
+
+    async def by_ids(self, model, ids, fields=None):
+        return await self._call(model, 'by_ids', IDS_SHAPE, lambda: self._proxy.by_ids(model, ids, fields=fields),
+                                list)
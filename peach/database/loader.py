@@ -0,0 +1,135 @@
+import asyncio
+
+
+class Deferred(object):
+
+    """
+    Element requested to a ModelLoader, it is retrieved along with every other pending one the first
+    time any of them is needed
+    """
+
+    def __init__(self, loader, id):
+        self._loader = loader
+        self._id = id
+
+    @property
+    def id(self):
+        return self._id
+
+    def get(self):
+        return self._loader.get(self._id)
+
+
+class ModelLoader(object):
+
+    """
+    Collects the ids requested during a request and retrieves them with a single by_ids query. Elements
+    are kept, so asking twice for the same one doesn't hit the database again.
+
+    Ex:
+       >> loader = resource.loader(People)
+       >> authors = [loader.load(book.author_id) for book in books]
+       >> names = [a.get().name for a in authors]     # a single query gets every author
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self._pending = []
+        self._loaded = {}
+
+    def load(self, id):
+        """
+        :return: Deferred element, it is retrieved when its get method is called
+        """
+        if id not in self._loaded and id not in self._pending:
+            self._pending.append(id)
+
+        return Deferred(self, id)
+
+    def load_many(self, ids):
+        """
+        :return: list with the elements found, in the same order as the ids
+        """
+        deferred = [self.load(id) for id in ids]
+        return [m for m in (d.get() for d in deferred) if m is not None]
+
+    def get(self, id):
+        if id not in self._loaded:
+            self.dispatch()
+
+        return self._loaded.get(id)
+
+    def prime(self, model):
+        self._loaded[model.id] = model
+
+    def dispatch(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        try:
+            found = {str(m.id): m for m in self._model.by_ids(pending)}
+        except Exception:
+            self._pending = pending + self._pending
+            raise
+
+        for id in pending:
+            self._loaded[id] = found.get(str(id))
+
+
+class AsyncModelLoader(object):
+
+    """
+    Asyncio version of ModelLoader. The ids requested while the event loop is busy are retrieved together
+    on the next iteration of the loop
+
+    Ex:
+       >> loader = resource.loader(People)
+       >> authors = await asyncio.gather(*[loader.load(book.author_id) for book in books])
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self._pending = {}
+        self._loaded = {}
+
+    def load(self, id):
+        """
+        :return: future with the element, None if it doesn't exist
+        """
+        if id in self._loaded:
+            return self._loaded[id]
+
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(lambda: loop.create_task(self.dispatch()))
+
+        self._loaded[id] = self._pending[id] = loop.create_future()
+        return self._loaded[id]
+
+    async def load_many(self, ids):
+        models = await asyncio.gather(*[self.load(id) for id in ids])
+        return [m for m in models if m is not None]
+
+    def prime(self, model):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(model)
+        self._loaded[model.id] = future
+
+    async def dispatch(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            found = {str(m.id): m for m in await self._model.aby_ids(list(pending))}
+        except Exception as e:
+            # failures aren't kept, the next load of the same ids tries again
+            for id, future in pending.items():
+                future.set_exception(e)
+                if self._loaded.get(id) is future:
+                    del self._loaded[id]
+            return
+
+        for id, future in pending.items():
+            future.set_result(found.get(str(id)))
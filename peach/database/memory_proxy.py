@@ -0,0 +1,715 @@
+import re
+import copy
+import uuid
+import bisect
+import datetime
+import threading
+from functools import lru_cache
+from peach.utils import chunks
+from .indexes import Index
+from .proxy import DBProxy, DESCENDING, bulk_result, parse_sort, keyset_condition, attr_condition, collection_name, \
+    id_candidates, order_by_ids
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+def new_id():
+    return ObjectId() if ObjectId else uuid.uuid4().hex
+
+
+def order_key(value):
+    """
+    Comparable key of a value. Values of different types are ordered by type the way MongoDB does
+    (null < numbers < strings < objects < arrays < binary < object ids < booleans < dates)
+    """
+    if value is None:
+        return 1, 0
+
+    if isinstance(value, bool):
+        return 8, value
+
+    if isinstance(value, (int, float)):
+        return 2, value
+
+    if isinstance(value, str):
+        return 3, value
+
+    if isinstance(value, dict):
+        return 4, tuple((k, order_key(v)) for k, v in value.items())
+
+    if isinstance(value, (list, tuple)):
+        return 5, tuple(order_key(v) for v in value)
+
+    if isinstance(value, bytes):
+        return 6, value
+
+    if ObjectId and isinstance(value, ObjectId):
+        return 7, value.binary
+
+    if isinstance(value, datetime.datetime):
+        return 9, value
+
+    return 10, repr(value)
+
+
+def _values(doc, path):
+    """
+    :return: list with the values found at the dotted path, empty if the path doesn't exist
+    """
+    values = [doc]
+
+    for part in path.split('.'):
+        found = []
+
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+
+            elif isinstance(value, list):
+                if part.isdigit():
+                    found.extend(value[int(part):int(part) + 1])
+                else:
+                    found.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+
+        values = found
+
+    return values
+
+
+def _expand(values):
+    # An array matches both as a whole and by any of its elements
+    for value in values:
+        yield value
+
+        if isinstance(value, list):
+            yield from value
+
+
+REGEX_FLAGS = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}
+REGEX_TYPE = type(re.compile(''))
+
+
+@lru_cache(maxsize=256)
+def _compile_regex(pattern, options=''):
+    flags = 0
+    for option in options:
+        flags |= REGEX_FLAGS.get(option, 0)
+
+    return re.compile(pattern, flags)
+
+
+def _regex(pattern, options=''):
+    return pattern if isinstance(pattern, REGEX_TYPE) else _compile_regex(pattern, options)
+
+
+def _regex_prefix(pattern, options=''):
+    """
+    :return: literal prefix of an anchored regex (^abc.*), None if the regex can't be answered with a range
+    """
+    if not isinstance(pattern, str) or not pattern.startswith('^') or 'i' in options or 'x' in options:
+        return None
+
+    prefix = ''
+    for char in pattern[1:]:
+        if char in '*?{':
+            # The last literal is optional or repeated, it isn't part of the prefix
+            prefix = prefix[:-1]
+            break
+
+        if char in '.^$+}[]\\|()':
+            break
+
+        prefix += char
+
+    return prefix or None
+
+
+def _equals(values, value):
+    if isinstance(value, REGEX_TYPE):
+        return any(isinstance(v, str) and value.search(v) for v in _expand(values))
+
+    if value is None and not values:
+        return True
+
+    key = order_key(value)
+    return any(order_key(v) == key for v in _expand(values))
+
+
+def _compare(values, value, test):
+    rank, _ = key = order_key(value)
+    return any(k[0] == rank and test(k, key) for k in (order_key(v) for v in _expand(values)))
+
+
+OPERATORS = {
+    '$eq': lambda values, arg, options: _equals(values, arg),
+    '$ne': lambda values, arg, options: not _equals(values, arg),
+    '$gt': lambda values, arg, options: _compare(values, arg, lambda a, b: a > b),
+    '$gte': lambda values, arg, options: _compare(values, arg, lambda a, b: a >= b),
+    '$lt': lambda values, arg, options: _compare(values, arg, lambda a, b: a < b),
+    '$lte': lambda values, arg, options: _compare(values, arg, lambda a, b: a <= b),
+    '$in': lambda values, arg, options: any(_equals(values, a) for a in arg),
+    '$nin': lambda values, arg, options: not any(_equals(values, a) for a in arg),
+    '$exists': lambda values, arg, options: bool(values) == bool(arg),
+    '$regex': lambda values, arg, options: _equals(values, _regex(arg, options)),
+    '$not': lambda values, arg, options: not _match_values(values, arg),
+    '$size': lambda values, arg, options: any(isinstance(v, list) and len(v) == arg for v in values),
+    '$all': lambda values, arg, options: all(_equals(values, a) for a in arg),
+}
+
+
+def _is_operator_spec(spec):
+    return isinstance(spec, dict) and spec and all(k.startswith('$') for k in spec)
+
+
+def _match_values(values, spec):
+    if not _is_operator_spec(spec):
+        return _equals(values, spec)
+
+    options = spec.get('$options', '')
+
+    for operator, arg in spec.items():
+        if operator == '$options':
+            continue
+
+        if operator not in OPERATORS:
+            raise ValueError("Operator '{}' is not supported".format(operator))
+
+        if not OPERATORS[operator](values, arg, options):
+            return False
+
+    return True
+
+
+def matches(doc, condition):
+    """
+    Checks a document against a MongoDB style condition. Supports equality, comparisons ($eq, $ne, $gt, $gte,
+    $lt, $lte), $in, $nin, $all, $exists, $regex, $not, $size and the $and, $or, $nor logical operators
+    """
+    for key, spec in (condition or {}).items():
+        if key == '$and':
+            matched = all(matches(doc, c) for c in spec)
+
+        elif key == '$or':
+            matched = any(matches(doc, c) for c in spec)
+
+        elif key == '$nor':
+            matched = not any(matches(doc, c) for c in spec)
+
+        elif key.startswith('$'):
+            raise ValueError("Operator '{}' is not supported".format(key))
+
+        else:
+            matched = _match_values(_values(doc, key), spec)
+
+        if not matched:
+            return False
+
+    return True
+
+
+def _index_keys(doc, attr):
+    values = _values(doc, attr)
+    return {order_key(v) for v in _expand(values)} if values else {order_key(None)}
+
+
+class HashIndex(object):
+
+    """
+    Maps every value of the attribute to the ids of the documents that have it. Answers equality and $in
+    """
+
+    def __init__(self, attr):
+        self.attr = attr
+        self._entries = {}
+
+    def add(self, doc_id, doc):
+        for key in _index_keys(doc, self.attr):
+            self._entries.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id, doc):
+        for key in _index_keys(doc, self.attr):
+            ids = self._entries.get(key)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._entries[key]
+
+    def _lookup_value(self, value):
+        if isinstance(value, (REGEX_TYPE, dict)):
+            return None
+
+        return set(self._entries.get(order_key(value), ()))
+
+    def lookup(self, spec):
+        """
+        :return: set with the ids of the candidates, None if the index can't answer the condition
+        """
+        if not _is_operator_spec(spec):
+            return self._lookup_value(spec)
+
+        if list(spec) == ['$eq']:
+            return self._lookup_value(spec['$eq'])
+
+        if list(spec) == ['$in']:
+            candidates = set()
+            for value in spec['$in']:
+                ids = self._lookup_value(value)
+                if ids is None:
+                    return None
+                candidates |= ids
+
+            return candidates
+
+        return None
+
+
+class SortedIndex(object):
+
+    """
+    Keeps the values of the attribute sorted. Answers equality, $in, ranges ($gt, $gte, $lt, $lte) and
+    anchored regex prefixes (^abc)
+    """
+
+    RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+
+    def __init__(self, attr):
+        self.attr = attr
+        self._keys = []
+        self._ids = []
+
+    def add(self, doc_id, doc):
+        for key in _index_keys(doc, self.attr):
+            position = bisect.bisect_right(self._keys, key)
+            self._keys.insert(position, key)
+            self._ids.insert(position, doc_id)
+
+    def remove(self, doc_id, doc):
+        for key in _index_keys(doc, self.attr):
+            start, end = bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key)
+            for position in range(start, end):
+                if self._ids[position] == doc_id:
+                    del self._keys[position]
+                    del self._ids[position]
+                    break
+
+    def _range(self, start, end):
+        return set(self._ids[start:end])
+
+    def _lookup_value(self, value):
+        if isinstance(value, (REGEX_TYPE, dict)):
+            return None
+
+        key = order_key(value)
+        return self._range(bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key))
+
+    def _lookup_range(self, spec):
+        ranks = {order_key(spec[op])[0] for op in spec}
+        if len(ranks) > 1:
+            return set()
+
+        rank = ranks.pop()
+        start, end = bisect.bisect_left(self._keys, (rank,)), bisect.bisect_left(self._keys, (rank + 1,))
+
+        if '$gte' in spec:
+            start = max(start, bisect.bisect_left(self._keys, order_key(spec['$gte'])))
+
+        if '$gt' in spec:
+            start = max(start, bisect.bisect_right(self._keys, order_key(spec['$gt'])))
+
+        if '$lte' in spec:
+            end = min(end, bisect.bisect_right(self._keys, order_key(spec['$lte'])))
+
+        if '$lt' in spec:
+            end = min(end, bisect.bisect_left(self._keys, order_key(spec['$lt'])))
+
+        return self._range(start, end)
+
+    def _lookup_prefix(self, prefix):
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self._range(bisect.bisect_left(self._keys, order_key(prefix)),
+                           bisect.bisect_left(self._keys, order_key(upper)))
+
+    def lookup(self, spec):
+        """
+        :return: set with the ids of the candidates, None if the index can't answer the condition
+        """
+        if not _is_operator_spec(spec):
+            return self._lookup_value(spec)
+
+        if list(spec) == ['$eq']:
+            return self._lookup_value(spec['$eq'])
+
+        if list(spec) == ['$in']:
+            candidates = set()
+            for value in spec['$in']:
+                ids = self._lookup_value(value)
+                if ids is None:
+                    return None
+                candidates |= ids
+
+            return candidates
+
+        if set(spec) <= self.RANGE_OPERATORS:
+            return self._lookup_range(spec)
+
+        if '$regex' in spec and set(spec) <= {'$regex', '$options'}:
+            prefix = _regex_prefix(spec['$regex'], spec.get('$options', ''))
+            return self._lookup_prefix(prefix) if prefix else None
+
+        return None
+
+
+INDEX_TYPES = {
+    'hash': HashIndex,
+    'sorted': SortedIndex
+}
+
+
+def _intersect(candidates, ids):
+    if ids is None:
+        return candidates
+
+    return ids if candidates is None else candidates & ids
+
+
+class MemoryCollection(object):
+
+    def __init__(self):
+        self._docs = {}
+        self._positions = {}
+        self._inserted = 0
+        self._indexes = {}
+        self._specs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def specs(self):
+        return list(self._specs.values())
+
+    def create_index(self, index):
+        """
+        Every attribute of the index gets a sorted index, the lookups intersect them. Text indexes are
+        only recorded, $text queries aren't supported
+        """
+        if not index.is_text:
+            for attr, _ in index.keys:
+                self.ensure_index(attr, 'sorted')
+
+        self._specs[index.name] = index
+
+    def ensure_index(self, attr, index_type='hash'):
+        if (attr, index_type) in self._indexes:
+            return
+
+        with self._lock:
+            index = INDEX_TYPES[index_type](attr)
+            for doc_id, doc in self._docs.items():
+                index.add(doc_id, doc)
+
+            self._indexes[(attr, index_type)] = index
+
+    def _index(self, doc_id, doc):
+        for index in self._indexes.values():
+            index.add(doc_id, doc)
+
+    def _unindex(self, doc_id, doc):
+        for index in self._indexes.values():
+            index.remove(doc_id, doc)
+
+    def insert(self, doc):
+        with self._lock:
+            if doc['_id'] in self._docs:
+                raise DuplicateKeyError("Duplicate key error, _id: {}".format(doc['_id']))
+
+            self._docs[doc['_id']] = doc
+            self._positions[doc['_id']] = self._inserted
+            self._inserted += 1
+            self._index(doc['_id'], doc)
+
+    def replace(self, doc):
+        """
+        :return: tuple (matched, modified)
+        """
+        with self._lock:
+            current = self._docs.get(doc['_id'])
+
+            if current is not None:
+                if current == doc:
+                    return True, False
+
+                self._unindex(doc['_id'], current)
+                self._docs[doc['_id']] = doc
+                self._index(doc['_id'], doc)
+                return True, True
+
+            self.insert(doc)
+            return False, False
+
+    def remove(self, doc_id):
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is not None:
+                del self._positions[doc_id]
+                self._unindex(doc_id, doc)
+
+            return doc is not None
+
+    def get(self, doc_id):
+        return self._docs.get(doc_id)
+
+    def _lookup(self, attr, spec):
+        if attr == '_id' and not _is_operator_spec(spec):
+            return {spec} if spec in self._docs else set()
+
+        candidates = None
+        for (index_attr, _), index in self._indexes.items():
+            if index_attr == attr:
+                candidates = _intersect(candidates, index.lookup(spec))
+
+        return candidates
+
+    def _candidates(self, condition):
+        """
+        :return: set with the ids of the documents that might match the condition according to the indexes,
+                 None if the indexes can't narrow it down
+        """
+        candidates = None
+
+        for key, spec in condition.items():
+            if key == '$and':
+                for clause in spec:
+                    candidates = _intersect(candidates, self._candidates(clause))
+
+            elif key == '$or':
+                branches = [self._candidates(clause) for clause in spec]
+                if all(ids is not None for ids in branches):
+                    candidates = _intersect(candidates, set().union(*branches))
+
+            elif not key.startswith('$'):
+                candidates = _intersect(candidates, self._lookup(key, spec))
+
+        return candidates
+
+    def query(self, condition):
+        """
+        :return: list with the stored documents that match the condition, in insertion order
+        """
+        with self._lock:
+            candidates = self._candidates(condition) if condition else None
+
+            if candidates is None:
+                return [d for d in self._docs.values() if matches(d, condition)]
+
+            candidates = sorted((doc_id for doc_id in candidates if doc_id in self._docs), key=self._positions.get)
+            return [d for d in (self._docs[doc_id] for doc_id in candidates) if matches(d, condition)]
+
+
+class MemoryDatabase(object):
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+
+        if collection is None:
+            with self._lock:
+                collection = self._collections.setdefault(name, MemoryCollection())
+
+        return collection
+
+    def drop_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def collection_names(self):
+        return list(self._collections)
+
+
+# Proxies built with the same name share the database, like the mongo clients do
+databases = {}
+databases_lock = threading.Lock()
+
+
+def get_database(name):
+    with databases_lock:
+        return databases.setdefault(name, MemoryDatabase())
+
+
+def drop_database(name):
+    with databases_lock:
+        databases.pop(name, None)
+
+
+class MemoryDBProxy(DBProxy):
+
+    """
+    In process database that understands the queries peach builds (equality, comparisons, $in, $regex,
+    $and, $or), meant for tests, benchmarks and small read mostly datasets. Documents are kept as dicts,
+    so the proxy has no serialization cost at all.
+
+    Lookups are linear scans unless the model declares secondary indexes. Hash indexes answer equality
+    and $in, sorted indexes answer ranges and anchored regex prefixes too.
+
+    Ex:
+       >> DATABASE = {
+       >>     'proxy': 'peach.database.memory_proxy.MemoryDBProxy',
+       >>     'name': 'PeopleDB'
+       >> }
+
+       >> class People(BaseModel):
+       >>     memory_indexes = [('age', 'sorted'), ('address.city', 'hash')]
+    """
+
+    @classmethod
+    def build(cls, name='default', bulk_batch_size=None, **kwargs):
+        return cls(get_database(name), bulk_batch_size=bulk_batch_size)
+
+    def __init__(self, db, bulk_batch_size=None):
+        self._db = db
+        self._bulk_batch_size = bulk_batch_size or self.BULK_BATCH_SIZE
+
+    def collection(self, model):
+        collection = self._db[collection_name(model)]
+
+        for attr, index_type in getattr(model, 'memory_indexes', None) or []:
+            collection.ensure_index(attr, index_type)
+
+        return collection
+
+    def indexes(self, model):
+        return [Index('_id', name='_id_')] + self.collection(model).specs
+
+    def create_indexes(self, model, indexes):
+        collection = self.collection(model)
+        for index in indexes:
+            collection.create_index(index)
+
+    @staticmethod
+    def _stored(doc):
+        if '_id' not in doc:
+            doc['_id'] = new_id()
+
+        return copy.deepcopy(dict(doc))
+
+    @staticmethod
+    def _copy(doc, fields=None):
+        # Nested values are copied so changes made to the built models don't leak into the stored documents
+        if fields:
+            fields = {f.split('.')[0] for f in fields} | {'_id'}
+
+        return {k: copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+                for k, v in doc.items() if not fields or k in fields}
+
+    @staticmethod
+    def _sort(docs, sort):
+        # Stable sorts applied from the last attribute to the first one
+        for attr, direction in reversed(parse_sort(sort)):
+            descending = direction == DESCENDING
+
+            def key(doc, attr=attr):
+                # Arrays are sorted by their lowest element (highest on descending sorts) like MongoDB does
+                keys = [order_key(v) for value in _values(doc, attr)
+                        for v in (value if isinstance(value, list) and value else [value])] or [order_key(None)]
+                return max(keys) if descending else min(keys)
+
+            docs.sort(key=key, reverse=descending)
+
+        return docs
+
+    def _query(self, model, condition, sort=None, after=None):
+        condition = keyset_condition(condition, sort, after) if after is not None else condition
+        docs = self.collection(model).query(condition)
+        return self._sort(docs, sort) if sort else docs
+
+    @staticmethod
+    def _page(docs, skip=0, limit=0):
+        return docs[skip:skip + limit] if limit else docs[skip:]
+
+    def add(self, model, doc):
+        self.collection(model).insert(self._stored(doc))
+
+    def add_many(self, model, docs, batch_size=None):
+        collection = self.collection(model)
+        results = []
+
+        for batch in chunks(docs, batch_size or self._bulk_batch_size):
+            inserted, errors = 0, []
+
+            for i, doc in enumerate(batch):
+                try:
+                    collection.insert(self._stored(doc))
+                    inserted += 1
+                except DuplicateKeyError as e:
+                    errors.append({'index': i, 'code': 11000, 'errmsg': str(e), 'op': doc})
+
+            results.append(bulk_result(inserted=inserted, errors=errors))
+
+        return results
+
+    def upsert(self, model, *docs, batch_size=None):
+        collection = self.collection(model)
+        results = []
+
+        for batch in chunks(docs, batch_size or self._bulk_batch_size):
+            result = bulk_result()
+
+            for doc in batch:
+                matched, modified = collection.replace(self._stored(doc))
+                result.matched += matched
+                result.modified += modified
+                result.upserted += not matched
+
+            results.append(result)
+
+        return results
+
+    def delete(self, model, *doc_ids, batch_size=None):
+        collection = self.collection(model)
+        return [bulk_result(deleted=sum(collection.remove(doc_id) for doc_id in ids))
+                for ids in chunks(doc_ids, batch_size or self._bulk_batch_size)]
+
+    def count(self, model, condition, skip=0, limit=0, **kwargs):
+        return len(self._page(self.collection(model).query(condition), skip, limit))
+
+    def estimated_count(self, model):
+        return len(self.collection(model))
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        for d in self._page(self._query(model, condition, sort, after), skip, limit):
+            yield model.build(self._copy(d, fields))
+
+    def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        docs = self._query(model, condition, sort, after)
+        total = len(docs) if after is None else self.count(model, condition)
+        return [model.build(self._copy(d, fields)) for d in self._page(docs, skip, limit)], total
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        params = attr_condition(attr, value, exact, model)
+
+        if many:
+            yield from self.find(model, params, skip=skip, limit=limit, sort=sort, fields=fields)
+        else:
+            docs = self.collection(model).query(params)
+            yield model.build(self._copy(docs[0], fields) if docs else None)
+
+    def by_id(self, model, id):
+        doc = self.collection(model).get(id)
+        return model.build(self._copy(doc) if doc is not None else None)
+
+    def by_ids(self, model, ids, fields=None):
+        collection = self.collection(model)
+        docs = [collection.get(id) for id in id_candidates(ids)]
+        return order_by_ids([model.build(self._copy(d, fields)) for d in docs if d is not None], ids)
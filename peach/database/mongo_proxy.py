@@ -1,70 +1,441 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from .proxy import DBProxy
+import threading
+from pymongo import MongoClient, InsertOne, ReplaceOne, DeleteMany, IndexModel, monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from pymongo.errors import BulkWriteError, OperationFailure, ExecutionTimeout
+from bson.son import SON
+from bson.raw_bson import RawBSONDocument
+from peach.utils import chunks
+from .proxy import DBProxy, QueryTimeout, bulk_result, parse_sort, keyset_condition, attr_condition, collection_name
+from .registry import ClientRegistry
+from .indexes import Index
 
 
-class MongoDBProxy(DBProxy):
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+
+    """
+    Keeps track of the connection pool usage of a single MongoClient
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checked-out': 0,
+            'checked-in': 0,
+            'check-out-failed': 0,
+            'cleared': 0,
+        }
+
+    def _incr(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def connection_created(self, event):
+        self._incr('created')
+
+    def connection_closed(self, event):
+        self._incr('closed')
+
+    def connection_checked_out(self, event):
+        self._incr('checked-out')
+
+    def connection_checked_in(self, event):
+        self._incr('checked-in')
+
+    def connection_check_out_failed(self, event):
+        self._incr('check-out-failed')
+
+    def pool_cleared(self, event):
+        self._incr('cleared')
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats['open'] = stats['created'] - stats['closed']
+        stats['in-use'] = stats['checked-out'] - stats['checked-in']
+        return stats
+
+
+def client_factory(client_class):
+    """
+    :param client_class: MongoClient or any class sharing its interface
+    :return: function that creates clients that keep track of their pool usage
+    """
+    def create_client(uri, **options):
+        listener = PoolStatsListener()
+        client = client_class(uri, event_listeners=[listener], **options)
+        client.pool_listener = listener
+        return client
+
+    return create_client
+
+
+client_registry = ClientRegistry(client_factory(MongoClient), closer=lambda client: client.close())
+
+
+class MongoQueries(object):
+
+    """
+    Query building shared by the blocking and the asyncio mongo proxies
+    """
+
+    # Maps the peach pool settings to the MongoClient options. Times are specified in seconds
+    POOL_OPTIONS = {
+        'max_size': ('maxPoolSize', 1),
+        'min_size': ('minPoolSize', 1),
+        'max_idle_time': ('maxIdleTimeMS', 1000),
+        'wait_queue_timeout': ('waitQueueTimeoutMS', 1000),
+    }
 
     @classmethod
-    def build(cls, uri, name, **kwargs):
-        return MongoDBProxy(MongoClient(uri)[name])
+    def client_options(cls, pool=None):
+        options = {}
+
+        for name, value in (pool or {}).items():
+            if name not in cls.POOL_OPTIONS:
+                raise Exception("Unsupported pool option '{}'".format(name))
+
+            option, multiplier = cls.POOL_OPTIONS[name]
+            options[option] = int(value * multiplier) if value is not None else None
+
+        return options
+
+    @staticmethod
+    def pool_stats_of(registry):
+        stats = []
+
+        for client, client_stats in registry.clients():
+            client_stats['pool'] = client.pool_listener.stats()
+            stats.append(client_stats)
 
-    def __init__(self, db):
-        self._db = db
+        return stats
+
+    @staticmethod
+    def _sort_expr(sort):
+        return parse_sort(sort)
 
     def _apply_sort(self, result, sort):
-        sort_expr = []
-        for sort_attr in sort:
-            direction = ASCENDING
+        return result.sort(self._sort_expr(sort))
+
+    def _keyset_condition(self, condition, sort, after):
+        return keyset_condition(condition, sort, after)
+
+    @staticmethod
+    def _projection(fields):
+        return {f: True for f in fields} if fields else None
+
+    def _find_with_count_pipeline(self, condition, skip=0, limit=0, sort=None, fields=None):
+        """
+        Matching, sorting and projecting happen before the $facet, where they can use the indexes (the facet
+        sub-pipelines can't), so only the skipping and limiting of the page is left inside it. Keyset pages
+        (after) don't use it, see find_with_count
+        """
+        pipeline = [{'$match': condition or {}}]
+
+        if sort:
+            pipeline.append({'$sort': SON(self._sort_expr(sort))})
+
+        if fields:
+            pipeline.append({'$project': self._projection(fields)})
+
+        page_stages = [{'$skip': skip or 0}]
+
+        if limit:
+            page_stages.append({'$limit': limit})
+
+        pipeline.append({'$facet': {
+            'data': page_stages,
+            'total': [{'$count': 'count'}]
+        }})
+
+        return pipeline
+
+    READ_PREFERENCES = {
+        'primary': Primary,
+        'primaryPreferred': PrimaryPreferred,
+        'secondary': Secondary,
+        'secondaryPreferred': SecondaryPreferred,
+        'nearest': Nearest
+    }
+
+    @classmethod
+    def read_options(cls, preference=None, max_staleness=None, tags=None, concern=None):
+        """
+        Translates the read settings of an endpoint or a model into the collection options
+
+        :param preference: primary, primaryPreferred, secondary, secondaryPreferred or nearest
+        :param max_staleness: max seconds a secondary can lag behind the primary to be read from
+        :param tags: replica set tag sets of the members to read from
+        :param concern: read concern level (local, available, majority, linearizable, snapshot)
+        :return: dict with the options for Collection.with_options
+        """
+        options = {}
+
+        if preference:
+            if preference not in cls.READ_PREFERENCES:
+                raise ValueError("Unknown read preference '{}'".format(preference))
+
+            preference_options = {}
+            if tags:
+                preference_options['tag_sets'] = tags
+            if max_staleness:
+                preference_options['max_staleness'] = max_staleness
 
-            if sort_attr.startswith('>'):
-                sort_attr = sort_attr[1:]
+            options['read_preference'] = cls.READ_PREFERENCES[preference](**preference_options)
 
-            elif sort_attr.startswith('<'):
-                sort_attr = sort_attr[1:]
-                direction = DESCENDING
+        if concern:
+            options['read_concern'] = ReadConcern(concern)
 
-            sort_expr.append((sort_attr, direction))
+        return options
 
-        return result.sort(sort_expr)
+    def _init_db(self, db, client_source=None, bulk_batch_size=None):
+        """
+        :param db: database the proxy works with, None when it comes from a client registry
+        :param client_source: tuple (registry, uri, client options, database name) of the proxies built from a uri
+        """
+        self._database = db
+        self._client_source = client_source
+        self._bulk_batch_size = bulk_batch_size or self.BULK_BATCH_SIZE
+        self._readers = {}
+
+    @property
+    def _db(self):
+        """
+        Proxies built from a uri get their client from the registry on every operation, so the registry knows
+        the client is in use and a client that was evicted, or created before a fork, is replaced by a new one
+        """
+        if self._client_source is None:
+            return self._database
+
+        registry, uri, options, name = self._client_source
+        client = registry.get(uri, **options)
+
+        if self._database is None or self._database.client is not client:
+            self._database = client[name]
+            self._readers = {}
+
+        return self._database
+
+    def _reader(self, model, read=None):
+        """
+        Models with raw_reads (see peach.models.LazyModel) get RawBSONDocuments, which are only decoded when
+        their fields are accessed, instead of dicts
+
+        :param read: read settings (see read_options), the ones of the model (read_options attribute) if not given
+        :return: collection to read the model from. Writes always use the collection as it was configured
+        """
+        db = self._db
+        read = read or getattr(model, 'read_options', None)
+        raw = getattr(model, 'raw_reads', False)
+        if not read and not raw:
+            return db[collection_name(model)]
+
+        key = (collection_name(model), repr(sorted(read.items())) if read else None, raw)
+        if key not in self._readers:
+            collection = db[collection_name(model)]
+            options = self.read_options(**read) if read else {}
+            if raw:
+                options['codec_options'] = collection.codec_options.with_options(document_class=RawBSONDocument)
+
+            self._readers[key] = collection.with_options(**options)
+
+        return self._readers[key]
+
+    # Query options named as the aggregate and count commands expect them
+    COMMAND_OPTIONS = {
+        'max_time_ms': 'maxTimeMS',
+        'batch_size': 'batchSize'
+    }
+
+    @classmethod
+    def _aggregate_options(cls, options):
+        return {cls.COMMAND_OPTIONS.get(k, k): v for k, v in options.items() if k != 'read'}
+
+    @classmethod
+    def _count_options(cls, options):
+        return {cls.COMMAND_OPTIONS.get(k, k): v for k, v in options.items() if k not in ('batch_size', 'read')}
+
+    @staticmethod
+    def _query_timeout(error):
+        return QueryTimeout("The query exceeded its time limit: {}".format(error))
+
+    @staticmethod
+    def _find_with_count_result(model, result):
+        total = result['total'][0]['count'] if result['total'] else 0
+        return [model.build(d) for d in result['data']], total
+
+    @staticmethod
+    def _attr_condition(attr, value, exact, model=None):
+        return attr_condition(attr, value, exact, model)
 
     def collection(self, model):
-        collection_name = model.collection_name or model.__class__.__name__.lower() + 's'
-        return self._db[collection_name]
+        return self._db[collection_name(model)]
+
+    def _add_many_batches(self, docs, batch_size=None):
+        return chunks((InsertOne(d) for d in docs), batch_size or self._bulk_batch_size)
+
+    def _upsert_batches(self, docs, batch_size=None):
+        return chunks((ReplaceOne({'_id': d.id}, d, upsert=True) for d in docs), batch_size or self._bulk_batch_size)
+
+    def _delete_batches(self, doc_ids, batch_size=None):
+        return ([DeleteMany({'_id': {'$in': ids}})] for ids in chunks(doc_ids, batch_size or self._bulk_batch_size))
+
+    @staticmethod
+    def _bulk_result(result):
+        return bulk_result(inserted=result.inserted_count,
+                           matched=result.matched_count,
+                           modified=result.modified_count,
+                           upserted=result.upserted_count,
+                           deleted=result.deleted_count)
+
+    @staticmethod
+    def _bulk_error_result(error):
+        # Unordered writes keep going after a failure, so report what was done along with the errors
+        return bulk_result(inserted=error.details.get('nInserted', 0),
+                           matched=error.details.get('nMatched', 0),
+                           modified=error.details.get('nModified', 0),
+                           upserted=error.details.get('nUpserted', 0),
+                           deleted=error.details.get('nRemoved', 0),
+                           errors=error.details.get('writeErrors'))
+
+
+class MongoDBProxy(MongoQueries, DBProxy):
+
+    @classmethod
+    def build(cls, uri, name, pool=None, bulk_batch_size=None, **kwargs):
+        """
+        Builds a proxy for the given database. The underlying MongoClient is shared with every other proxy
+        that uses the same uri and pool settings.
+
+        :param uri: mongodb connection string
+        :param name: database name
+        :param pool: dict with the pool settings (max_size, min_size, max_idle_time, wait_queue_timeout)
+        :param bulk_batch_size: max amount of operations sent on each bulk write
+        :return: MongoDBProxy
+        """
+        return cls(None, (client_registry, uri, cls.client_options(pool), name), bulk_batch_size=bulk_batch_size)
+
+    @classmethod
+    def pool_stats(cls):
+        """
+        :return: list with the registry and connection pool stats of every shared client
+        """
+        return cls.pool_stats_of(client_registry)
+
+    def __init__(self, db, client_source=None, bulk_batch_size=None):
+        self._init_db(db, client_source, bulk_batch_size)
 
     def add(self, model, doc):
         self.collection(model).insert_one(doc)
 
-    def upsert(self, model, *docs):
-        for d in docs:
-            self.collection(model).replace_one({'_id': d.id}, d, upsert=True)
+    def _bulk_write(self, model, batches):
+        results = []
+
+        for batch in batches:
+            try:
+                results.append(self._bulk_result(self.collection(model).bulk_write(batch, ordered=False)))
+            except BulkWriteError as e:
+                results.append(self._bulk_error_result(e))
+
+        return results
+
+    def add_many(self, model, docs, batch_size=None):
+        return self._bulk_write(model, self._add_many_batches(docs, batch_size))
 
-    def delete(self, model, *doc_ids):
-        for did in doc_ids:
-            self.collection(model).delete_one(model, {'_id': did})
+    def upsert(self, model, *docs, batch_size=None):
+        return self._bulk_write(model, self._upsert_batches(docs, batch_size))
+
+    def delete(self, model, *doc_ids, batch_size=None):
+        return self._bulk_write(model, self._delete_batches(doc_ids, batch_size))
 
     def count(self, model, condition, **kwargs):
-        return self.collection(model).find(condition or {}, **kwargs).count()
+        try:
+            reader = self._reader(model, kwargs.get('read'))
+            return reader.count_documents(condition or {}, **self._count_options(kwargs))
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+
+    def estimated_count(self, model):
+        return self._reader(model).estimated_document_count()
 
-    def find(self, model, condition, skip=0, limit=0, sort=None, **kwargs):
-        result = self.collection(model).find(condition, skip=skip, limit=limit, **kwargs)
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        condition = self._keyset_condition(condition, sort, after) if after is not None else condition
+        read = kwargs.pop('read', None)
+        result = self._reader(model, read).find(condition,
+                                                projection=self._projection(fields),
+                                                skip=skip,
+                                                limit=limit,
+                                                **kwargs)
         result = self._apply_sort(result, sort) if sort else result
 
-        for d in result:
-            yield model.build(d)
+        try:
+            for d in result:
+                yield model.build(d)
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+
+    def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        """
+        Gets the page and the total count in a single round trip using a $facet aggregation. The whole page
+        comes back in one document, so it is bound to the 16MB document size limit.
 
-    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None):
-        if exact or type(value) is not str:
-            params = {attr: value}
-        else:
-            params = {attr: {"$regex": '.*?{}.*?'.format(value), "$options": 'si'}}
+        Keyset pages are retrieved with a find and a count instead, the range condition of the page can only use
+        the indexes outside the facet, where it would also restrict the count. So are the pages whose aggregation
+        fails: the limit isn't merged into the sort, which can go over the sort memory limit without an index, and
+        big pages can go over the document size limit
+        """
+        if after is not None:
+            return super().find_with_count(model, condition, skip, limit, sort, after, fields, **kwargs)
+
+        pipeline = self._find_with_count_pipeline(condition, skip, limit, sort, fields)
+
+        try:
+            reader = self._reader(model, kwargs.get('read'))
+            result = next(reader.aggregate(pipeline, **self._aggregate_options(kwargs)))
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+        except OperationFailure:
+            return super().find_with_count(model, condition, skip, limit, sort, after, fields, **kwargs)
+
+        return self._find_with_count_result(model, result)
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        params = self._attr_condition(attr, value, exact, model)
 
         if many:
-            for d in self.find(model, params, skip=skip, limit=limit, sort=sort):
-                yield model.build(d)
+            yield from self.find(model, params, skip=skip, limit=limit, sort=sort, fields=fields)
         else:
-            yield model.build(self.collection(model).find_one(params))
+            yield model.build(self._reader(model).find_one(params, projection=self._projection(fields)))
 
     def by_id(self, model, id):
         return next(self.by_attr(model, '_id', id, many=False))
 
+    def indexes(self, model):
+        return [Index.from_info(name, info) for name, info in self.collection(model).index_information().items()]
+
+    def index_usage(self, model):
+        """
+        Usage stats come from $indexStats, they are reset every time the server restarts
+        """
+        try:
+            return {s['name']: s['accesses']['ops'] for s in self.collection(model).aggregate([{'$indexStats': {}}])}
+        except OperationFailure:
+            return None
 
+    def create_indexes(self, model, indexes):
+        self.collection(model).create_indexes([IndexModel(i.keys, name=i.name, **i.options) for i in indexes])
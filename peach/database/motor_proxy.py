@@ -0,0 +1,115 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, ExecutionTimeout, OperationFailure
+from .proxy import AsyncDBProxy
+from .registry import ClientRegistry
+from .mongo_proxy import MongoQueries, client_factory
+
+
+# Motor clients are kept apart from the blocking ones, they have their own pools
+client_registry = ClientRegistry(client_factory(AsyncIOMotorClient), closer=lambda client: client.close())
+
+
+class MotorDBProxy(MongoQueries, AsyncDBProxy):
+
+    """
+    MongoDB proxy for asyncio applications built on top of motor. It accepts the same database
+    configuration as MongoDBProxy
+
+    Ex:
+       >> DATABASE = {
+       >>     'proxy': 'peach.database.mongo_proxy.MongoDBProxy',
+       >>     'async_proxy': 'peach.database.motor_proxy.MotorDBProxy',
+       >>     'uri': 'mongodb://localhost:27017/',
+       >>     'name': 'PeopleDB'
+       >> }
+    """
+
+    @classmethod
+    def build(cls, uri, name, pool=None, bulk_batch_size=None, **kwargs):
+        return cls(None, (client_registry, uri, cls.client_options(pool), name), bulk_batch_size=bulk_batch_size)
+
+    @classmethod
+    def pool_stats(cls):
+        return cls.pool_stats_of(client_registry)
+
+    def __init__(self, db, client_source=None, bulk_batch_size=None):
+        self._init_db(db, client_source, bulk_batch_size)
+
+    async def add(self, model, doc):
+        await self.collection(model).insert_one(doc)
+
+    async def _bulk_write(self, model, batches):
+        results = []
+
+        for batch in batches:
+            try:
+                results.append(self._bulk_result(await self.collection(model).bulk_write(batch, ordered=False)))
+            except BulkWriteError as e:
+                results.append(self._bulk_error_result(e))
+
+        return results
+
+    async def add_many(self, model, docs, batch_size=None):
+        return await self._bulk_write(model, self._add_many_batches(docs, batch_size))
+
+    async def upsert(self, model, *docs, batch_size=None):
+        return await self._bulk_write(model, self._upsert_batches(docs, batch_size))
+
+    async def delete(self, model, *doc_ids, batch_size=None):
+        return await self._bulk_write(model, self._delete_batches(doc_ids, batch_size))
+
+    async def count(self, model, condition, **kwargs):
+        try:
+            reader = self._reader(model, kwargs.get('read'))
+            return await reader.count_documents(condition or {}, **self._count_options(kwargs))
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+
+    async def estimated_count(self, model):
+        return await self._reader(model).estimated_document_count()
+
+    async def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        condition = self._keyset_condition(condition, sort, after) if after is not None else condition
+        read = kwargs.pop('read', None)
+        result = self._reader(model, read).find(condition,
+                                                projection=self._projection(fields),
+                                                skip=skip,
+                                                limit=limit,
+                                                **kwargs)
+        result = self._apply_sort(result, sort) if sort else result
+
+        try:
+            async for d in result:
+                yield model.build(d)
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+
+    async def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        if after is not None:
+            return await super().find_with_count(model, condition, skip, limit, sort, after, fields, **kwargs)
+
+        pipeline = self._find_with_count_pipeline(condition, skip, limit, sort, fields)
+        try:
+            reader = self._reader(model, kwargs.get('read'))
+            cursor = reader.aggregate(pipeline, **self._aggregate_options(kwargs))
+            result = await cursor.to_list(length=1)
+        except ExecutionTimeout as e:
+            raise self._query_timeout(e)
+        except OperationFailure:
+            # see MongoDBProxy.find_with_count
+            return await super().find_with_count(model, condition, skip, limit, sort, after, fields, **kwargs)
+
+        return self._find_with_count_result(model, result[0])
+
+    async def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        params = self._attr_condition(attr, value, exact, model)
+
+        if many:
+            async for d in self.find(model, params, skip=skip, limit=limit, sort=sort, fields=fields):
+                yield d
+        else:
+            yield model.build(await self._reader(model).find_one(params, projection=self._projection(fields)))
+
+    async def by_id(self, model, id):
+        async for d in self.by_attr(model, '_id', id, many=False):
+            return d
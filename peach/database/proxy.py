@@ -1,13 +1,182 @@
-from peach.utils import load_resource_class
+from peach.utils import load_resource_class, ObjectDict
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
 
 
 def load_db_proxy(db_conf):
+    """
+    :return: the proxy defined in the database config, wrapped by an InstrumentedDBProxy when there's an
+             'instrumentation' entry and by a CachedDBProxy when there's a 'cache' entry
+    """
     db_proxy_class = load_resource_class(db_conf['proxy'])
-    return db_proxy_class.build(**db_conf)
+    db_proxy = db_proxy_class.build(**db_conf)
+
+    if db_conf.get('instrumentation'):
+        from .instrumentation import InstrumentedDBProxy
+        db_proxy = InstrumentedDBProxy.build(db_proxy, db_conf)
+
+    if db_conf.get('cache'):
+        from .cache_proxy import CachedDBProxy
+        db_proxy = CachedDBProxy.build(db_proxy, db_conf)
+
+    return db_proxy
+
+
+def load_async_db_proxy(db_conf):
+    """
+    :return: the asyncio proxy defined as 'async_proxy' in the database config, None if there's none
+    """
+    if not db_conf.get('async_proxy'):
+        return None
+
+    db_proxy_class = load_resource_class(db_conf['async_proxy'])
+    db_proxy = db_proxy_class.build(**db_conf)
+
+    if db_conf.get('instrumentation'):
+        from .instrumentation import AsyncInstrumentedDBProxy
+        db_proxy = AsyncInstrumentedDBProxy.build(db_proxy, db_conf)
+
+    return db_proxy
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+ASCENDING = 1
+DESCENDING = -1
+
+
+def parse_sort(sort):
+    """
+    :param sort: list of attributes, prefixed with < (descending) or > (ascending)
+    :return: list of (attribute, direction) tuples
+    """
+    sort_expr = []
+    for sort_attr in sort or []:
+        direction = ASCENDING
+
+        if sort_attr.startswith('>'):
+            sort_attr = sort_attr[1:]
+
+        elif sort_attr.startswith('<'):
+            sort_attr = sort_attr[1:]
+            direction = DESCENDING
+
+        sort_expr.append((sort_attr, direction))
+
+    return sort_expr
+
+
+def keyset_condition(condition, sort, after):
+    """
+    Builds the range condition that matches the elements placed after the given sort values. For a
+    sort (a, b) and values (x, y) it matches: a > x OR (a == x AND b > y)
+
+    Null (or missing) values sort before any other, and range operators never match them, so they are
+    handled apart: after a null every non null value comes when ascending and none when descending, and
+    nulls come after any value when descending
+    """
+    sort_expr = parse_sort(sort)
+    if len(sort_expr) != len(after):
+        raise ValueError("Keyset values don't match the sort attributes")
+
+    keyset = []
+    for i, (attr, direction) in enumerate(sort_expr):
+        ties = {prev_attr: after[j] for j, (prev_attr, _) in enumerate(sort_expr[:i])}
+        value = after[i]
+
+        if direction == ASCENDING:
+            keyset.append(dict(ties, **{attr: {'$ne': None} if value is None else {'$gt': value}}))
+
+        elif value is not None:
+            keyset.append(dict(ties, **{attr: {'$lt': value}}))
+            keyset.append(dict(ties, **{attr: None}))
+
+    keyset = {'$or': keyset}
+
+    return {'$and': [condition, keyset]} if condition else keyset
+
+
+def attr_condition(attr, value, exact, model=None):
+    """
+    :param model: when not exact, the search strategy declared by the model for the attribute is used
+                  (see BaseModel.searches), otherwise it matches the attributes containing the value
+    """
+    if exact or type(value) is not str:
+        return {attr: value}
+
+    for search in getattr(model, 'searches', None) or []:
+        if search.covers(attr):
+            return search.condition(value, attrs=[attr])
+
+    return {attr: {"$regex": '.*?{}.*?'.format(value), "$options": 'si'}}
+
+
+def id_candidates(ids):
+    """
+    Ids coming from urls are strings while the stored ones are usually ObjectIds, so the ids that are valid
+    ObjectIds are looked up both ways
+    """
+    candidates = []
+    for id in ids:
+        candidates.append(id)
+
+        if ObjectId and isinstance(id, str) and ObjectId.is_valid(id):
+            candidates.append(ObjectId(id))
+
+    return candidates
+
+
+def order_by_ids(models, ids):
+    """
+    :return: the models sorted as the given ids, duplicated and missing ones are left out
+    """
+    by_id = {str(m.id): m for m in models if m is not None}
+    ordered = []
+
+    for id in ids:
+        model = by_id.pop(str(id), None)
+        if model is not None:
+            ordered.append(model)
+
+    return ordered
+
+
+def count_options(options):
+    """
+    :param options: query options (see DBProxy.find)
+    :return: the ones that apply to counting
+    """
+    return {k: v for k, v in options.items() if k in ('max_time_ms', 'read')}
+
+
+def collection_name(model):
+    model_class = model if isinstance(model, type) else model.__class__
+    return getattr(model_class, 'collection_name', None) or model_class.__name__.lower() + 's'
+
+
+def bulk_result(inserted=0, matched=0, modified=0, upserted=0, deleted=0, errors=None):
+    return ObjectDict(inserted=inserted,
+                      matched=matched,
+                      modified=modified,
+                      upserted=upserted,
+                      deleted=deleted,
+                      errors=errors or [])
 
 
 class DBProxy(object):
 
+    """
+    Bulk operations (add_many, upsert and delete) send the documents in batches of batch_size and return
+    a list with one result per batch (see bulk_result)
+    """
+
+    BULK_BATCH_SIZE = 1000
+
     @classmethod
     def build(cls, **kwargs):
         raise NotImplementedError
@@ -15,20 +184,132 @@ class DBProxy(object):
     def add(self, model, doc):
         raise NotImplementedError
 
-    def upsert(self, model, *docs):
+    def add_many(self, model, docs, batch_size=None):
         raise NotImplementedError
 
-    def delete(self, model, *doc_ids):
+    def upsert(self, model, *docs, batch_size=None):
+        raise NotImplementedError
+
+    def delete(self, model, *doc_ids, batch_size=None):
         raise NotImplementedError
 
     def count(self, model, condition, **kwargs):
         raise NotImplementedError
 
-    def find(self, model, condition, skip=0, limit=0, sort=None, **kwargs):
+    def estimated_count(self, model):
+        """
+        :return: approximate amount of elements of the whole collection, proxies with a faster way
+                 of getting it than counting should override it
+        """
+        return self.count(model, None)
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        """
+        :param after: values of the sort attributes of the last element from the previous page (keyset pagination).
+                      When given, only the elements placed after it are retrieved
+        :param fields: attributes to retrieve from every element (besides the id), all of them if not specified
+        :param kwargs: query options, proxies should understand max_time_ms (raising QueryTimeout when the query
+                       takes longer) and batch_size (amount of elements retrieved per round trip)
+        """
         raise NotImplementedError
 
-    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None):
+    def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        """
+        Retrieves a page of elements along with the total amount of elements that satisfy the condition.
+        Proxies able to do it in a single query should override it
+
+        :return: tuple (list of elements, total count)
+        """
+        data = list(self.find(model, condition, skip=skip, limit=limit, sort=sort, after=after, fields=fields, **kwargs))
+        return data, self.count(model, condition, **count_options(kwargs))
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
         raise NotImplementedError
 
     def by_id(self, model, id):
         raise NotImplementedError
+
+    def by_ids(self, model, ids, fields=None):
+        """
+        Gets several elements with a single query
+
+        :return: list with the elements found, in the same order as the ids
+        """
+        condition = {'_id': {'$in': id_candidates(ids)}}
+        return order_by_ids(self.find(model, condition, fields=fields), ids)
+
+    def indexes(self, model):
+        """
+        :return: list with the indexes (peach.database.indexes.Index) the collection of the model has
+        """
+        raise NotImplementedError
+
+    def index_usage(self, model):
+        """
+        :return: dict {index name: amount of times used}, None if the database doesn't keep track of it
+        """
+        return None
+
+    def create_indexes(self, model, indexes):
+        raise NotImplementedError
+
+
+class AsyncDBProxy(object):
+
+    """
+    Same contract as DBProxy for asyncio drivers, every operation is a coroutine except find and by_attr
+    which are async generators
+
+    Ex:
+       >> async for person in db.find(People, {'age': 22}):
+       >>     ...
+       >> total = await db.count(People, {'age': 22})
+    """
+
+    BULK_BATCH_SIZE = DBProxy.BULK_BATCH_SIZE
+
+    @classmethod
+    def build(cls, **kwargs):
+        raise NotImplementedError
+
+    async def add(self, model, doc):
+        raise NotImplementedError
+
+    async def add_many(self, model, docs, batch_size=None):
+        raise NotImplementedError
+
+    async def upsert(self, model, *docs, batch_size=None):
+        raise NotImplementedError
+
+    async def delete(self, model, *doc_ids, batch_size=None):
+        raise NotImplementedError
+
+    async def count(self, model, condition, **kwargs):
+        raise NotImplementedError
+
+    async def estimated_count(self, model):
+        return await self.count(model, None)
+
+    def find(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        raise NotImplementedError
+
+    async def find_with_count(self, model, condition, skip=0, limit=0, sort=None, after=None, fields=None, **kwargs):
+        data = [d async for d in self.find(model,
+                                           condition,
+                                           skip=skip,
+                                           limit=limit,
+                                           sort=sort,
+                                           after=after,
+                                           fields=fields,
+                                           **kwargs)]
+        return data, await self.count(model, condition, **count_options(kwargs))
+
+    def by_attr(self, model, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        raise NotImplementedError
+
+    async def by_id(self, model, id):
+        raise NotImplementedError
+
+    async def by_ids(self, model, ids, fields=None):
+        condition = {'_id': {'$in': id_candidates(ids)}}
+        return order_by_ids([d async for d in self.find(model, condition, fields=fields)], ids)
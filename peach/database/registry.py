@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+
+class ClientRegistry(object):
+
+    """
+    Process wide registry of database clients keyed by uri and client options, so every proxy pointing
+    to the same server shares one client (and thus one connection pool).
+
+    Clients are dropped and lazily re created when the registry detects it is running in a different
+    process than the one that created them, which makes it safe to use in pre-fork servers (gunicorn, uwsgi)
+    where the app is loaded in the master before forking the workers.
+
+    Ex:
+       >> registry = ClientRegistry(MongoClient)
+       >> client = registry.get('mongodb://localhost:27017/', maxPoolSize=50)
+       >> client is registry.get('mongodb://localhost:27017/', maxPoolSize=50)
+       True
+    """
+
+    def __init__(self, factory, closer=None):
+        self._factory = factory
+        self._closer = closer
+        self._clients = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _key(uri, options):
+        return uri, tuple(sorted((k, repr(v)) for k, v in options.items()))
+
+    def _check_fork(self):
+        # Clients (and their pools, sockets and monitor threads) must never be shared with the parent
+        # process, we just forget about them and let the new process create its own
+        if self._pid != os.getpid():
+            self._clients = {}
+            self._stats = {}
+            self._pid = os.getpid()
+
+    def get(self, uri, **options):
+        """
+        Proxies built from a uri call it on every operation (see MongoQueries._db), so the stats tell when
+        each client was last used
+        """
+        key = self._key(uri, options)
+
+        with self._lock:
+            self._check_fork()
+
+            if key not in self._clients:
+                self._clients[key] = self._factory(uri, **options)
+                self._stats[key] = {'uri': uri, 'options': options, 'created': time.time(), 'acquired': 0}
+
+            self._stats[key]['acquired'] += 1
+            self._stats[key]['last-acquired'] = time.time()
+
+            return self._clients[key]
+
+    def evict_idle(self, max_idle_seconds):
+        """
+        Closes and removes the clients that haven't been requested in the last max_idle_seconds. Proxies
+        still pointing to them get a new client on their next operation
+
+        :param max_idle_seconds: idle time after which a client is considered unused
+        :return: number of evicted clients
+        """
+        now = time.time()
+
+        with self._lock:
+            self._check_fork()
+            idle = [k for k, s in self._stats.items() if now - s['last-acquired'] > max_idle_seconds]
+
+            for key in idle:
+                self._close(self._clients.pop(key))
+                self._stats.pop(key)
+
+        return len(idle)
+
+    def _close(self, client):
+        if self._closer:
+            self._closer(client)
+
+    def clear(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for client in self._clients.values():
+                    self._close(client)
+
+            self._clients = {}
+            self._stats = {}
+            self._pid = os.getpid()
+
+    def stats(self):
+        with self._lock:
+            self._check_fork()
+            return [dict(s) for s in self._stats.values()]
+
+    def clients(self):
+        """
+        :return: list of (client, stats) tuples for every registered client
+        """
+        with self._lock:
+            self._check_fork()
+            return [(self._clients[k], dict(s)) for k, s in self._stats.items()]
+
+    def __len__(self):
+        return len(self._clients)
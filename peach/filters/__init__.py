@@ -1,29 +1,35 @@
-
-
 class BaseFilter(object):
 
     name = None
     value_type = None
     allow_multiple = None
 
+    # Indexes the condition relies on (see peach.database.indexes.Index)
+    indexes = []
+
+    # Keyword arguments that define how to query the data instead of being part of the condition
+    QUERY_PARAMS = ('sort', 'skip', 'limit', 'after', 'fields', 'max_time_ms', 'batch_size', 'read')
+
     @classmethod
     def condition(cls, *args, **kwargs):
         raise NotImplementedError()
 
     @classmethod
-    def apply(cls, model, *args, **kwargs):
-        sort = kwargs.pop('sort', None)
-        skip = kwargs.pop('skip', None)
-        limit = kwargs.pop('limit', None)
+    def _pop_query_params(cls, kwargs):
+        return {k: kwargs.pop(k) for k in cls.QUERY_PARAMS if k in kwargs}
 
-        return model.find(cls.condition(*args, **kwargs), skip=skip, limit=limit, sort=sort)
+    @classmethod
+    def apply(cls, model, *args, **kwargs):
+        query_params = cls._pop_query_params(kwargs)
+        return model.find(cls.condition(*args, **kwargs), **query_params)
 
     @classmethod
     def count(cls, model, *args, **kwargs):
-        kwargs.pop('sort', None)
-        kwargs.pop('skip', None)
-        kwargs.pop('limit', None)
-        return model.count(cls.condition(*args, **kwargs))
-
-
+        query_params = cls._pop_query_params(kwargs)
+        options = {k: query_params[k] for k in ('max_time_ms', 'read') if k in query_params}
+        return model.count(cls.condition(*args, **kwargs), **options)
 
+    @classmethod
+    def apply_with_count(cls, model, *args, **kwargs):
+        query_params = cls._pop_query_params(kwargs)
+        return model.find_with_count(cls.condition(*args, **kwargs), **query_params)
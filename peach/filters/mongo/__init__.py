@@ -1,4 +1,6 @@
 from peach.filters import BaseFilter
+from peach.filters.search import SearchFilter, RegexSearch
+from peach.database.indexes import Index
 from datetime import datetime
 
 
@@ -7,6 +9,7 @@ class DateFilter(BaseFilter):
     name = 'date'
     value_type = datetime
     allow_multiple = False
+    indexes = [Index('date')]
 
     @classmethod
     def condition(cls, date_value, **kwargs):
@@ -18,23 +21,21 @@ class DateRangeFilter(BaseFilter):
     name = 'date_range'
     value_type = datetime
     allow_multiple = True
+    indexes = [Index('date')]
 
     @classmethod
     def condition(cls, from_date, to_date, **kwargs):
         return {'date': {"$gte": from_date, "$lte": to_date}}
 
 
-class NameFilter(BaseFilter):
+class NameFilter(SearchFilter):
+
+    """
+    Searches the names containing any of the given values. It scans the whole collection, subclasses can
+    use an indexed search strategy instead (see peach.filters.search)
+    """
 
     name = 'name'
     value_type = str
     allow_multiple = True
-
-    @classmethod
-    def condition(cls, *names):
-        return {
-            'name': {
-                "$regex": ".*?{}.*?".format('|'.join(names)),
-                "$options": 'si'
-            }
-        }
+    search = RegexSearch('name')
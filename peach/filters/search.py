@@ -0,0 +1,205 @@
+import re
+import unicodedata
+from peach.filters import BaseFilter
+from peach.database.indexes import Index
+
+
+def normalize(value):
+    """
+    Lower case version of the text without accents and with single spaces
+    """
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.lower().split())
+
+
+class SearchStrategy(object):
+
+    """
+    Way of searching text attributes. A strategy builds the condition for the searched terms, declares
+    the indexes it needs and, when it relies on extra attributes, fills them before the documents are written
+    (see BaseModel.searches)
+    """
+
+    def __init__(self, *attrs):
+        self.attrs = attrs
+
+    @property
+    def indexes(self):
+        return []
+
+    def covers(self, attr):
+        return attr in self.attrs
+
+    def prepare(self, doc):
+        """
+        Sets the attributes the strategy relies on
+        """
+        return doc
+
+    def term_condition(self, attr, term):
+        raise NotImplementedError
+
+    def condition(self, *terms, attrs=None):
+        """
+        :param terms: searched terms, matching any of them is enough
+        :param attrs: attributes to search, all of the strategy ones if not specified
+        """
+        clauses = [self.term_condition(attr, term) for term in terms for attr in attrs or self.attrs]
+        return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+class RegexSearch(SearchStrategy):
+
+    """
+    Case insensitive match anywhere in the attribute. No index can help it, every search scans the collection
+    """
+
+    def term_condition(self, attr, term):
+        return {attr: {'$regex': '.*?{}.*?'.format(term), '$options': 'si'}}
+
+
+class TextSearch(SearchStrategy):
+
+    """
+    Uses a MongoDB text index, which matches whole words (stemmed by language). A collection can only have
+    one text index, so a single TextSearch should be defined per model
+    """
+
+    def __init__(self, *attrs, weights=None, language=None):
+        super().__init__(*attrs)
+        self.weights = weights
+        self.language = language
+
+    @property
+    def indexes(self):
+        options = {'default_language': self.language} if self.language else {}
+        return [Index.text(*self.attrs, weights=self.weights, **options)]
+
+    def condition(self, *terms, attrs=None):
+        """
+        :param attrs: the text index always searches all of its attributes, only those can be given
+        """
+        if attrs and not set(attrs).issubset(self.attrs):
+            raise ValueError("Text searches can only search the indexed attributes {}".format(list(self.attrs)))
+
+        search = {'$search': ' '.join(terms)}
+        if self.language:
+            search['$language'] = self.language
+
+        return {'$text': search}
+
+
+class PrefixSearch(SearchStrategy):
+
+    """
+    Matches the words of the attribute starting with the searched term (case and accent insensitive). It keeps
+    the normalized words in a shadow attribute, searched with an anchored regex that can use its index
+    """
+
+    FIELD = '_search_{}'
+
+    def field(self, attr):
+        return self.FIELD.format(attr)
+
+    @property
+    def indexes(self):
+        return [Index(self.field(attr)) for attr in self.attrs]
+
+    def prepare(self, doc):
+        for attr in self.attrs:
+            value = doc.get(attr)
+            if value is None:
+                doc[self.field(attr)] = []
+                continue
+
+            value = normalize(value)
+            words = value.split(' ')
+            doc[self.field(attr)] = [value] + [w for i, w in enumerate(words) if i and w not in words[:i]]
+
+        return doc
+
+    def term_condition(self, attr, term):
+        return {self.field(attr): {'$regex': '^{}'.format(re.escape(normalize(term)))}}
+
+
+class NGramSearch(SearchStrategy):
+
+    """
+    Matches the term anywhere in the attribute (case and accent insensitive), like RegexSearch, but using the
+    index of a shadow attribute that keeps the n-grams of the normalized value. The candidates found through
+    the index are then checked against the normalized value, kept in another shadow attribute
+    """
+
+    FIELD = '_ngrams_{}'
+    VALUE_FIELD = '_normalized_{}'
+
+    def __init__(self, *attrs, n=3):
+        super().__init__(*attrs)
+        self.n = n
+
+    def field(self, attr):
+        return self.FIELD.format(attr)
+
+    def value_field(self, attr):
+        return self.VALUE_FIELD.format(attr)
+
+    @property
+    def indexes(self):
+        return [Index(self.field(attr)) for attr in self.attrs]
+
+    def grams(self, value):
+        # The last grams are shorter, so terms shorter than n can be matched at the end of the value as well
+        value = normalize(value)
+        return sorted({value[i:i + self.n] for i in range(len(value))})
+
+    def prepare(self, doc):
+        for attr in self.attrs:
+            value = doc.get(attr)
+            doc[self.field(attr)] = self.grams(value) if value is not None else []
+            doc[self.value_field(attr)] = normalize(value) if value is not None else None
+
+        return doc
+
+    def term_condition(self, attr, term):
+        normalized = normalize(term)
+
+        if len(normalized) < self.n:
+            lookup = {self.field(attr): {'$regex': '^{}'.format(re.escape(normalized))}}
+        else:
+            grams = [normalized[i:i + self.n] for i in range(len(normalized) - self.n + 1)]
+            lookup = {self.field(attr): {'$all': grams}}
+
+        return {'$and': [lookup, {self.value_field(attr): {'$regex': re.escape(normalized)}}]}
+
+
+class SearchFilter(BaseFilter):
+
+    """
+    Filter that searches text through a search strategy, declaring the indexes the strategy needs. Strategies
+    relying on shadow attributes need the model to declare them as well, so they are filled on writes
+
+    Ex:
+       >> name_search = PrefixSearch('name')
+
+       >> class People(BaseModel):
+       >>     searches = [name_search]
+
+       >> class NameSearchFilter(SearchFilter):
+       >>     name = 'name'
+       >>     search = name_search
+    """
+
+    value_type = str
+    allow_multiple = True
+    search = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if cls.search is not None and 'indexes' not in cls.__dict__:
+            cls.indexes = cls.search.indexes
+
+    @classmethod
+    def condition(cls, *terms):
+        return cls.search.condition(*terms)
@@ -0,0 +1,57 @@
+import os
+import types
+from peach import WebHandler
+
+
+class AsgiHandler(WebHandler):
+
+    """
+    Handler for asyncio applications. The app created is a plain ASGI application, so it can be served by any
+    ASGI server (uvicorn, hypercorn, daphne)
+
+    Ex:
+       >> Peach.init(config=config, handler=AsgiHandler())
+       >> app = Peach().create_app()
+
+       $ uvicorn myapp.app:app --workers 4
+    """
+
+    def __init__(self, api_factory=None):
+        from .api import AsgiApiFactory
+        super().__init__(api_factory or AsgiApiFactory())
+
+    def _load_config_from_pyfile(self, filename):
+        conf = types.ModuleType('config')
+        conf.__file__ = filename
+
+        try:
+            with open(filename, mode='rb') as config_file:
+                exec(compile(config_file.read(), filename, 'exec'), conf.__dict__)
+        except IOError as e:
+            e.strerror = 'Unable to load configuration file (%s)' % e.strerror
+            raise
+
+        return self._config_from_object(conf)
+
+    def _config_from_object(self, obj):
+        return {key: getattr(obj, key) for key in dir(obj) if key.isupper()}
+
+    def get_config(self, config):
+        if isinstance(config, str) and os.path.isfile(config):
+            config = self._load_config_from_pyfile(config)
+
+        elif isinstance(config, object) and not isinstance(config, dict):
+            config = self._config_from_object(config)
+
+        return config
+
+    def create_app(self, config):
+        from .api import AsgiApp
+
+        app = AsgiApp()
+        self._factory.build(app, config)
+        return app
+
+    def run(self, app, host, port):
+        import uvicorn
+        uvicorn.run(app, host=host, port=port)
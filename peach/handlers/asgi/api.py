@@ -0,0 +1,232 @@
+import re
+import json
+import urllib.parse
+from peach.rest.base_api import ApiFactory, ApiException
+from peach.rest.encoders import load_encoder
+
+
+URL_PARAM = re.compile(r'<(?:[^<>:]+:)?([^<>]+)>|{([^{}]+)}')
+
+
+class NotFoundException(ApiException):
+    status = 404
+
+
+class MethodNotAllowedException(ApiException):
+    status = 405
+
+
+def compile_url(url):
+    """
+    Builds the regex that matches an endpoint url. Url parameters can be defined either
+    the flask way (<string:ids>, <ids>) or the falcon way ({ids})
+    """
+    url = re.sub(r'/+', '/', url)
+    url = url.rstrip('/') or '/'
+
+    pattern, position = '', 0
+    for param in URL_PARAM.finditer(url):
+        pattern += re.escape(url[position:param.start()])
+        pattern += '(?P<{}>[^/]+)'.format(param.group(1) or param.group(2))
+        position = param.end()
+
+    pattern += re.escape(url[position:])
+
+    return re.compile('^{}/?$'.format(pattern))
+
+
+class QueryArgs(dict):
+
+    """
+    Query string arguments, keeping every value of repeated arguments
+    """
+
+    def __init__(self, query_string):
+        super().__init__()
+        for key, value in urllib.parse.parse_qsl(query_string, keep_blank_values=True):
+            self.setdefault(key, []).append(value)
+
+    def get(self, key, default=None):
+        values = super().get(key)
+        return values[0] if values else default
+
+    def __getitem__(self, key):
+        return super().__getitem__(key)[0]
+
+    def getlist(self, key):
+        return super().get(key, [])
+
+
+class AsgiRequest(object):
+
+    def __init__(self, scope, body=b''):
+        self._scope = scope
+        self._body = body
+        self._args = None
+
+    @property
+    def method(self):
+        return self._scope['method']
+
+    @property
+    def path(self):
+        return self._scope['path']
+
+    @property
+    def query_string(self):
+        return self._scope.get('query_string', b'').decode()
+
+    @property
+    def args(self):
+        if self._args is None:
+            self._args = QueryArgs(self.query_string)
+
+        return self._args
+
+    @property
+    def headers(self):
+        return {k.decode().lower(): v.decode() for k, v in self._scope.get('headers', [])}
+
+    @property
+    def body(self):
+        return self._body
+
+    @property
+    def json(self):
+        try:
+            return json.loads(self._body.decode()) if self._body else {}
+        except ValueError:
+            return {}
+
+
+class AsgiApp(object):
+
+    """
+    Minimal ASGI application that routes the requests to the peach resources
+    """
+
+    def __init__(self, media_type='application/json'):
+        self._routes = []
+        self._media_type = media_type
+        self._encoder = load_encoder()
+        self.config = None
+
+    def add_route(self, url, handler):
+        """
+        :param url: endpoint url
+        :param handler: coroutine function receiving the request and the url params that returns the
+                        response data and status
+        """
+        self._routes.append((compile_url(url), handler))
+
+    def _match(self, path):
+        for url_regex, handler in self._routes:
+            match = url_regex.match(path)
+            if match:
+                return handler, match.groupdict()
+
+        raise NotFoundException(title="Not found", detail="No endpoint matches '{}'".format(path))
+
+    async def dispatch(self, request):
+        try:
+            handler, url_params = self._match(request.path)
+            data, status = await handler(request, **url_params)
+
+        except ApiException as e:
+            data, status = e.data, e.status
+
+        return data, status
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b''
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        return body
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        request = AsgiRequest(scope, await self._read_body(receive))
+        data, status = await self.dispatch(request)
+        body = self._encoder.encode(data) if status != 204 else b''
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', self._media_type.encode()),
+                (b'content-length', str(len(body)).encode()),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class AsgiApiFactory(ApiFactory):
+
+    @staticmethod
+    def _resource_route(resource_class, params):
+        async def handle(request, **kwargs):
+            # Resources hold request state, so every request gets its own instance
+            return await resource_class(**params).dispatch(request, **kwargs)
+
+        return handle
+
+    def _build_api(self, app, api_def):
+        prefix = api_def.prefix.strip('/')
+        api_route = "/{}".format(prefix)
+
+        rest_api = AsgiRestApi(app=app,
+                               prefix=prefix,
+                               name=api_def.name,
+                               version=api_def.version,
+                               media_type=api_def.mediatype,
+                               encoder=api_def.encoder)
+
+        for name, endpoint in api_def.endpoints.items():
+            for url in endpoint.urls:
+                app.add_route("{}/{}".format(api_route, url), self._resource_route(endpoint.handler, endpoint.params))
+
+        return rest_api
+
+
+class AsgiRestApi(object):
+
+    MEDIA_TYPE = 'application/json'
+
+    def __init__(self,
+                 app,
+                 prefix,
+                 name=None,
+                 version=None,
+                 media_type=None,
+                 encoder=None,
+                 **kwargs):
+        app._media_type = media_type or self.MEDIA_TYPE
+        app._encoder = encoder or load_encoder()
+
+        async def entry_point(request):
+            return {
+                'name': name or 'Peach Rest Api',
+                'version': version or '0.0.0',
+            }, 200
+
+        app.add_route('/{}'.format(prefix), entry_point)
@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import urllib.parse
+from webargs import core
+from peach.utils import ObjectDict
+from peach.database.loader import AsyncModelLoader
+from peach.rest.base_api import ApiException
+from peach.rest.resource import BaseResource, RequestHelper, InvalidDocumentException
+from peach.rest.querystring import QueryStringParsing
+from peach.database.proxy import QueryTimeout, id_candidates
+from .api import MethodNotAllowedException
+
+
+class UnprocessableRequestException(ApiException):
+    status = 422
+
+
+class AsgiParser(core.Parser):
+
+    def parse_querystring(self, req, name, field):
+        return core.get_value(req.args, name, field)
+
+    def parse_json(self, req, name, field):
+        return core.get_value(req.json, name, field, allow_many_nested=True)
+
+    def parse_headers(self, req, name, field):
+        return core.get_value(req.headers, name.lower(), field)
+
+    def parse_form(self, req, name, field):
+        return core.missing
+
+    def parse_cookies(self, req, name, field):
+        return core.missing
+
+    def parse_files(self, req, name, field):
+        return core.missing
+
+    def handle_error(self, error, req, schema, error_status_code=None, error_headers=None):
+        raise UnprocessableRequestException(title="Invalid request arguments", detail=error.messages)
+
+
+req_parser = AsgiParser()
+
+
+class AsgiRequestHelper(RequestHelper):
+
+    LOADER_CLASS = AsyncModelLoader
+
+    def parse(self, request, request_args):
+        self._req = request
+        self._parsed_args = ObjectDict(**self.parse_args(request, request_args))
+
+    def parse_args(self, request, request_args):
+        return req_parser.parse(request_args.schema(), request)
+
+    @property
+    def base_url(self):
+        return self._req.path
+
+    @property
+    def json(self):
+        return self._req.json
+
+    @property
+    def querystring(self):
+        return urllib.parse.unquote_plus(self._req.query_string)
+
+
+class AsgiQueryStringHelper(QueryStringParsing, AsgiRequestHelper):
+
+    webargs_parser = req_parser
+
+    def query_params(self, request):
+        return request.args
+
+
+class AsgiBaseResource(BaseResource):
+
+    """
+    Base resource for the asgi handler. Its methods are coroutines that use the asyncio api of the models, so
+    the database proxy defined as 'async_proxy' is needed. Methods defined as regular functions on subclasses
+    are run on the default executor to avoid blocking the event loop.
+
+    Filters are combined through their conditions, since a filter's apply method is blocking.
+    """
+
+    REQUEST_HELPERS = {
+        'webargs': AsgiRequestHelper,
+        'querystring': AsgiQueryStringHelper
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(self.request_helper(kwargs.get('parser')), *args, **kwargs)
+
+    async def dispatch(self, request, **kwargs):
+        method = getattr(self, request.method.lower(), None)
+        if method is None:
+            raise MethodNotAllowedException(title="Method not allowed",
+                                            detail="{} is not supported by this endpoint".format(request.method))
+
+        self._request_helper.parse(request, self.request_args)
+
+        if asyncio.iscoroutinefunction(method):
+            return await method(**kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(method, **kwargs))
+
+    async def get(self, ids=None):
+        meta = {}
+        pagination = self.pagination
+        filters = self.requested_filters
+
+        try:
+            if ids:
+                data = await self.get_by_ids(ids)
+
+            else:
+                page_params = self.page_params(pagination)
+                data, total_count = await self.get_page(filters, pagination, page_params)
+                pagination.total = total_count
+                data = pagination.set_results(data, page_params.sort)
+
+        except QueryTimeout as e:
+            raise self.query_timeout(e, filters)
+
+        data, errors = self.serializer.serialize(data, filters=self.requested_fields, many=True)
+
+        return self.build_response(data=data, meta=meta, pagination=pagination).data(), 200
+
+    async def get_by_ids(self, ids):
+        return await self.loader().load_many(ids.split(','))
+
+    async def get_page(self, filters, pagination, page_params=None):
+        """
+        :param filters: dict containing the specified filters
+        :param pagination: pagination object
+        :param page_params: query parameters of the page, built from the pagination if not given
+        :return: tuple with the requested page and the total count (None if the pagination doesn't count)
+        """
+        condition = self.filters_condition(filters) if filters else {}
+        page_params = page_params or self.page_params(pagination)
+
+        if pagination.total_mode == pagination.TOTAL_EXACT:
+            return await self.model.afind_with_count(condition, **page_params)
+
+        data = [d async for d in self.model.afind(condition, **page_params)]
+        total_count = None
+
+        if pagination.total_mode == pagination.TOTAL_ESTIMATED and not filters:
+            total_count = await self.model.aestimated_count()
+
+        return data, total_count
+
+    async def post(self):
+        new_item, errors = self.serializer.deserialize(self._request_helper.json)
+        if errors:
+            raise InvalidDocumentException(title="Invalid document", detail=errors)
+
+        await self.model.aadd(new_item)
+        return {}, 201
+
+    async def delete(self, ids):
+        await self.model.adelete(*id_candidates(ids.split(',')))
+        return {}, 204
@@ -1,8 +1,9 @@
-import json
 import re
 import falcon
 from peach.rest.base_api import ApiFactory, ApiException
 from peach.handlers.falcon import int_to_falcon_status
+from peach.rest.tracing import request_metrics
+from peach.rest.encoders import load_encoder
 
 
 class FalconApiFactory(ApiFactory):
@@ -15,7 +16,9 @@ class FalconApiFactory(ApiFactory):
                                  prefix=prefix,
                                  name=api_def.name,
                                  version=api_def.version,
-                                 media_type=api_def.mediatype)
+                                 media_type=api_def.mediatype,
+                                 tracing=api_def.tracing,
+                                 encoder=api_def.encoder)
 
         for name, endpoint in api_def.endpoints.items():
             for url in endpoint.urls:
@@ -36,24 +39,36 @@ class FalconRestApi(object):
                  name=None,
                  version=None,
                  media_type=None,
+                 tracing=False,
+                 encoder=None,
                  **kwargs):
         self._media_type = media_type or self.MEDIA_TYPE
+        self._encoder = encoder = encoder or load_encoder()
 
         class EntryPoint(object):
 
             def on_get(self, req, resp):
-                resp.body = json.dumps({
+                resp.data = encoder.encode({
                     'name': name or 'Peach Rest Api',
                     'version': version or '0.0.0',
                 })
                 resp.status = falcon.HTTP_200
 
         app._media_type = self._media_type
+        class Metrics(object):
+
+            def on_get(self, req, resp):
+                resp.body = request_metrics.prometheus()
+                resp.content_type = 'text/plain; version=0.0.4'
+                resp.status = falcon.HTTP_200
+
         app.add_route('/{}'.format(prefix), EntryPoint())
+        if tracing:
+            app.add_route('/{}/_metrics'.format(prefix), Metrics())
         app.add_error_handler(ApiException, self.handle_error)
 
     def handle_error(self, ex, req, resp, params):
-        resp.body = json.dumps(ex.data)
+        resp.data = self._encoder.encode(ex.data)
         resp.status = int_to_falcon_status(ex.status)
 
 
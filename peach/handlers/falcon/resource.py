@@ -3,12 +3,15 @@ import json
 from webargs.falconparser import parser as req_parser
 from peach.utils import ObjectDict
 from peach.rest.resource import BaseResource, RequestHelper
+from peach.rest.querystring import QueryStringParsing
+from peach.rest.response import StreamingDataDocument
+from peach.rest.tracing import stage
 from peach.handlers.falcon import int_to_falcon_status
 
 
 class FalconRequestHelper(RequestHelper):
 
-    def parse(self, request, supported_args):
+    def parse(self, request, request_args):
         self._req = request
 
         try:
@@ -16,7 +19,10 @@ class FalconRequestHelper(RequestHelper):
         except:
             self._json = {}
 
-        self._parsed_args = ObjectDict(**req_parser.parse(supported_args, self._req))
+        self._parsed_args = ObjectDict(**self.parse_args(request, request_args))
+
+    def parse_args(self, request, request_args):
+        return req_parser.parse(request_args.schema(), request)
 
     @property
     def base_url(self):
@@ -31,23 +37,53 @@ class FalconRequestHelper(RequestHelper):
         return urllib.parse.unquote_plus(self._req.query_string)
 
 
+class FalconQueryStringHelper(QueryStringParsing, FalconRequestHelper):
+
+    webargs_parser = req_parser
+
+    def query_params(self, request):
+        return request.params
+
+
 def handle_req_and_resp(f):
     def wrapped_f(instance, req, resp, **kwargs):
-        # Parses the request to make data available for the resource
-        instance._request_helper.parse(req, instance.REQUEST_ARGS)
-        data, status = f(instance, req, resp, **kwargs)
+        tracer = instance.tracer()
+        if tracer:
+            tracer.start()
 
-        # Builds the response as expected by falcon
-        resp.body = json.dumps(data)
-        resp.status = int_to_falcon_status(status)
+        try:
+            # Parses the request to make data available for the resource
+            with stage('parse'):
+                instance._request_helper.parse(req, instance.request_args)
+
+            data, status = f(instance, req, resp, **kwargs)
+
+            # Builds the response as expected by falcon
+            if isinstance(data, StreamingDataDocument):
+                resp.stream = data.chunks()
+            else:
+                with stage('encode'):
+                    resp.data = instance.encoder.encode(data)
+
+            resp.status = int_to_falcon_status(status)
+
+        finally:
+            if tracer:
+                tracer.finish()
+                resp.set_header('Server-Timing', tracer.header())
 
     return wrapped_f
 
 
 class FalconBaseResource(BaseResource):
 
+    REQUEST_HELPERS = {
+        'webargs': FalconRequestHelper,
+        'querystring': FalconQueryStringHelper
+    }
+
     def __init__(self, *args, **kwargs):
-        super().__init__(FalconRequestHelper(), *args, **kwargs)
+        super().__init__(self.request_helper(kwargs.get('parser')), *args, **kwargs)
 
     @handle_req_and_resp
     def on_get(self, req, resp, **kwargs):
@@ -1,6 +1,9 @@
+import functools
 import flask_restful
-from flask import Blueprint, jsonify, make_response
+from flask import Blueprint, Response, g
 from peach.rest.base_api import ApiFactory, ApiException
+from peach.rest.tracing import current_tracer, request_metrics
+from peach.rest.encoders import load_encoder
 
 
 class FlaskApiFactory(ApiFactory):
@@ -12,7 +15,9 @@ class FlaskApiFactory(ApiFactory):
         rest_api = FlaskRestApi(app=api_blueprint,
                                 name=api_def.name,
                                 version=api_def.version,
-                                media_type=api_def.mediatype)
+                                media_type=api_def.mediatype,
+                                tracing=api_def.tracing,
+                                encoder=api_def.encoder)
 
         for name, endpoint in api_def.endpoints.items():
             rest_api.add_resource(endpoint.handler,
@@ -33,23 +38,75 @@ class FlaskRestApi(flask_restful.Api):
                  name=None,
                  version=None,
                  media_type=None,
+                 tracing=False,
+                 encoder=None,
                  **kwargs):
         super().__init__(app=app, default_mediatype=media_type or self.MEDIA_TYPE, **kwargs)
+        self._encoder = encoder or load_encoder()
+        self.representations[self.MEDIA_TYPE] = self.output_json
 
         @app.route('/')
         def main():
-            return jsonify({
+            return self.json_response({
                 'name': name or 'Peach Rest Api',
                 'version': version or '0.0.0',
             })
 
+        if tracing:
+            @app.route('/_metrics')
+            def metrics():
+                return Response(request_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    def output(self, resource):
+        view = super().output(resource)
+
+        @functools.wraps(view)
+        def traced(*args, **kwargs):
+            try:
+                return view(*args, **kwargs)
+            finally:
+                # The tracer is finished once the response is encoded, failed requests don't get there and
+                # handle_error isn't called for the ones propagated. It's kept for handle_error to set the header
+                tracer = current_tracer.get()
+                if tracer:
+                    tracer.finish()
+                    g.peach_tracer = tracer
+
+        return traced
+
+    @staticmethod
+    def finish_trace(response):
+        tracer = current_tracer.get() or g.pop('peach_tracer', None)
+        if tracer:
+            tracer.finish()
+
+            if not isinstance(response, str):
+                response.headers['Server-Timing'] = tracer.header()
+
+        return response
+
+    def json_response(self, data, status=200, headers=None):
+        response = Response(self._encoder.encode(data), status=status, mimetype=self.MEDIA_TYPE)
+        response.headers.extend(headers or {})
+        return response
+
+    def output_json(self, data, code, headers=None):
+        tracer = current_tracer.get()
+        if tracer is None:
+            return self.json_response(data, code, headers)
+
+        with tracer.stage('encode'):
+            response = self.json_response(data, code, headers)
+
+        return self.finish_trace(response)
+
     def handle_error(self, e):
         if isinstance(e, ApiException):
-            error_response = make_response(jsonify(e.data), e.status)
+            error_response = self.json_response(e.data, e.status)
             error_response = '{}' if e.status == 200 else error_response
 
         else:
             error_response = super().handle_error(e)
 
-        return error_response
+        return self.finish_trace(error_response)
 
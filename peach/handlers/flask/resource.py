@@ -1,15 +1,23 @@
 import urllib
 import flask_restful
+from flask import Response, stream_with_context
 from webargs.flaskparser import parser as req_parser
 from peach.utils import ObjectDict
 from peach.rest.resource import BaseResource, RequestHelper
+from peach.rest.querystring import QueryStringParsing
+from peach.rest.response import StreamingDataDocument
+from peach.rest.tracing import stage, current_tracer
+from .api import FlaskRestApi
 
 
 class FlaskRequestHelper(RequestHelper):
 
-    def parse(self, request, supported_args):
+    def parse(self, request, request_args):
         self._req = request
-        self._parsed_args = ObjectDict(**req_parser.parse(supported_args))
+        self._parsed_args = ObjectDict(**self.parse_args(request, request_args))
+
+    def parse_args(self, request, request_args):
+        return req_parser.parse(request_args.schema())
 
     @property
     def base_url(self):
@@ -24,18 +32,52 @@ class FlaskRequestHelper(RequestHelper):
         return urllib.parse.unquote_plus(self._req.query_string.decode())
 
 
+class FlaskQueryStringHelper(QueryStringParsing, FlaskRequestHelper):
+
+    webargs_parser = req_parser
+
+    def query_params(self, request):
+        return request.args
+
+
 class FlaskBaseResource(BaseResource, flask_restful.Resource):
 
+    REQUEST_HELPERS = {
+        'webargs': FlaskRequestHelper,
+        'querystring': FlaskQueryStringHelper
+    }
+
     def __init__(self, *args, **kwargs):
-        BaseResource.__init__(self, FlaskRequestHelper(), *args, **kwargs)
+        BaseResource.__init__(self, self.request_helper(kwargs.get('parser')), *args, **kwargs)
         flask_restful.Resource.__init__(self)
-        self._request_helper.parse(flask_restful.request, self.REQUEST_ARGS)
+
+        # Flask builds the resource for every request, the tracer is finished once the response is encoded
+        # (see FlaskRestApi.output_json)
+        tracer = self.tracer()
+        if tracer:
+            tracer.start()
+
+        with stage('parse'):
+            self._request_helper.parse(flask_restful.request, self.request_args)
 
     # Need to specify these again because for some reason Flask MethodView doesn't pick up
     # the class methods inherited from BaseResource
 
     def get(self, ids=None):
-        return super().get(ids)
+        data, status = super().get(ids)
+
+        if isinstance(data, StreamingDataDocument):
+            response = Response(stream_with_context(data.chunks()), status=status, mimetype=FlaskRestApi.MEDIA_TYPE)
+
+            # The data is encoded as it's sent, so the timing only covers what happened before
+            tracer = current_tracer.get()
+            if tracer:
+                tracer.finish()
+                response.headers['Server-Timing'] = tracer.header()
+
+            return response
+
+        return data, status
 
     def post(self):
         return super().post()
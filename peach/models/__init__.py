@@ -1,12 +1,68 @@
+from abc import ABCMeta
+from collections.abc import Mapping, MutableMapping
 from peach import Peach
-from peach.database.proxy import load_db_proxy
+from peach.database.proxy import load_db_proxy, load_async_db_proxy
 from peach.utils import ObjectDict
 
+try:
+    from bson import decode
+except ImportError:
+    decode = None
 
-class BaseModel(ObjectDict):
+
+class AsyncDBProxyAttribute(object):
+
+    """
+    Builds the asyncio proxy of the models the first time it's used instead of when they are defined, asyncio
+    clients must be created from the event loop they'll run on
+    """
+
+    def __init__(self, db_conf):
+        self._db_conf = db_conf
+        self._proxy = None
+        self._loaded = False
+
+    def __get__(self, instance, owner):
+        if not self._loaded:
+            self._proxy = load_async_db_proxy(self._db_conf)
+            self._loaded = True
+
+        return self._proxy
+
+
+class Model(object):
+
+    """
+    What every model has, regardless of how it keeps its attributes (see BaseModel and CompactModel).
+
+    The methods prefixed with 'a' are the asyncio version of the ones with the same name, they use the
+    database proxy defined as 'async_proxy' in the database config
+
+    Ex:
+       >> people = [p async for p in People.afind({'age': 22})]
+       >> total = await People.acount({'age': 22})
+    """
+
+    __slots__ = ()
 
     type = None
+
+    # Indexes the model relies on (see peach.database.indexes.Index), created when the app is built
+    indexes = []
+
+    # Search strategies used for the model attributes (see peach.filters.search), the shadow attributes they
+    # rely on are filled every time a document is written
+    searches = []
+
+    # Where the model is read from when the endpoint doesn't say otherwise, ex: {'preference': 'secondaryPreferred',
+    # 'max_staleness': 90, 'concern': 'majority'}. Writes always go to the primary
+    read_options = None
+
+    # Whether the mongo proxies return the documents as raw BSON, decoded when their fields are accessed
+    raw_reads = False
+
     db = load_db_proxy(Peach().database_config)
+    adb = AsyncDBProxyAttribute(Peach().database_config)
 
     @property
     def id(self):
@@ -16,35 +72,359 @@ class BaseModel(ObjectDict):
     def build(cls, data):
         raise NotImplementedError()
 
+    @classmethod
+    def prepare(cls, doc):
+        for search in cls.searches:
+            search.prepare(doc)
+
+        return doc
+
     @classmethod
     def count(cls, condition=None, **kwargs):
         return cls.db.count(cls, condition, **kwargs)
 
     @classmethod
-    def all(cls, skip=0, limit=0, sort=None):
-        for d in cls.db.find(cls, {}, skip=skip, limit=limit, sort=sort):
-            yield cls.build(d)
+    def estimated_count(cls):
+        return cls.db.estimated_count(cls)
+
+    @classmethod
+    def all(cls, skip=0, limit=0, sort=None, **kwargs):
+        yield from cls.db.find(cls, {}, skip=skip, limit=limit, sort=sort, **kwargs)
 
     @classmethod
     def add(cls, doc):
-        cls.db.add(cls, doc)
+        cls.db.add(cls, cls.prepare(doc))
+
+    @classmethod
+    def add_many(cls, docs, batch_size=None):
+        return cls.db.add_many(cls, (cls.prepare(d) for d in docs), batch_size=batch_size)
 
     @classmethod
-    def upsert(cls, *docs):
-        cls.db.upsert(cls, *docs)
+    def upsert(cls, *docs, batch_size=None):
+        return cls.db.upsert(cls, *[cls.prepare(d) for d in docs], batch_size=batch_size)
 
     @classmethod
-    def delete(cls, *doc_ids):
-        cls.db.delete(cls, *doc_ids)
+    def delete(cls, *doc_ids, batch_size=None):
+        return cls.db.delete(cls, *doc_ids, batch_size=batch_size)
 
     @classmethod
     def find(cls, condition, skip=0, limit=0, sort=None, **kwargs):
         return cls.db.find(cls, condition, skip=skip, limit=limit, sort=sort, **kwargs)
 
     @classmethod
-    def by_attr(cls, attr, value, exact=True, many=True, skip=0, limit=0, sort=None):
-        return cls.db.by_attr(cls, attr, value, exact, many, skip=skip, limit=limit, sort=sort)
+    def find_with_count(cls, condition, skip=0, limit=0, sort=None, **kwargs):
+        return cls.db.find_with_count(cls, condition, skip=skip, limit=limit, sort=sort, **kwargs)
+
+    @classmethod
+    def by_attr(cls, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        return cls.db.by_attr(cls, attr, value, exact, many, skip=skip, limit=limit, sort=sort, fields=fields)
 
     @classmethod
     def by_id(cls, id):
         return cls.db.by_id(cls, id)
+
+    @classmethod
+    def by_ids(cls, ids, fields=None):
+        return cls.db.by_ids(cls, ids, fields=fields)
+
+    @classmethod
+    async def acount(cls, condition=None, **kwargs):
+        return await cls.adb.count(cls, condition, **kwargs)
+
+    @classmethod
+    async def aestimated_count(cls):
+        return await cls.adb.estimated_count(cls)
+
+    @classmethod
+    def aall(cls, skip=0, limit=0, sort=None, **kwargs):
+        return cls.adb.find(cls, {}, skip=skip, limit=limit, sort=sort, **kwargs)
+
+    @classmethod
+    async def aadd(cls, doc):
+        await cls.adb.add(cls, cls.prepare(doc))
+
+    @classmethod
+    async def aadd_many(cls, docs, batch_size=None):
+        return await cls.adb.add_many(cls, (cls.prepare(d) for d in docs), batch_size=batch_size)
+
+    @classmethod
+    async def aupsert(cls, *docs, batch_size=None):
+        return await cls.adb.upsert(cls, *[cls.prepare(d) for d in docs], batch_size=batch_size)
+
+    @classmethod
+    async def adelete(cls, *doc_ids, batch_size=None):
+        return await cls.adb.delete(cls, *doc_ids, batch_size=batch_size)
+
+    @classmethod
+    def afind(cls, condition, skip=0, limit=0, sort=None, **kwargs):
+        return cls.adb.find(cls, condition, skip=skip, limit=limit, sort=sort, **kwargs)
+
+    @classmethod
+    async def afind_with_count(cls, condition, skip=0, limit=0, sort=None, **kwargs):
+        return await cls.adb.find_with_count(cls, condition, skip=skip, limit=limit, sort=sort, **kwargs)
+
+    @classmethod
+    def aby_attr(cls, attr, value, exact=True, many=True, skip=0, limit=0, sort=None, fields=None):
+        return cls.adb.by_attr(cls, attr, value, exact, many, skip=skip, limit=limit, sort=sort, fields=fields)
+
+    @classmethod
+    async def aby_id(cls, id):
+        return await cls.adb.by_id(cls, id)
+
+    @classmethod
+    async def aby_ids(cls, ids, fields=None):
+        return await cls.adb.by_ids(cls, ids, fields=fields)
+
+
+class BaseModel(Model, ObjectDict):
+
+    """
+    Model kept as a dict, every attribute is an item of it
+    """
+
+
+class CompactModelMeta(ABCMeta):
+
+    """
+    Turns the fields declared by a compact model into slots
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        inherited = tuple(f for base in bases for f in getattr(base, '_field_names', ()))
+
+        # a slot would silently replace the model attribute (count, find, type...) with the field
+        reserved = [f for f in namespace.get('fields', ()) if f not in inherited and any(hasattr(b, f) for b in bases)]
+        if reserved:
+            raise ValueError("Fields of '{}' can't be named as model attributes: {}".format(name, ', '.join(reserved)))
+
+        if '__slots__' not in namespace:
+            namespace['__slots__'] = tuple(f for f in namespace.get('fields', ()) if f not in inherited)
+
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        cls._field_names = inherited + tuple(f for f in cls.__slots__ if f not in inherited and f != '_extra')
+        cls._field_set = frozenset(cls._field_names)
+        cls._fill = mcs.compile_fill(cls)
+
+        return cls
+
+    @staticmethod
+    def compile_fill(cls):
+        """
+        Generates the function that sets the slots from a document, going through the slot descriptors
+        instead of a loop of setattr calls makes building a model about three times faster. Documents having
+        every field and nothing else, the usual case, don't need to be scanned for extra attributes
+
+        :return: function receiving the model and the document
+        """
+        namespace = {'fields': cls._field_set, 'set_extra': cls._extra.__set__}
+        lines = ['def fill(self, doc):',
+                 '    complete = True']
+
+        for i, field in enumerate(cls._field_names):
+            namespace['set_{}'.format(i)] = getattr(cls, field).__set__
+            lines += ['    try:',
+                      '        set_{}(self, doc[{!r}])'.format(i, field),
+                      '    except KeyError:',
+                      '        complete = False']
+
+        lines += ['    if complete and len(doc) == {}:'.format(len(cls._field_names)),
+                  '        set_extra(self, None)',
+                  '    else:',
+                  '        set_extra(self, {k: v for k, v in doc.items() if k not in fields} or None)']
+
+        exec(compile('\n'.join(lines), '<{} fill>'.format(cls.__name__), 'exec'), namespace)
+        return namespace['fill']
+
+
+class CompactModel(Model, MutableMapping, metaclass=CompactModelMeta):
+
+    """
+    Model that keeps the declared fields in slots instead of a dict, taking about half the memory of a
+    BaseModel and giving faster attribute access, at the cost of slower building and serialization. It still
+    behaves as a mapping, so proxies and serializers handle it as any other model. Attributes not declared
+    (like the ones added by search strategies) are kept apart in a dict.
+
+    Ex:
+       >> class People(CompactModel):
+       >>     fields = ('name', 'age', 'address')
+
+       >> person = People.build({'_id': 1, 'name': 'Foo', 'age': 22})
+       >> person.name, person['age']
+    """
+
+    __slots__ = ('_id', '_extra')
+
+    fields = ()
+
+    def __init__(self, doc=None, **kwargs):
+        if kwargs:
+            doc = dict(doc, **kwargs) if doc else kwargs
+
+        self._fill(doc or {})
+
+    @classmethod
+    def build(cls, data):
+        if data is None:
+            return None
+
+        # skips __init__, the document is used as it is
+        model = cls.__new__(cls)
+        cls._fill(model, data)
+        return model
+
+    def __getattr__(self, key):
+        # only called when the attribute isn't set
+        extra = object.__getattribute__(self, '_extra')
+        if extra is not None and key in extra:
+            return extra[key]
+
+        raise AttributeError("%s doesn't have attribute '%s'" % (self.__class__.__name__, key))
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+
+        if self._extra is None:
+            raise KeyError(key)
+
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            object.__setattr__(self, key, value)
+
+        else:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+
+        elif self._extra is not None:
+            del self._extra[key]
+
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self._field_names:
+            try:
+                object.__getattribute__(self, key)
+            except AttributeError:
+                continue
+
+            yield key
+
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+
+        return True
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, dict(self))
+
+
+class LazyModel(Model, Mapping):
+
+    """
+    Read only model for listings where many of the documents read are never looked at. The mongo proxies give
+    it the documents as raw BSON (see raw_reads), which is only decoded the first time a field is accessed, so
+    the models that are just counted, paginated over or dropped never get decoded. Reading any field, serializing
+    included, decodes the whole document.
+
+    Ex:
+       >> class PeopleListing(LazyModel):
+       >>     collection_name = 'people'
+
+       >> names = [p.name for p in PeopleListing.find({'age': 22})]
+    """
+
+    __slots__ = ('_doc', '_fields')
+
+    raw_reads = True
+
+    # The cached results are shared instead of copied, copying would decode every document
+    read_only = True
+
+    # Options to decode the raw documents with, ex: CodecOptions(tz_aware=True)
+    codec_options = None
+
+    def __init__(self, doc):
+        object.__setattr__(self, '_doc', doc)
+        object.__setattr__(self, '_fields', doc if doc.__class__ is dict else None)
+
+    @classmethod
+    def build(cls, data):
+        return cls(data) if data is not None else None
+
+    @property
+    def raw(self):
+        """
+        :return: BSON bytes of the document, None if it wasn't read as raw BSON
+        """
+        return getattr(self._doc, 'raw', None)
+
+    def _decoded(self):
+        """
+        :return: dict with the top level fields, decoded the first time it's needed
+        """
+        fields = self._fields
+        if fields is None:
+            raw = getattr(self._doc, 'raw', None)
+            if raw is not None and decode is not None:
+                fields = decode(raw, self.codec_options) if self.codec_options else decode(raw)
+            else:
+                fields = dict(self._doc.items())
+
+            object.__setattr__(self, '_fields', fields)
+
+        return fields
+
+    def __getattr__(self, key):
+        # only called for the document fields, the model attributes are found before
+        try:
+            return self._decoded()[key]
+        except KeyError:
+            raise AttributeError("%s doesn't have attribute '%s'" % (self.__class__.__name__, key))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("%s is read only" % self.__class__.__name__)
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+    def __reduce__(self):
+        return self.__class__, (self._decoded(),)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self._decoded())
@@ -1,11 +1,19 @@
 from peach.database.proxy import load_db_proxy
+from peach.database.indexes import declared_indexes, reconcile_indexes
 from peach.utils import load_resource_class, ObjectDict
 from peach.rest.pagination import Pagination
 from peach.rest.response import ResponseDocumentFactory
+from peach.rest.encoders import load_encoder
 
 
 class ApiFactory(object):
 
+    ENSURE_INDEXES = 'ensure'
+    DRY_RUN_INDEXES = 'dry_run'
+    SKIP_INDEXES = 'off'
+
+    index_reports = None
+
     @classmethod
     def load_api_resource_params(cls, app_conf, api_conf):
         db_conf = app_conf.get('DATABASE')
@@ -28,16 +36,33 @@ class ApiFactory(object):
                 'prefix': api_def.get('prefix'),
                 'version': api_def.get('version'),
                 'mediatype': api_def.get('mediatype'),
+                'tracing': api_def.get('tracing', False),
+                'encoder': load_encoder(api_def.get('encoder')),
+                'parser': api_def.get('parser'),
                 'conf': app_conf,
                 'endpoints': ObjectDict()
             })
 
             for endpoint in api_def.get('endpoints', []):
+                params = self.load_api_resource_params(app_conf, api_def)
+                params['query'] = ObjectDict(**endpoint.get('query', {}))
+                params['endpoint'] = endpoint['name']
+                params['tracing'] = api_def.get('tracing', False)
+                params['encoder'] = definitions[api_id].encoder
+                params['parser'] = api_def.get('parser')
+
+                handler = load_resource_class(endpoint['class'])
+
+                # The arguments are built and the request parser checked at registration, not on every request
+                if hasattr(handler, 'compile_request_args') and getattr(handler, 'model', None) is not None:
+                    handler.compile_request_args(params.pagination)
+                    handler.request_helper(params.parser)
+
                 definitions[api_id]['endpoints'][endpoint['name']] = ObjectDict(**{
-                    'handler': load_resource_class(endpoint['class']),
+                    'handler': handler,
                     'urls': endpoint['urls'],
                     'name': endpoint['name'],
-                    'params': self.load_api_resource_params(app_conf, api_def)
+                    'params': params
                 })
 
         return definitions
@@ -45,8 +70,31 @@ class ApiFactory(object):
     def _build_api(self, app, api_def):
         raise NotImplementedError
 
+    def ensure_indexes(self, app_conf, api_definitions):
+        """
+        Reconciles the indexes declared by the models and filters of the endpoints with the database. The
+        'indexes' entry of the database config sets what to do: 'ensure' (default) creates the missing ones,
+        'dry_run' only reports them and 'off' skips the check
+
+        :return: dict {collection: report}, see peach.database.indexes.reconcile_indexes
+        """
+        mode = app_conf.get('DATABASE', {}).get('indexes', self.ENSURE_INDEXES)
+        endpoints = [e for api_def in api_definitions.values() for e in api_def.endpoints.values()]
+
+        if mode == self.SKIP_INDEXES or not endpoints:
+            return {}
+
+        declared = declared_indexes([e.handler for e in endpoints])
+        return reconcile_indexes(endpoints[0].params.database, declared, dry_run=mode == self.DRY_RUN_INDEXES)
+
     def build(self, app, config=None):
-        return [self._build_api(app, api_def) for api_def in self._api_definitions(config or getattr(app, 'config')).values()]
+        config = config or getattr(app, 'config')
+        api_definitions = self._api_definitions(config)
+
+        apis = [self._build_api(app, api_def) for api_def in api_definitions.values()]
+        self.index_reports = self.ensure_indexes(config, api_definitions)
+
+        return apis
 
 
 class ApiException(Exception):
@@ -0,0 +1,132 @@
+import json
+import uuid
+import decimal
+import datetime
+from collections.abc import Mapping
+from peach.utils import load_resource_class
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+
+class EncoderNotAvailable(Exception):
+    pass
+
+
+def default(value):
+    """
+    Encodes the values json doesn't know about: ObjectIds as their hex string, dates in ISO 8601, mappings
+    that aren't dicts as dicts
+    """
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return str(value)
+
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+
+    if isinstance(value, uuid.UUID):
+        return str(value)
+
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+
+    # raw BSON documents (see peach.models.LazyModel) and models that aren't dicts
+    if isinstance(value, Mapping):
+        return dict(value.items())
+
+    raise TypeError("Object of type '{}' is not JSON serializable".format(value.__class__.__name__))
+
+
+class JSONEncoder(object):
+
+    """
+    Turns the response documents into json bytes. Encoders are set per api with the 'encoder' entry, either
+    by name (stdlib, orjson, auto) or with the path to a JSONEncoder subclass
+
+    Ex:
+       >> APIS = {
+       >>     'api': {
+       >>         'prefix': '/api',
+       >>         'encoder': 'orjson',
+       >>         'endpoints': [...]
+       >>     }
+       >> }
+    """
+
+    name = None
+
+    def encode(self, value):
+        """
+        :return: value encoded as utf-8 json bytes
+        """
+        raise NotImplementedError
+
+
+class StdlibEncoder(JSONEncoder):
+
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=default, ensure_ascii=False, separators=(',', ':'))
+
+    def encode(self, value):
+        return self._encoder.encode(value).encode('utf-8')
+
+
+class OrjsonEncoder(JSONEncoder):
+
+    """
+    Encoder backed by orjson, several times faster than the stdlib one. Datetimes and UUIDs are encoded
+    natively, naive datetimes keep having no timezone
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise EncoderNotAvailable("orjson is not installed, run 'pip install orjson'")
+
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def encode(self, value):
+        return orjson.dumps(value, default=default, option=self._option)
+
+
+ENCODERS = {
+    StdlibEncoder.name: StdlibEncoder,
+    OrjsonEncoder.name: OrjsonEncoder
+}
+
+AUTO = 'auto'
+
+
+def load_encoder(encoder=None):
+    """
+    :param encoder: name or path of the encoder. It's stdlib by default, auto picks orjson when it's installed
+                    and stdlib otherwise
+    :return: JSONEncoder instance
+    """
+    if isinstance(encoder, JSONEncoder):
+        return encoder
+
+    if encoder is None:
+        return StdlibEncoder()
+
+    if encoder == AUTO:
+        return OrjsonEncoder() if orjson is not None else StdlibEncoder()
+
+    encoder_class = ENCODERS.get(encoder) or load_resource_class(encoder)
+    if encoder_class is None:
+        raise ValueError("Unknown json encoder '{}'".format(encoder))
+
+    return encoder_class()
@@ -1,33 +1,66 @@
 # -*- coding: utf-8 -*-
-from webargs import fields
+import base64
+import json
+from collections.abc import Mapping
+from webargs import fields, validate
 from math import ceil
 
+try:
+    from bson import json_util
+except ImportError:
+    json_util = json
+
+
+class InvalidPageCursor(ValueError):
+    pass
+
 
 class Pagination(object):
 
     DEFAULT_NUMBER = 0
     DEFAULT_SIZE = 24
 
+    # Keyset paginations move through the results using a cursor instead of page numbers
+    KEYSET = False
+
+    # How the total amount of items is obtained. Counting can be way slower than fetching the page on big
+    # filtered collections, so it can be skipped (none) or approximated from the collection metadata (estimated)
+    TOTAL_EXACT = 'exact'
+    TOTAL_ESTIMATED = 'estimated'
+    TOTAL_NONE = 'none'
+
     PAGE_NUMBER_ARG = 'page[number]'
     PAGE_SIZE_ARG = 'page[size]'
+    PAGE_TOTAL_ARG = 'page[total]'
 
     REQUEST_ARGS = {
         'page_number': fields.Int(load_from=PAGE_NUMBER_ARG),
         'page_size': fields.Int(load_from=PAGE_SIZE_ARG),
+        'page_total': fields.Str(load_from=PAGE_TOTAL_ARG,
+                                 validate=validate.OneOf([TOTAL_EXACT, TOTAL_ESTIMATED, TOTAL_NONE])),
     }
 
-    def __init__(self, page_number=DEFAULT_NUMBER, page_size=DEFAULT_SIZE, total_items=None, resource=None, params=None):
+    def __init__(self,
+                 page_number=DEFAULT_NUMBER,
+                 page_size=DEFAULT_SIZE,
+                 total_items=None,
+                 resource=None,
+                 params=None,
+                 total_mode=TOTAL_EXACT):
         self._total_items = total_items
         self._page_number = page_number
         self._page_size = page_size
         self._params = params
         self._resource = resource
+        self._total_mode = total_mode
+        self._has_next = None
         self._last_page = self._calculate_last_result_page(self._total_items, self._page_size)
 
     @classmethod
     def from_request_args(cls, req_args):
         return Pagination(page_number=req_args.get('page_number', cls.DEFAULT_NUMBER),
-                          page_size=req_args.get('page_size', cls.DEFAULT_SIZE))
+                          page_size=req_args.get('page_size', cls.DEFAULT_SIZE),
+                          total_mode=req_args.get('page_total') or cls.TOTAL_EXACT)
 
     @property
     def params(self):
@@ -53,6 +86,85 @@ class Pagination(object):
     def size(self):
         return self._page_size
 
+    @property
+    def skip(self):
+        return self.page * self.size
+
+    @property
+    def total_mode(self):
+        return self._total_mode
+
+    @total_mode.setter
+    def total_mode(self, val):
+        self._total_mode = val
+
+    @property
+    def probe(self):
+        """
+        When the total is not counted, the page is fetched with one extra element to find out if there's a next page
+        """
+        return self._total_mode != self.TOTAL_EXACT
+
+    @property
+    def limit(self):
+        return self.size + 1 if self.probe else self.size
+
+    @property
+    def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
+
+        return self.last is not None and self.page < self.last
+
+    def after(self, sort=None):
+        """
+        :param sort: requested sort attributes
+        :return: values of the sort attributes after which the page starts (only for keyset paginations)
+        """
+        return None
+
+    def sort(self, sort):
+        """
+        :param sort: requested sort attributes
+        :return: sort attributes to be used when querying the page
+        """
+        return sort
+
+    def set_results(self, results, sort=None):
+        """
+        Lets the pagination inspect the retrieved page
+
+        :param results: list of models in the current page
+        :param sort: sort attributes used when querying the page
+        :return: the page results
+        """
+        if self.probe:
+            self._has_next = len(results) > self.size
+            results = results[:self.size]
+
+        return results
+
+    def iter_results(self, results, sort=None):
+        """
+        Lazy version of set_results for streamed pages, the results are inspected as they are consumed and the
+        pagination info that depends on them (has_next, next cursor) is ready once the iteration is over
+
+        :param results: iterable of models in the current page
+        :param sort: sort attributes used when querying the page
+        """
+        count = 0
+
+        for result in results:
+            if self.probe and count == self.size:
+                self._has_next = True
+                return
+
+            count += 1
+            yield result
+
+        if self.probe:
+            self._has_next = False
+
     @property
     def last(self):
         return self._last_page
@@ -80,3 +192,131 @@ class Pagination(object):
             last = int(ceil(float(total_results) / page_size - 1))
 
         return last
+
+
+class CursorPagination(Pagination):
+
+    """
+    Keyset pagination. Instead of skipping the results of the previous pages, every page carries an opaque
+    cursor (page[after]) built from the sort attributes and the id of its last element, that is translated
+    to a range condition when querying the next page. Retrieving a page costs the same no matter how deep it is.
+
+    The id is always added as the last sort attribute so the order is deterministic.
+
+    Ex:
+       >> curl -GET /api/people?page[size]=20&sort=name
+       >> curl -GET /api/people?page[size]=20&sort=name&page[after]=WyJuYW1lIi...
+    """
+
+    KEYSET = True
+
+    PAGE_AFTER_ARG = 'page[after]'
+    ID_ATTR = '_id'
+
+    REQUEST_ARGS = {
+        'page_size': Pagination.REQUEST_ARGS['page_size'],
+        'page_total': Pagination.REQUEST_ARGS['page_total'],
+        'page_after': fields.Str(load_from=PAGE_AFTER_ARG),
+    }
+
+    def __init__(self,
+                 page_size=Pagination.DEFAULT_SIZE,
+                 after=None,
+                 total_items=None,
+                 resource=None,
+                 params=None,
+                 total_mode=Pagination.TOTAL_EXACT):
+        super().__init__(page_number=Pagination.DEFAULT_NUMBER,
+                         page_size=page_size,
+                         total_items=total_items,
+                         resource=resource,
+                         params=params,
+                         total_mode=total_mode)
+        self._after = after
+        self._next = None
+
+    @classmethod
+    def from_request_args(cls, req_args):
+        return cls(page_size=req_args.get('page_size', cls.DEFAULT_SIZE),
+                   after=req_args.get('page_after'),
+                   total_mode=req_args.get('page_total') or cls.TOTAL_EXACT)
+
+    @staticmethod
+    def encode_cursor(sort, values):
+        cursor = json_util.dumps([sort, values]).encode()
+        return base64.urlsafe_b64encode(cursor).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            sort, values = json_util.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        except Exception:
+            raise InvalidPageCursor("Invalid page cursor '{}'".format(cursor))
+
+        return sort, values
+
+    @staticmethod
+    def _attr_value(doc, attr):
+        value = doc
+        for part in attr.split('.'):
+            value = value.get(part) if isinstance(value, (dict, Mapping)) else None
+
+        return value
+
+    @property
+    def skip(self):
+        return 0
+
+    def after(self, sort=None):
+        if not self._after:
+            return None
+
+        cursor_sort, values = self.decode_cursor(self._after)
+        if cursor_sort != self.sort(sort):
+            raise InvalidPageCursor("Page cursor doesn't match the requested sorting")
+
+        if not isinstance(values, list) or len(values) != len(cursor_sort):
+            raise InvalidPageCursor("Page cursor values don't match its sorting")
+
+        return values
+
+    @property
+    def cursor(self):
+        return self._after
+
+    @property
+    def next(self):
+        return self._next
+
+    def sort(self, sort):
+        sort = list(sort or [])
+        if not any(s.lstrip('<>') == self.ID_ATTR for s in sort):
+            sort.append(self.ID_ATTR)
+
+        return sort
+
+    @property
+    def probe(self):
+        # The position of the page is unknown, so the only way to know if there's a next one is to look for it
+        return True
+
+    def set_results(self, results, sort=None):
+        sort = self.sort(sort)
+        results = super().set_results(results, sort)
+
+        if self.has_next:
+            last = results[-1]
+            self._next = self.encode_cursor(sort, [self._attr_value(last, s.lstrip('<>')) for s in sort])
+
+        return results
+
+    def iter_results(self, results, sort=None):
+        sort = self.sort(sort)
+        last = None
+
+        for result in super().iter_results(results, sort):
+            last = result
+            yield result
+
+        if self.has_next:
+            self._next = self.encode_cursor(sort, [self._attr_value(last, s.lstrip('<>')) for s in sort])
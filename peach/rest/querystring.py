@@ -0,0 +1,134 @@
+from marshmallow import ValidationError, fields as ma_fields
+from webargs import fields
+from webargs.core import missing, get_value, is_multiple
+
+
+# Where the query string arguments can be declared, anything else needs webargs
+QUERY_LOCATIONS = (None, 'query', 'querystring')
+
+
+def fast_converter(field):
+    """
+    :return: function that converts a query string value the way the field would, raising any exception when it
+             can't (the field then takes care of it and gives the usual error). None if the field has no fast
+             conversion
+    """
+    if field.validators:
+        return None
+
+    if type(field) is ma_fields.String:
+        def convert(value):
+            if value.__class__ is not str:
+                raise TypeError
+            return value
+
+        return convert
+
+    if type(field) is ma_fields.Integer:
+        return int
+
+    if type(field) is fields.DelimitedList:
+        inner = fast_converter(field.container)
+        if inner is None:
+            return None
+
+        delimiter = field.delimiter
+        return lambda value: [inner(v) for v in value.split(delimiter)]
+
+    return None
+
+
+class QueryStringParser(object):
+
+    """
+    Parses the query string arguments of a resource (see BaseResource.compile_request_args) without going through
+    webargs and the marshmallow schema: strings, integers and delimited lists of them are converted directly,
+    other fields are deserialized by themselves. Results and errors are the ones the webargs schema gives, with
+    the only difference that the arguments are only read from the query string
+
+    Ex:
+       >> parser = QueryStringParser.build(PeopleResource.compile_request_args(Pagination).args)
+       >> parser.parse({'filter[age]': '22', 'sort': '<name'})
+       {'age': 22, 'sort': ['<name']}
+    """
+
+    def __init__(self, args):
+        self._args = [(field.load_from or name, name, field, fast_converter(field), is_multiple(field))
+                      for name, field in args.items() if not field.dump_only]
+
+    @classmethod
+    def build(cls, args):
+        """
+        :return: QueryStringParser for the arguments, None if any of them isn't read from the query string
+        """
+        if any(f.metadata.get('location') not in QUERY_LOCATIONS for f in args.values()):
+            return None
+
+        return cls(args)
+
+    def parse(self, params):
+        """
+        :param params: mapping with the query string arguments (the ones of the request parsed by the framework)
+        :return: dict with the values by argument name
+        :raise ValidationError: with the messages by query string argument, like webargs
+        """
+        parsed = {}
+        errors = {}
+
+        for key, name, field, convert, multiple in self._args:
+            value = get_value(params, key, field) if multiple else params.get(key, missing)
+
+            if value is missing:
+                if field.required:
+                    errors[key] = [field.error_messages['required']]
+                elif field.missing is not missing:
+                    parsed[name] = field.missing() if callable(field.missing) else field.missing
+
+                continue
+
+            if convert is not None:
+                try:
+                    parsed[name] = convert(value)
+                    continue
+                except Exception:
+                    pass
+
+            try:
+                parsed[name] = field.deserialize(value)
+            except ValidationError as e:
+                errors[key] = e.messages
+
+        if errors:
+            raise ValidationError(errors)
+
+        return parsed
+
+
+class QueryStringParsing(object):
+
+    """
+    RequestHelper mixin that parses the arguments with the QueryStringParser of the resource instead of webargs,
+    which is still used when the arguments need it. Helpers give the parsed query string (query_params) and the
+    webargs parser that reports the errors (webargs_parser), so invalid arguments get the usual error response
+    """
+
+    def query_params(self, request):
+        raise NotImplementedError
+
+    @property
+    def webargs_parser(self):
+        raise NotImplementedError
+
+    def parse_args(self, request, request_args):
+        parser = request_args.querystring_parser
+        if parser is None:
+            return super().parse_args(request, request_args)
+
+        try:
+            return parser.parse(self.query_params(request))
+        except ValidationError as e:
+            # same handler webargs calls with its validation errors
+            webargs_parser = self.webargs_parser
+            handle_error = webargs_parser.error_callback or webargs_parser.handle_error
+            handle_error(e, request, request_args.schema(),
+                         error_status_code=webargs_parser.DEFAULT_VALIDATION_STATUS, error_headers=None)
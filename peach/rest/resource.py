@@ -1,21 +1,88 @@
+import itertools
+import threading
 from webargs import fields
+from webargs.core import dict2schema
 from datetime import datetime
-from peach.utils import ObjectDict
+from collections import Counter
+from peach.utils import ObjectDict, load_resource_class
+from peach.database.loader import ModelLoader
+from peach.database.proxy import QueryTimeout, id_candidates
 from .response import ResponseDocumentFactory
 from .base_api import ApiException
+from .pagination import InvalidPageCursor
+from .tracing import RequestTracer, stage
+from .encoders import load_encoder
+from .querystring import QueryStringParser
 
 
 class InvalidDocumentException(ApiException):
     status = 409
 
 
+class InvalidRequestException(ApiException):
+    status = 400
+
+
+class QueryTimeoutException(ApiException):
+    status = 504
+
+
+# Amount of queries that went over their time limit by (resource, filters), to spot the offending filters
+query_overruns = Counter()
+
+
+class RequestArgs(object):
+
+    """
+    Arguments a resource class accepts and the filters they map to, see BaseResource.compile_request_args.
+    The webargs schema and the query string parser are built from them once, the schema instances keep state
+    while loading so they are only reused within a thread
+    """
+
+    def __init__(self, args, filters):
+        self.args = args
+        self.filters = filters
+        self.schema_class = dict2schema(args)
+        self.querystring_parser = QueryStringParser.build(args)
+        self._local = threading.local()
+
+    def schema(self):
+        """
+        :return: schema instance of the current thread, to be given to the request parser
+        """
+        schema = getattr(self._local, 'schema', None)
+        if schema is None:
+            schema = self._local.schema = self.schema_class()
+
+        return schema
+
+
 class RequestHelper(object):
 
+    LOADER_CLASS = ModelLoader
+
     def __init__(self):
         self._req = None
         self._parsed_args = None
+        self._loaders = (None, {})
 
-    def parse(self, request, supported_args):
+    def loader(self, model):
+        """
+        :return: batch loader of the model for the current request (see peach.database.loader)
+        """
+        req, loaders = self._loaders
+        if req is not self._req:
+            self._loaders = req, loaders = self._req, {}
+
+        if model not in loaders:
+            loaders[model] = self.LOADER_CLASS(model)
+
+        return loaders[model]
+
+    def parse(self, request, request_args):
+        """
+        :param request_args: RequestArgs of the resource
+        """
         raise NotImplementedError
 
     @property
@@ -63,9 +130,27 @@ class BaseResource(object):
     serializer = None
     filters = []
 
+    # Default way of obtaining the total amount of items when paginating (see Pagination.TOTAL_*), the
+    # request can ask for a different one with page[total]
+    total_mode = None
+
+    # Listings are streamed: the elements are read from the cursor, serialized and sent as they arrive instead
+    # of building the whole page in memory. The meta and links members are sent after the data
+    stream = False
+
+    # Request helpers by name of the parser they use, the api picks one with its 'parser' entry: 'webargs' by
+    # default, 'querystring' to parse the query string without webargs (see peach.rest.querystring)
+    REQUEST_HELPERS = {}
+    DEFAULT_PARSER = 'webargs'
+
+    # Query options that can be set per endpoint in the api config ('query' entry)
+    QUERY_OPTIONS = ('max_time_ms', 'batch_size', 'read')
+
     SORT_ARG = 'sort'
     FILTER_ARG = 'filter[{}]'
+    FIELDS_ARG = 'fields[{}]'
 
+    # Arguments accepted on top of the pagination, sparse fields and filter ones (see compile_request_args)
     REQUEST_ARGS = {
         'sort': fields.DelimitedList(fields.Str(), load_from=SORT_ARG, location='query')
     }
@@ -76,14 +161,60 @@ class BaseResource(object):
         self._db = kwargs.get('database')
         self._pagination_class = kwargs.get('pagination')
         self._response_factory = kwargs.get('response_factory')
+        self._query_options = {k: v for k, v in (kwargs.get('query') or {}).items() if k in self.QUERY_OPTIONS}
+        self._endpoint = kwargs.get('endpoint') or self.__class__.__name__
+        self._tracing = kwargs.get('tracing', False)
+        self._encoder = kwargs.get('encoder') or load_encoder()
+        self._request_args = self.compile_request_args(self._pagination_class)
+
+    @classmethod
+    def request_helper(cls, parser=None):
+        """
+        :param parser: name of the parser (see REQUEST_HELPERS) or path to a RequestHelper class
+        :return: RequestHelper instance
+        """
+        helper_class = cls.REQUEST_HELPERS.get(parser or cls.DEFAULT_PARSER) or load_resource_class(parser)
+        if helper_class is None:
+            raise ValueError("Unknown request parser '{}'".format(parser))
+
+        return helper_class()
+
+    @classmethod
+    def compile_request_args(cls, pagination_class):
+        """
+        Builds the arguments the resource accepts: the declared REQUEST_ARGS plus the pagination, sparse fields
+        and filter ones. It's done once per resource class and pagination class, when the api registers the
+        endpoints, so handling a request only takes parsing them
+
+        :return: RequestArgs
+        """
+        compiled = cls.__dict__.get('_compiled_request_args')
+        if compiled is None:
+            compiled = cls._compiled_request_args = {}
 
-        self.REQUEST_ARGS.update(self._pagination_class.REQUEST_ARGS)
+        if pagination_class not in compiled:
+            args = dict(cls.REQUEST_ARGS)
+            args.update(pagination_class.REQUEST_ARGS)
+            args['fields'] = fields.DelimitedList(fields.Str(),
+                                                  load_from=cls.FIELDS_ARG.format(cls.type_name()),
+                                                  location='query')
 
-        for filter_cls in self.filters:
-            filter_user_name = self.FILTER_ARG.format(filter_cls.name.replace('_', '-'))
-            self.REQUEST_ARGS[filter_cls.name] = self.filter_value_type_to_request_arg_type(filter_user_name,
-                                                                                            filter_cls.value_type,
-                                                                                            filter_cls.allow_multiple)
+            for filter_cls in cls.filters:
+                filter_user_name = cls.FILTER_ARG.format(filter_cls.name.replace('_', '-'))
+                args[filter_cls.name] = cls.filter_value_type_to_request_arg_type(filter_user_name,
+                                                                                  filter_cls.value_type,
+                                                                                  filter_cls.allow_multiple)
+
+            compiled[pagination_class] = RequestArgs(args, {f.name: f for f in cls.filters})
+
+        return compiled[pagination_class]
+
+    @property
+    def request_args(self):
+        """
+        :return: RequestArgs of the resource, what the request helper parses
+        """
+        return self._request_args
 
     @staticmethod
     def filter_value_type_to_request_arg_type(name, value_type, allow_multiple, load_from=None):
@@ -105,15 +236,116 @@ class BaseResource(object):
 
     @property
     def pagination(self):
-        return self._pagination_class.from_request_args(self._request_helper.args)
+        pagination = self._pagination_class.from_request_args(self._request_helper.args)
+
+        if self.total_mode and not self._request_helper.args.get('page_total'):
+            pagination.total_mode = self.total_mode
+
+        return pagination
+
+    @classmethod
+    def type_name(cls):
+        """
+        Name used to refer to the resource on sparse fieldsets, ex: /api/people?fields[people]=name,age
+        """
+        return cls.model.type or cls.model.__name__.lower()
+
+    @property
+    def resource_type(self):
+        return self.type_name()
+
+    @property
+    def encoder(self):
+        """
+        :return: JSONEncoder of the api (see peach.rest.encoders)
+        """
+        return self._encoder
+
+    def tracer(self):
+        """
+        :return: RequestTracer for the request being handled, None when the api doesn't trace requests
+        """
+        return RequestTracer(self._endpoint) if self._tracing else None
+
+    def loader(self, model=None):
+        """
+        :param model: model to load, the resource model if not specified
+        :return: loader that batches the by id lookups done while handling the current request
+        """
+        return self._request_helper.loader(model or self.model)
 
     @property
     def sort_param(self):
         return self._request_helper.args.get('sort')
 
+    @property
+    def requested_fields(self):
+        """
+        :return: serializer fields requested by the client, None if all of them should be returned
+        """
+        requested = self._request_helper.args.get('fields')
+        if not requested:
+            return None
+
+        unknown = set(requested) - set(self.serializer.field_names())
+        if unknown:
+            raise InvalidRequestException(title="Invalid fields",
+                                          detail="Unknown fields for '{}': {}".format(self.resource_type,
+                                                                                      ', '.join(sorted(unknown))))
+
+        return requested
+
+    @property
+    def requested_attributes(self):
+        """
+        :return: model attributes needed for the requested fields, None if all of them are needed
+        """
+        requested_fields = self.requested_fields
+        return self.serializer.attributes(requested_fields) if requested_fields else None
+
+    def page_params(self, pagination):
+        """
+        :param pagination: pagination object
+        :return: the sort, skip, limit, after and fields parameters to query the requested page
+        """
+        sort = pagination.sort(self.sort_param)
+
+        try:
+            after = pagination.after(sort)
+        except InvalidPageCursor as e:
+            raise InvalidRequestException(title="Invalid page cursor", detail=str(e))
+
+        # Only the requested fields are retrieved, plus the ones needed to sort and build page cursors
+        attributes = self.requested_attributes
+
+        if attributes:
+            attributes += [s.lstrip('<>') for s in sort or [] if s.lstrip('<>') not in attributes]
+
+        return ObjectDict(sort=sort,
+                          skip=pagination.skip,
+                          limit=pagination.limit,
+                          after=after,
+                          fields=attributes,
+                          **self._query_options)
+
+    @property
+    def count_options(self):
+        return {k: v for k, v in self._query_options.items() if k in ('max_time_ms', 'read')}
+
+    def query_timeout(self, error, filters=None):
+        """
+        Counts the overrun and builds the error response for a query that exceeded its time limit
+        """
+        filter_names = tuple(sorted(filters or []))
+        query_overruns[(self.__class__.__name__, filter_names)] += 1
+
+        exception = QueryTimeoutException(title="Query timeout", detail=str(error))
+        exception.meta = {'filters': list(filter_names), 'max-time-ms': self._query_options.get('max_time_ms')}
+        return exception
+
     @property
     def requested_filters(self):
-        filters_by_name = {f.name: f for f in self.filters}
+        filters_by_name = self._request_args.filters
 
         return ObjectDict(**{
             k: ObjectDict(**{
@@ -135,93 +367,183 @@ class BaseResource(object):
         pagination = self.pagination
         filters = self.requested_filters
 
-        if ids:
-            data = self.get_by_ids(ids)
+        try:
+            if ids:
+                with stage('db'):
+                    data = self.get_by_ids(ids)
 
-        elif filters:
-            data, total_count = self.get_by_filters(filters, pagination)
-            pagination.total = total_count
-            data, errors = self.serializer.serialize(data, many=True)
+            else:
+                page_params = self.page_params(pagination)
 
-        else:
-            data = self.get_all(pagination)
-            pagination.total = self.get_all_count()
+                if self.stream:
+                    return self.stream_page(filters, pagination, page_params), 200
 
-        data, errors = self.serializer.serialize(data, many=True)
+                with stage('db'):
+                    if filters:
+                        data, total_count = self.get_by_filters(filters, pagination, page_params)
+                    else:
+                        data, total_count = self.get_all(pagination, page_params)
 
-        return self.build_response(data=data, meta=meta, pagination=pagination).data(), 200
+                pagination.total = total_count
+                data = pagination.set_results(data, page_params.sort)
 
-    def get_by_ids(self, ids):
-        return list(self.model.by_id(ids[0]))
+        except QueryTimeout as e:
+            raise self.query_timeout(e, filters)
 
-    def get_all(self, pagination):
-        return list(self.model.all(
-            sort=self.sort_param,
-            skip=pagination.page * pagination.size,
-            limit=pagination.size))
+        with stage('serialize'):
+            data, errors = self.serializer.serialize(data, filters=self.requested_fields, many=True)
 
-    def get_all_count(self):
-        return self.model.count()
+        with stage('document'):
+            return self.build_response(data=data, meta=meta, pagination=pagination).data(), 200
 
-    def get_by_filters(self, filters, pagination):
+    def stream_page(self, filters, pagination, page_params=None):
         """
-        Gets all the entries that satisfy the specified filters. If multiple filters are defined,
-        then only those entries that satisfy every single filter will be retrieved. In order words
-        multiple filters are combined as an AND concatenation
+        :param page_params: query parameters of the page (see page_params), built from the pagination if not given
+        :return: StreamingDataDocument with the requested page
+        """
+        page_params = page_params or self.page_params(pagination)
 
-        :param filters: dict containing the specified filters
+        with stage('db'):
+            if pagination.total_mode == pagination.TOTAL_EXACT:
+                pagination.total = self.count_by_filters(filters, page_params)
+
+            elif pagination.total_mode == pagination.TOTAL_ESTIMATED and not filters:
+                pagination.total = self.model.estimated_count()
+
+            # The first element is read before answering, so a query that times out still gets an error response
+            results = iter(self.find_by_filters(filters, page_params))
+            first = next(results, None)
+
+        results = itertools.chain([first], results) if first is not None else results
+        data = pagination.iter_results(results, page_params.sort)
+        endpoint = self._request_helper.base_url.replace(self._api_prefix, '')
+
+        def timeout_error(error):
+            # the query can still time out later, when the cursor gets more elements
+            return self.query_timeout(error, filters).data if isinstance(error, QueryTimeout) else None
+
+        return ResponseDocumentFactory.stream_response(endpoint,
+                                                       self._request_helper.base_url,
+                                                       self._request_helper.querystring,
+                                                       data=self.serializer.iter_serialize(data, self.requested_fields),
+                                                       pagination=pagination,
+                                                       encoder=self._encoder,
+                                                       error_handler=timeout_error)
+
+    def get_by_ids(self, ids):
+        """
+        :param ids: comma separated ids
+        :return: list with the elements found, in the requested order
+        """
+        return self.loader().load_many(ids.split(','))
+
+    def get_all(self, pagination, page_params=None):
+        """
         :param pagination: pagination object
-        :return: filtered result
+        :param page_params: query parameters of the page, built from the pagination if not given
+        :return: tuple with the requested page and the total count (None if the pagination doesn't count)
         """
-        if len(filters) > 1:
-            condition = {}
-            for filter_def in filters.values():
-                filter_class = filter_def.filter_cls
+        page_params = page_params or self.page_params(pagination)
 
-                if filter_class.allow_multiple:
-                    condition.update(filter_class.condition(*filter_def.value))
+        if pagination.total_mode == pagination.TOTAL_EXACT:
+            return self.model.find_with_count({}, **page_params)
 
-                else:
-                    condition.update(filter_class.condition(filter_def.value))
+        data = list(self.model.find({}, **page_params))
+        total_count = self.model.estimated_count() if pagination.total_mode == pagination.TOTAL_ESTIMATED else None
 
-            total_count = self.model.count(condition)
-            data = list(self.model.find(condition,
-                                        sort=self.sort_param,
-                                        skip=pagination.page * pagination.size,
-                                        limit=pagination.size))
+        return data, total_count
 
-        else:
-            filter_def = list(filters.values())[0]
+    @staticmethod
+    def filters_condition(filters):
+        """
+        :param filters: dict containing the specified filters
+        :return: the AND concatenation of the filter conditions. Conditions on the same keys (like the '$or' of
+                 multi term searches) go in an '$and' instead of overwriting each other
+        """
+        condition = {}
+        for filter_def in filters.values():
             filter_class = filter_def.filter_cls
 
             if filter_class.allow_multiple:
-                total_count = filter_class.count(self.model, *filter_def.value)
-                data = list(filter_class.apply(self.model,
-                                               *filter_def.value,
-                                               sort=self.sort_param,
-                                               skip=pagination.page * pagination.size,
-                                               limit=pagination.size))
+                filter_condition = filter_class.condition(*filter_def.value)
 
             else:
-                total_count = filter_class.count(self.model, filter_def.value)
-                data = list(filter_class.apply(self.model,
-                                               filter_def.value,
-                                               sort=self.sort_param,
-                                               skip=pagination.page * pagination.size,
-                                               limit=pagination.size))
+                filter_condition = filter_class.condition(filter_def.value)
 
-        return data, total_count
+            if any(k in condition for k in filter_condition):
+                condition['$and'] = condition.get('$and', []) + [filter_condition]
+
+            else:
+                condition.update(filter_condition)
+
+        return condition
+
+    @staticmethod
+    def single_filter(filters):
+        """
+        :return: tuple (filter class, values to apply it with) of the only requested filter
+        """
+        filter_def = list(filters.values())[0]
+        filter_class = filter_def.filter_cls
+        return filter_class, filter_def.value if filter_class.allow_multiple else [filter_def.value]
+
+    def find_by_filters(self, filters, page_params):
+        """
+        A single filter is applied by its class (see BaseFilter.apply), several ones are combined by their conditions
+
+        :return: iterator of the elements of the page that satisfy the filters
+        """
+        if len(filters) == 1:
+            filter_class, values = self.single_filter(filters)
+            return filter_class.apply(self.model, *values, **page_params)
+
+        return self.model.find(self.filters_condition(filters), **page_params)
+
+    def count_by_filters(self, filters, page_params):
+        """
+        :return: amount of elements that satisfy the filters, see find_by_filters
+        """
+        if len(filters) == 1:
+            filter_class, values = self.single_filter(filters)
+            return filter_class.count(self.model, *values, **page_params)
+
+        return self.model.count(self.filters_condition(filters), **self.count_options)
+
+    def get_by_filters(self, filters, pagination, page_params=None):
+        """
+        Gets all the entries that satisfy the specified filters. If multiple filters are defined,
+        then only those entries that satisfy every single filter will be retrieved. In order words
+        multiple filters are combined as an AND concatenation
+
+        :param filters: dict containing the specified filters
+        :param pagination: pagination object
+        :param page_params: query parameters of the page, built from the pagination if not given
+        :return: tuple with the filtered result and the total count (None if the pagination doesn't count)
+        """
+        page_params = page_params or self.page_params(pagination)
+
+        if pagination.total_mode != pagination.TOTAL_EXACT:
+            return list(self.find_by_filters(filters, page_params)), None
+
+        if len(filters) == 1:
+            filter_class, values = self.single_filter(filters)
+            return filter_class.apply_with_count(self.model, *values, **page_params)
+
+        return self.model.find_with_count(self.filters_condition(filters), **page_params)
 
     def post(self):
-        new_item, errors = self.serializer.deserialize(self._request_helper.json)
+        with stage('serialize'):
+            new_item, errors = self.serializer.deserialize(self._request_helper.json)
         if errors:
             raise InvalidDocumentException(title="Invalid document", detail=errors)
 
-        self.model.add(new_item)
+        with stage('db'):
+            self.model.add(new_item)
         return {}, 201
 
     def delete(self, ids):
-        self.model.delete(*ids.split(','))
+        with stage('db'):
+            self.model.delete(*id_candidates(ids.split(',')))
         return {}, 204
 
 
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 import re
 import urllib
+from .encoders import load_encoder
 
 
 class JSONDocumentError(Exception):
@@ -21,6 +22,24 @@ class ResponseDocumentFactory(object):
                       **kwargs):
         return DataDocument(endpoint, request_base_url, request_query_string, data, meta, links, pagination, **kwargs)
 
+    @staticmethod
+    def stream_response(endpoint,
+                        request_base_url,
+                        request_query_string,
+                        data=None,
+                        meta=None,
+                        links=None,
+                        pagination=None,
+                        **kwargs):
+        return StreamingDataDocument(endpoint,
+                                     request_base_url,
+                                     request_query_string,
+                                     data,
+                                     meta,
+                                     links,
+                                     pagination,
+                                     **kwargs)
+
 
 class JSONDocument(object):
 
@@ -63,18 +82,28 @@ class DataDocument(JSONDocument):
 
     def _build_pagination(self, pagination):
         pag_info = {
-            'pagination': {
-                'total-items': pagination.total,
-                'current-page': pagination.page
-            }
+            'pagination': {}
         }
 
+        if pagination.total is not None:
+            pag_info['pagination']['total-items'] = pagination.total
+
+            if pagination.total_mode == pagination.TOTAL_ESTIMATED:
+                pag_info['pagination']['estimated-total'] = True
+
+        # Keyset paginations don't have page numbers
+        if not pagination.KEYSET:
+            pag_info['pagination']['current-page'] = pagination.page
+
         if pagination.last is not None:
             pag_info['pagination']['page-count'] = pagination.last + 1  # counters/indexes are zero based
 
         return pag_info
 
     def _build_pagination_links(self, endpoint, request_base_url, request_querystring, pagination):
+        if pagination.KEYSET:
+            return self._build_cursor_pagination_links(request_base_url, request_querystring, pagination)
+
         pagination_links = {}
 
         def _set_pagination_param(base_url, querystring, page_number):
@@ -104,18 +133,41 @@ class DataDocument(JSONDocument):
                                                                       request_querystring,
                                                                       pagination.page - 1)
 
-        if pagination.page < pagination.last:
+        if pagination.has_next:
             pagination_links['next-page'] = _set_pagination_param(request_base_url,
                                                                   request_querystring,
                                                                   pagination.page + 1)
 
-        if pagination.page != pagination.last:
+        # Without a total there's no way to know which is the last page
+        if pagination.last is not None and pagination.page != pagination.last:
             pagination_links['last-page'] = _set_pagination_param(request_base_url,
                                                                   request_querystring,
                                                                   pagination.last)
 
         return pagination_links
 
+    def _build_cursor_pagination_links(self, request_base_url, request_querystring, pagination):
+        pagination_links = {}
+
+        def _set_cursor_param(base_url, querystring, cursor):
+            # Drop the current cursor and page size, they are added back with the new values
+            replaced_params = (pagination.PAGE_AFTER_ARG + '=', pagination.PAGE_SIZE_ARG + '=')
+            params = [p for p in querystring.split('&') if p and not p.startswith(replaced_params)]
+            params.append('{}={}'.format(pagination.PAGE_SIZE_ARG, pagination.size))
+
+            if cursor:
+                params.append('{}={}'.format(pagination.PAGE_AFTER_ARG, cursor))
+
+            return base_url + '?' + urllib.parse.quote_plus('&'.join(params))
+
+        if pagination.cursor:
+            pagination_links['first-page'] = _set_cursor_param(request_base_url, request_querystring, None)
+
+        if pagination.next:
+            pagination_links['next-page'] = _set_cursor_param(request_base_url, request_querystring, pagination.next)
+
+        return pagination_links
+
     def add_data(self, data):
         self._data.append(data)
 
@@ -123,3 +175,96 @@ class DataDocument(JSONDocument):
         json_data = super().data()
         json_data['data'] = self._data
         return json_data
+
+
+class StreamingDataDocument(DataDocument):
+
+    """
+    Data document encoded while it is being sent. The data is an iterable of serialized elements that is
+    consumed lazily, and since the pagination info depends on the page results (next page, cursor) the meta
+    and links members are written after the data
+
+    Errors raised while the data is consumed can't change the response anymore, the error_handler turns them
+    into an error object that ends the document in an 'errors' member instead of the meta and links
+
+    Ex:
+       >> for chunk in document.chunks():
+       >>     socket.send(chunk)
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self,
+                 endpoint,
+                 request_base_url,
+                 request_query_string,
+                 data=None,
+                 meta=None,
+                 links=None,
+                 pagination=None,
+                 chunk_size=None,
+                 encoder=None,
+                 error_handler=None,
+                 **kwargs):
+        """
+        :param error_handler: function receiving the exception raised while consuming the data, returning the
+                              error object to send or None to raise it again
+        """
+        super().__init__(endpoint, request_base_url, request_query_string, meta=meta, links=links, **kwargs)
+        self._data = data if data is not None else []
+        self._endpoint = endpoint
+        self._request_base_url = request_base_url
+        self._request_query_string = request_query_string
+        self._pagination = pagination
+        self._chunk_size = chunk_size or self.CHUNK_SIZE
+        self._encoder = encoder or load_encoder()
+        self._error_handler = error_handler
+
+    def encode(self, value):
+        return self._encoder.encode(value)
+
+    def _trailer(self):
+        if self._pagination:
+            self._meta.update(self._build_pagination(self._pagination))
+            self._links.update(self._build_pagination_links(self._endpoint,
+                                                            self._request_base_url,
+                                                            self._request_query_string,
+                                                            self._pagination))
+
+        return JSONDocument.data(self)
+
+    def chunks(self):
+        """
+        :return: generator of the encoded document in utf-8 chunks of about chunk_size bytes
+        """
+        buffer = [b'{"data":[']
+        buffered = 0
+
+        try:
+            for i, item in enumerate(self._data):
+                encoded = self.encode(item)
+                buffer.append(b',' + encoded if i else encoded)
+                buffered += len(encoded)
+
+                if buffered >= self._chunk_size:
+                    yield b''.join(buffer)
+                    buffer, buffered = [], 0
+
+            trailer = self._trailer()
+
+        except Exception as e:
+            error = self._error_handler(e) if self._error_handler else None
+            if error is None:
+                raise
+
+            trailer = {'errors': [error]}
+
+        buffer.append(b']')
+        for key, value in trailer.items():
+            buffer.append(b',' + self.encode(key) + b':' + self.encode(value))
+
+        buffer.append(b'}')
+        yield b''.join(buffer)
+
+    def __iter__(self):
+        return self.chunks()
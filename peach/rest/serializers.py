@@ -1,22 +1,246 @@
-from marshmallow import Schema, fields, post_load
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from collections.abc import Mapping
+from marshmallow import Schema, fields, post_load, utils
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+
+
+# Marshmallow schemas keep state while dumping and loading, so instances are only reused within a thread
+_schemas = threading.local()
+
+# Schemas and dumpers are cached by the requested fields, which come from the clients, so only the most recently
+# used ones are kept
+MAX_CACHED_FIELDSETS = 128
+
+# What the compiled dumpers raise for the values they can't convert, marshmallow takes care of those
+DUMP_ERRORS = (TypeError, ValueError)
+
+# How the compiled dumpers read the elements of each class, see mapping_reader
+_readers = {}
+
+
+# Fields whose serialization the compiled dumpers reproduce, and the expression that does it
+FAST_FIELDS = {
+    fields.String: 'v if v.__class__ is str else None if v is None else ensure_text_type(v)',
+    fields.Integer: 'None if v is None else int(v)',
+    fields.Float: 'None if v is None else float(v)',
+    fields.Boolean: 'None if v is None else True if v in truthy_{i} else False if v in falsy_{i} else bool(v)',
+    fields.Raw: 'v'
+}
+
+
+def mapping_reader(cls):
+    """
+    Tells the compiled dumpers how to read the elements of a class: compact models keep their fields in slots,
+    reading them as attributes skips __getitem__, and lazy models decode their fields once into a dict
+
+    :return: tuple (whether to read the decoded fields, names of the slotted fields)
+    """
+    if issubclass(cls, dict):
+        reader = (False, ())
+    elif hasattr(cls, '_decoded'):
+        reader = (True, ())
+    elif isinstance(getattr(cls, '_field_set', None), frozenset):
+        reader = (False, cls._field_set)
+    elif issubclass(cls, Mapping):
+        reader = (False, ())
+    else:
+        raise TypeError("Only mappings can be dumped")
+
+    _readers[cls] = reader
+    return reader
+
+
+@lru_cache(maxsize=MAX_CACHED_FIELDSETS)
+def cached_dumper(serializer, only):
+    """
+    :return: compiled dumper of the serializer for the given fields, None if it can't be compiled
+    """
+    return compile_dumper(serializer.schema(only=only))
+
+
+def compile_dumper(schema):
+    """
+    Generates a function that serializes a dict the same way the schema does, without marshmallow's per field
+    dispatch. Only plain fields (see FAST_FIELDS) of schemas without dump processors or custom accessors are
+    supported, any other schema gets None
+
+    :param schema: schema instance, already restricted to the fields to dump (only)
+    :return: function receiving the element (a dict or any mapping) and returning its serialization
+    """
+    if schema.__processors__.get((PRE_DUMP, False)) or schema.__processors__.get((PRE_DUMP, True)) or \
+            schema.__processors__.get((POST_DUMP, False)) or schema.__processors__.get((POST_DUMP, True)):
+        return None
+
+    if type(schema).get_attribute is not Schema.get_attribute or schema.__accessor__ is not None:
+        return None
+
+    if schema.opts.fields or schema.opts.additional or schema.extra or schema.prefix:
+        return None
+
+    namespace = {'missing': utils.missing, 'get_value': utils.get_value, 'ensure_text_type': utils.ensure_text_type,
+                 'readers': _readers, 'mapping_reader': mapping_reader}
+    lines = ['def dump(obj):',
+             '    if obj.__class__ is dict:',
+             '        slotted = ()',
+             '    else:',
+             '        decoded, slotted = readers.get(obj.__class__) or mapping_reader(obj.__class__)',
+             '        if decoded:',
+             '            obj = obj._decoded()',
+             '    out = {}']
+
+    for i, (name, field) in enumerate(schema.fields.items()):
+        if field.load_only:
+            continue
+
+        attribute = field.attribute or name
+        expression = FAST_FIELDS.get(type(field))
+
+        if expression is None or '.' in attribute or getattr(field, 'as_string', False):
+            return None
+
+        namespace['truthy_{}'.format(i)] = getattr(field, 'truthy', None)
+        namespace['falsy_{}'.format(i)] = getattr(field, 'falsy', None)
+        namespace['default_{}'.format(i)] = field.default
+        key = field.dump_to or name
+
+        lines += ['    if {!r} in slotted:'.format(attribute),
+                  '        v = getattr(obj, {!r}, missing)'.format(attribute),
+                  '    else:',
+                  '        try:',
+                  '            v = obj[{!r}]'.format(attribute),
+                  '        except KeyError:',
+                  '            v = get_value({!r}, obj, missing)'.format(attribute),
+                  '    if v is not missing:',
+                  '        out[{!r}] = {}'.format(key, expression.format(i=i))]
+
+        if field.default is not utils.missing:
+            lines += ['    else:',
+                      '        out[{!r}] = default_{}{}'.format(key, i, '()' if callable(field.default) else '')]
+
+    lines.append('    return out')
+
+    exec(compile('\n'.join(lines), '<{} dumper>'.format(type(schema).__name__), 'exec'), namespace)
+    return namespace['dump']
 
 
 class ModelSerializer(Schema):
 
+    """
+    Schema instances are cached by (many, only) and, when all the fields are plain ones, elements are dumped
+    with a compiled function instead of going through marshmallow (see compile_dumper). Set fast_dump to False
+    to always use marshmallow
+    """
+
     model = None
+    fast_dump = True
+
+    @classmethod
+    def schema(cls, many=False, only=None):
+        """
+        :param only: fields to dump, all of them if not specified
+        :return: cached schema instance of the current thread
+        """
+        cache = getattr(_schemas, 'cache', None)
+        if cache is None:
+            cache = _schemas.cache = OrderedDict()
+
+        key = (cls, many, only)
+        schema = cache.get(key)
+
+        if schema is None:
+            schema = cache[key] = cls(many=many, only=only)
+            if len(cache) > MAX_CACHED_FIELDSETS:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+
+        return schema
+
+    @classmethod
+    def dumper(cls, only=None):
+        """
+        :return: compiled dumper for the given fields, None if the serializer can't be compiled
+        """
+        return cached_dumper(cls, only) if cls.fast_dump else None
+
+    @staticmethod
+    def _only(filters):
+        return tuple(sorted(set(filters))) if filters else None
 
     @classmethod
     def serialize(cls, data, filters=None, many=False):
-        ser_params = {'many': many}
-        if filters:
-            ser_params['only'] = tuple(f for f in filters)
+        only = cls._only(filters)
+        dumper = cls.dumper(only)
+
+        if dumper is None:
+            serialization = cls.schema(many=many, only=only).dump(data)
+            return serialization.data, serialization.errors
+
+        if not many:
+            return cls._dump(dumper, cls.schema(only=only), data)
 
-        serialization = cls(**ser_params).dump(data)
-        return serialization.data, serialization.errors
+        if not isinstance(data, list):
+            data = list(data)
+
+        try:
+            return [dumper(item) for item in data], {}
+        except DUMP_ERRORS:
+            pass
+
+        # only the elements the compiled dumper can't handle go through marshmallow
+        schema = cls.schema(only=only)
+        serialized = []
+        errors = {}
+
+        for i, item in enumerate(data):
+            item_data, item_errors = cls._dump(dumper, schema, item)
+            serialized.append(item_data)
+            if item_errors:
+                errors[i] = item_errors
+
+        return serialized, errors
+
+    @staticmethod
+    def _dump(dumper, schema, item):
+        """
+        :return: tuple (serialization, errors) of the element, dumped by marshmallow when the dumper can't
+        """
+        try:
+            return dumper(item), {}
+        except DUMP_ERRORS:
+            serialization = schema.dump(item)
+            return serialization.data, serialization.errors
+
+    @classmethod
+    def iter_serialize(cls, data, filters=None):
+        """
+        Lazily serializes every element of the iterable with the same schema instance
+        """
+        only = cls._only(filters)
+        dumper = cls.dumper(only)
+        schema = cls.schema(only=only)
+
+        for item in data:
+            yield cls._dump(dumper, schema, item)[0] if dumper is not None else schema.dump(item).data
+
+    @classmethod
+    def field_names(cls):
+        return list(cls._declared_fields.keys())
+
+    @classmethod
+    def attributes(cls, field_names=None):
+        """
+        :param field_names: serializer fields, all of them if not specified
+        :return: names of the model attributes read by the given fields
+        """
+        declared = cls._declared_fields
+        return [declared[f].attribute or f for f in (field_names or declared.keys())]
 
     @classmethod
     def deserialize(cls, data):
-        deserialization = cls().load(data)
+        deserialization = cls.schema().load(data)
         return deserialization.data, deserialization.errors
 
     @post_load
@@ -0,0 +1,196 @@
+import time
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict
+from peach.database.instrumentation import Histogram
+
+
+# Tracer of the request being handled, stages timed while there's none are ignored
+current_tracer = contextvars.ContextVar('peach_request_tracer', default=None)
+
+
+class RollingHistogram(object):
+
+    """
+    Histogram of the values recorded during the last window seconds, kept in slices that are dropped as they
+    get older. A histogram with every value ever recorded is kept as well
+    """
+
+    def __init__(self, window=60, slices=6, buckets=None):
+        self.window = window
+        self.slice_length = window / slices
+        self.buckets = buckets
+        self.total = Histogram(buckets)
+        self._slices = OrderedDict()
+
+    def _slice(self, now):
+        return int(now // self.slice_length)
+
+    def _expire(self, now):
+        oldest = self._slice(now - self.window)
+        while self._slices and next(iter(self._slices)) <= oldest:
+            self._slices.popitem(last=False)
+
+    def record(self, value, now=None):
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+
+        current = self._slice(now)
+        if current not in self._slices:
+            self._slices[current] = Histogram(self.buckets)
+
+        self._slices[current].record(value)
+        self.total.record(value)
+
+    def recent(self, now=None):
+        """
+        :return: Histogram with the values recorded during the window
+        """
+        self._expire(time.monotonic() if now is None else now)
+
+        histogram = Histogram(self.buckets)
+        for part in self._slices.values():
+            histogram.merge(part)
+
+        return histogram
+
+
+class RequestMetrics(object):
+
+    """
+    Request latency (milliseconds) by endpoint and stage. The 'total' stage is the whole request
+    """
+
+    NAME = 'peach_request_duration_ms'
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=60):
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms = OrderedDict()
+
+    def record(self, endpoint, timings):
+        """
+        :param timings: dict {stage: seconds}
+        """
+        with self._lock:
+            for stage, seconds in timings.items():
+                key = (endpoint, stage)
+                if key not in self._histograms:
+                    self._histograms[key] = RollingHistogram(self.window)
+
+                self._histograms[key].record(seconds * 1000)
+
+    def recent(self):
+        """
+        :return: dict {(endpoint, stage): summary of the last window seconds}
+        """
+        with self._lock:
+            return {key: histogram.recent().summary() for key, histogram in self._histograms.items()}
+
+    def prometheus(self):
+        """
+        :return: the metrics in the Prometheus text format. The histogram counts every request since the process
+                 started, the quantiles only the ones of the last window seconds
+        """
+        lines = ['# HELP {} Request time by endpoint and stage'.format(self.NAME),
+                 '# TYPE {} histogram'.format(self.NAME)]
+        recent = ['# HELP {}_recent Request time quantiles over the last {} seconds'.format(self.NAME, self.window),
+                  '# TYPE {}_recent gauge'.format(self.NAME)]
+
+        with self._lock:
+            for (endpoint, stage), histogram in self._histograms.items():
+                labels = 'endpoint="{}",stage="{}"'.format(endpoint, stage)
+                total = histogram.total
+
+                cumulative = 0
+                for bound, count in zip(list(total.buckets) + ['+Inf'], total.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.NAME, labels, bound, cumulative))
+
+                lines.append('{}_sum{{{}}} {}'.format(self.NAME, labels, round(total.sum, 3)))
+                lines.append('{}_count{{{}}} {}'.format(self.NAME, labels, total.count))
+
+                last = histogram.recent()
+                for q in self.QUANTILES:
+                    value = last.percentile(q * 100)
+                    recent.append('{}_recent{{{},quantile="{}"}} {}'.format(self.NAME, labels, q,
+                                                                            'NaN' if value is None else value))
+
+        return '\n'.join(lines + recent) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+class RequestTracer(object):
+
+    """
+    Times the stages of a request (parse, db, serialize, document, encode...) to build the Server-Timing
+    header and feed the request metrics. Handlers start it when the request comes in and finish it once the
+    response is encoded, the code in between times its stages with peach.rest.tracing.stage
+
+    Ex:
+       >> tracer = RequestTracer('people').start()
+       >> with stage('db'):
+       >>     data = list(People.find({}))
+       >> tracer.finish()
+       >> tracer.header()    # 'db;dur=1.52, total;dur=1.60'
+    """
+
+    def __init__(self, endpoint, metrics=None):
+        self.endpoint = endpoint
+        self.metrics = request_metrics if metrics is None else metrics
+        self.timings = OrderedDict()
+        self._start = None
+        self._token = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._token = current_tracer.set(self)
+        return self
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def finish(self):
+        if self._token is None:
+            return
+
+        self.timings['total'] = time.perf_counter() - self._start
+
+        try:
+            current_tracer.reset(self._token)
+        except ValueError:
+            # finished from a different context than the one it was started on
+            current_tracer.set(None)
+
+        self._token = None
+        self.metrics.record(self.endpoint, self.timings)
+
+    def header(self):
+        return ', '.join('{};dur={:.2f}'.format(name, seconds * 1000) for name, seconds in self.timings.items())
+
+
+_no_stage = contextlib.nullcontext()
+
+
+def stage(name):
+    """
+    :return: context manager timing a stage of the current request, it does nothing if no request is being traced
+    """
+    tracer = current_tracer.get()
+    return tracer.stage(name) if tracer is not None else _no_stage
@@ -35,6 +35,23 @@ def load_resource_class(class_path):
     return m
 
 
+def chunks(iterable, size):
+    """
+    Splits an iterable in lists of at most size elements
+    """
+    chunk = []
+
+    for item in iterable:
+        chunk.append(item)
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
 class ObjectDict(dict):
 
     def __getattr__(self, key):
@@ -3,6 +3,10 @@ from peach.rest.base_api import ApiFactory
 from peach.database.mongo_proxy import MongoDBProxy
 from peach.rest.pagination import Pagination
 from peach.rest.response import ResponseDocumentFactory
+from peach.database.indexes import Index
+from peach.database.memory_proxy import drop_database
+from peach.filters.mongo import DateRangeFilter, NameFilter
+from peach.rest.resource import BaseResource
 
 
 @pytest.fixture
@@ -88,3 +92,90 @@ def test_load_api_definitions(data):
             assert ep.name == original_def['endpoints'][0]['name']
             assert ep.urls == original_def['endpoints'][0]['urls']
             assert issubclass(ep.handler, object)
+
+
+class Event(object):
+    collection_name = 'events'
+    indexes = [Index('<date', 'name'), Index.text('name')]
+
+
+class EventResource(object):
+    model = Event
+    filters = [DateRangeFilter]
+
+
+@pytest.fixture
+def indexed_conf(request):
+    request.addfinalizer(lambda: drop_database('indexes'))
+
+    return {
+        'APIS': {
+            'api': {
+                'prefix': '/api',
+                'endpoints': [{'name': 'events', 'class': 'tests.test_api_factory.EventResource', 'urls': ['/events']}]
+            }
+        },
+        'DATABASE': {
+            'proxy': 'peach.database.memory_proxy.MemoryDBProxy',
+            'name': 'indexes'
+        }
+    }
+
+
+def test_ensure_indexes(indexed_conf):
+    factory = ApiFactory()
+    definitions = factory._api_definitions(indexed_conf)
+
+    indexed_conf['DATABASE']['indexes'] = 'dry_run'
+    report = factory.ensure_indexes(indexed_conf, definitions)['events']
+    assert ['date_-1_name_1', 'name_text', 'date_1'] == [i.name for i in report.missing]
+    assert [] == report.created
+
+    indexed_conf['DATABASE']['indexes'] = 'ensure'
+    assert 3 == len(factory.ensure_indexes(indexed_conf, definitions)['events'].created)
+    assert [] == factory.ensure_indexes(indexed_conf, definitions)['events'].missing
+
+    indexed_conf['DATABASE']['indexes'] = 'off'
+    assert {} == factory.ensure_indexes(indexed_conf, definitions)
+
+
+def test_ensure_indexes_with_cache(indexed_conf):
+    indexed_conf['DATABASE']['cache'] = {'max_entries': 10}
+    factory = ApiFactory()
+    definitions = factory._api_definitions(indexed_conf)
+
+    assert 3 == len(factory.ensure_indexes(indexed_conf, definitions)['events'].created)
+    assert [] == factory.ensure_indexes(indexed_conf, definitions)['events'].missing
+
+
+def test_index_from_info():
+    assert Index('<date', 'name') == Index.from_info('x', {'key': [('date', -1.0), ('name', 1)]})
+    assert Index.text('a', 'b') == Index.from_info('x', {'key': [('_fts', 'text')], 'weights': {'b': 1, 'a': 1}})
+    assert Index('date') != Index('<date')
+
+
+class Person(object):
+    type = None
+
+
+class PeopleByName(BaseResource):
+    model = Person
+    filters = [NameFilter]
+
+
+class PeopleByDate(BaseResource):
+    model = Person
+    filters = [DateRangeFilter]
+
+
+def test_request_args_compiled_per_class():
+    by_name = PeopleByName.compile_request_args(Pagination)
+    by_date = PeopleByDate.compile_request_args(Pagination)
+
+    assert by_name is PeopleByName.compile_request_args(Pagination)
+    assert {'name': NameFilter} == by_name.filters
+    assert 'name' in by_name.args and 'date_range' not in by_name.args
+    assert 'date_range' in by_date.args and 'name' not in by_date.args
+    assert 'fields[person]' == by_name.args['fields'].load_from
+    assert ['sort'] == list(BaseResource.REQUEST_ARGS)
+    assert by_name.schema() is by_name.schema()
@@ -0,0 +1,207 @@
+import pytest
+import json
+import asyncio
+from peach import Peach
+from peach.handlers.asgi import AsgiHandler
+
+
+# The asyncio proxy of the tests is the motor one
+pytest.importorskip('motor.motor_asyncio', exc_type=ImportError)
+
+test_config = {
+    'APIS': {
+        'api': {
+            'prefix': '/api',
+            'name': 'Test Api',
+            'version': '0.0.1',
+            'pagination': 'peach.rest.pagination.Pagination',
+            'response_factory': 'peach.rest.response.ResponseDocumentFactory',
+            'endpoints': [
+                {
+                    'name': 'people',
+                    'class': 'tests.test_asgi_resource.PeopleResource',
+                    'urls': [
+                        '/people',
+                        '/people/{ids}'
+                    ]
+                }
+            ]
+        },
+    },
+
+    'DATABASE': {
+        'proxy': 'peach.database.mongo_proxy.MongoDBProxy',
+        'async_proxy': 'peach.database.motor_proxy.MotorDBProxy',
+        'uri': 'mongodb://localhost:27017/',
+        'name': 'testing'
+    }
+}
+
+
+Peach.init(test_config, AsgiHandler())
+
+
+from marshmallow import fields
+from pymongo import MongoClient
+from peach.rest.serializers import ModelSerializer
+from peach.filters import BaseFilter
+from peach.models import BaseModel
+from peach.handlers.asgi.resource import AsgiBaseResource
+from peach.filters.mongo import NameFilter
+
+
+class People(BaseModel):
+
+    collection_name = 'people'
+
+    def __init__(self, name=None, age=None, address=None, **kwargs):
+        if 'type' in kwargs:
+            kwargs.pop('type')
+
+        super().__init__(**{
+            'name': name,
+            'age': age,
+            'address': address
+        }, **kwargs)
+
+    @classmethod
+    def build(cls, doc):
+        return People(**doc) if doc else None
+
+
+class PeopleSerializer(ModelSerializer):
+
+    model = People
+
+    name = fields.Str(required=True)
+    age = fields.Int(required=True)
+    address = fields.Str()
+
+
+class AgeFilter(BaseFilter):
+
+    name = 'age'
+    value_type = int
+    allow_multiple = False
+
+    @classmethod
+    def condition(cls, age):
+        return {'age': age}
+
+
+class PeopleResource(AsgiBaseResource):
+    model = People
+    serializer = PeopleSerializer
+    filters = [NameFilter, AgeFilter]
+
+
+class AsgiTestClient(object):
+
+    def __init__(self, app):
+        self._app = app
+
+    async def _request(self, method, path, query_string='', body=b''):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string.encode(),
+            'headers': [(b'content-type', b'application/json')]
+        }
+
+        await self._app(scope, receive, send)
+
+        status = messages[0]['status']
+        content = messages[1]['body']
+        return status, json.loads(content.decode()) if content else None
+
+    def get(self, path, query_string=''):
+        return asyncio.get_event_loop().run_until_complete(self._request('GET', path, query_string))
+
+    def post(self, path, data):
+        return asyncio.get_event_loop().run_until_complete(self._request('POST', path, body=json.dumps(data).encode()))
+
+
+@pytest.fixture
+def tester(request):
+
+    People.add(People(name='Foo', age=22, address="xxxx"))
+    People.add(People(name='John', age=22, address="yyyy"))
+    People.add(People(name='Paul', age=44, address="zzzz"))
+    People.add(People(name='David', age=18, address="aaaa"))
+    People.add(People(name='Maria', age=27, address="bbbb"))
+    People.add(People(name='Jean', age=36, address="cccc"))
+
+    def fin():
+        MongoClient(test_config['DATABASE']['uri']).drop_database(test_config['DATABASE']['name'])
+
+    request.addfinalizer(fin)
+
+    return AsgiTestClient(AsgiHandler().create_app(test_config))
+
+
+def test_entry_point(tester):
+    status, response = tester.get('/api')
+
+    assert 200 == status
+    assert 'Test Api' == response['name']
+
+
+def test_get_all(tester):
+    status, response = tester.get('/api/people')
+
+    assert 200 == status
+    assert 6 == len(response['data'])
+
+    response_people_names = [p['name'] for p in response['data']]
+    assert all([name in response_people_names for name in ['Foo', 'John', 'Paul', 'David', 'Maria', 'Jean']])
+
+
+def test_get_by_age(tester):
+    status, response = tester.get('/api/people', query_string='filter[age]=22')
+
+    assert 2 == len(response['data'])
+
+    response_data_names = [r['name'] for r in response['data']]
+    assert all([n in response_data_names for n in ['Foo', 'John']])
+
+
+def test_get_sorted(tester):
+    status, response = tester.get('/api/people', query_string='sort=<name&page[size]=2')
+
+    assert ['Paul', 'Maria'] == [p['name'] for p in response['data']]
+    assert 'next-page' in response['links']
+
+
+def test_invalid_request_arg(tester):
+    status, response = tester.get('/api/people', query_string='filter[age]=foo')
+
+    assert 422 == status
+
+
+def test_post(tester):
+    status, response = tester.post('/api/people', {'name': 'Lucy', 'age': 30})
+
+    assert 201 == status
+    assert 1 == People.count({'name': 'Lucy'})
+
+
+def test_unknown_endpoint(tester):
+    status, response = tester.get('/api/unknown')
+
+    assert 404 == status
+
+
+def test_get_by_ids(tester):
+    ids = [str(p.id) for p in People.find({'name': {'$in': ['Jean', 'David']}}, sort=['<name'])]
+    status, response = tester.get('/api/people/{}'.format(','.join(ids)))
+
+    assert ['Jean', 'David'] == [p['name'] for p in response['data']]
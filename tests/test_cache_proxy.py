@@ -0,0 +1,111 @@
+import time
+import pytest
+from peach.database.proxy import load_db_proxy
+from peach.database.cache_proxy import CachedDBProxy, QueryCache
+from peach.database.memory_proxy import drop_database
+from tests.test_memory_proxy import Item
+
+
+db_config = {
+    'proxy': 'peach.database.memory_proxy.MemoryDBProxy',
+    'name': 'cached',
+    'cache': {'max_entries': 10, 'ttl': 60}
+}
+
+
+@pytest.fixture
+def db(request):
+    db = load_db_proxy(db_config)
+    db.add_many(Item, [Item(_id=i, name='item-{}'.format(i), age=i) for i in range(5)])
+
+    def fin():
+        db.cache.clear()
+        drop_database('cached')
+
+    request.addfinalizer(fin)
+
+    return db
+
+
+def test_cache_enabled_from_config(db):
+    assert isinstance(db, CachedDBProxy)
+    assert db.cache is load_db_proxy(db_config).cache
+
+
+def test_reads_are_cached(db):
+    assert 2 == len(list(db.find(Item, {'age': {'$lt': 2}})))
+
+    db._proxy.add(Item, Item(_id=10, age=1))
+    assert 2 == len(list(db.find(Item, {'age': {'$lt': 2}})))
+    assert 3 == len(list(db.find(Item, {'age': {'$lt': 2}}, limit=5)))
+    assert 1 == db.cache.stats()['hits']
+
+
+def test_writes_invalidate(db):
+    assert 5 == db.count(Item, {})
+    assert 'item-1' == db.by_id(Item, 1).name
+
+    load_db_proxy(db_config).upsert(Item, Item(_id=1, name='changed', age=1))
+    db.add(Item, Item(_id=5))
+
+    assert 6 == db.count(Item, {})
+    assert 'changed' == db.by_id(Item, 1).name
+
+
+def test_cached_results_are_copies(db):
+    next(db.by_attr(Item, 'age', 3)).name = 'changed'
+
+    assert 'item-3' == next(db.by_attr(Item, 'age', 3)).name
+
+
+class NamedItem(Item):
+
+    @classmethod
+    def build(cls, doc):
+        return NamedItem(**doc) if doc else None
+
+
+class ReadOnlyItem(Item):
+
+    read_only = True
+
+    @classmethod
+    def build(cls, doc):
+        return ReadOnlyItem(**doc) if doc else None
+
+
+def test_models_sharing_a_collection_are_cached_apart(db):
+    assert isinstance(db.by_id(Item, 1), Item)
+    assert isinstance(db.by_id(NamedItem, 1), NamedItem)
+    assert not isinstance(db.by_id(Item, 1), NamedItem)
+
+
+def test_read_only_results_are_not_copied(db):
+    assert db.by_id(ReadOnlyItem, 1) is db.by_id(ReadOnlyItem, 1)
+    assert db.by_id(Item, 1) is not db.by_id(Item, 1)
+
+
+def test_lru_ttl_and_memory_bound():
+    cache = QueryCache(max_entries=2, ttl=0.05, max_bytes=2000)
+
+    cache.put('items', 'a', 1, cache.generation('items'))
+    cache.put('items', 'b', 2, cache.generation('items'))
+    cache.get('a')
+    cache.put('items', 'c', 3, cache.generation('items'))
+    assert [True, False, True] == [cache.get(k)[0] for k in 'abc']
+
+    cache.put('items', 'big', list(range(1000)), cache.generation('items'))
+    assert not cache.get('big')[0]
+
+    time.sleep(0.06)
+    assert not cache.get('a')[0]
+
+
+def test_stale_reads_are_not_stored():
+    cache = QueryCache()
+    generation = cache.generation('items')
+
+    cache.invalidate('items')
+    cache.put('items', 'a', 1, generation)
+
+    assert 0 == len(cache)
@@ -0,0 +1,128 @@
+import os
+from pymongo import MongoClient
+from peach.database.registry import ClientRegistry
+from peach.database.mongo_proxy import MongoDBProxy
+
+
+class FakeClient(object):
+
+    def __init__(self, uri, **options):
+        self.uri = uri
+        self.options = options
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_same_uri_and_options_share_client():
+    registry = ClientRegistry(FakeClient)
+
+    client = registry.get('mongodb://localhost:27017/', maxPoolSize=10)
+
+    assert client is registry.get('mongodb://localhost:27017/', maxPoolSize=10)
+    assert client is not registry.get('mongodb://localhost:27017/', maxPoolSize=20)
+    assert client is not registry.get('mongodb://otherhost:27017/', maxPoolSize=10)
+    assert 3 == len(registry)
+
+
+def test_registry_stats():
+    registry = ClientRegistry(FakeClient)
+
+    for _ in range(3):
+        registry.get('mongodb://localhost:27017/')
+
+    stats = registry.stats()
+
+    assert 1 == len(stats)
+    assert 3 == stats[0]['acquired']
+    assert 'mongodb://localhost:27017/' == stats[0]['uri']
+
+
+def test_clients_are_recreated_after_fork():
+    registry = ClientRegistry(FakeClient)
+    client = registry.get('mongodb://localhost:27017/')
+
+    # Simulate being in a forked child process
+    registry._pid = os.getpid() + 1
+
+    new_client = registry.get('mongodb://localhost:27017/')
+
+    assert new_client is not client
+    assert not client.closed
+    assert 1 == len(registry)
+
+
+def test_evict_idle_clients():
+    registry = ClientRegistry(FakeClient, closer=lambda c: c.close())
+    client = registry.get('mongodb://localhost:27017/')
+
+    assert 0 == registry.evict_idle(60)
+    assert 1 == registry.evict_idle(-1)
+    assert client.closed
+    assert 0 == len(registry)
+
+
+def test_mongo_proxies_share_client():
+    first = MongoDBProxy.build(uri='mongodb://localhost:27017/', name='test', pool={'max_size': 5})
+    second = MongoDBProxy.build(uri='mongodb://localhost:27017/', name='other', pool={'max_size': 5})
+
+    assert first._db.client is second._db.client
+    assert 5 == first._db.client.max_pool_size
+
+
+def test_mongo_pool_options():
+    options = MongoDBProxy.client_options({'max_size': 50, 'min_size': 5, 'max_idle_time': 30})
+
+    assert {'maxPoolSize': 50, 'minPoolSize': 5, 'maxIdleTimeMS': 30000} == options
+
+
+def test_mongo_read_options():
+    options = MongoDBProxy.read_options(preference='secondaryPreferred', max_staleness=90, concern='majority')
+
+    assert 'secondaryPreferred' == options['read_preference'].mongos_mode
+    assert 90 == options['read_preference'].max_staleness
+    assert 'majority' == options['read_concern'].level
+    assert {} == MongoDBProxy.read_options()
+
+
+def test_mongo_reads_use_read_options():
+    class Person(object):
+        collection_name = 'people'
+        read_options = {'preference': 'secondary'}
+
+    proxy = MongoDBProxy(MongoClient('mongodb://localhost:27017/', connect=False)['test'])
+
+    assert 'secondary' == proxy._reader(Person).read_preference.mongos_mode
+    assert 'nearest' == proxy._reader(Person, {'preference': 'nearest'}).read_preference.mongos_mode
+    assert 'primary' == proxy.collection(Person).read_preference.mongos_mode
+    assert proxy._reader(Person) is proxy._reader(Person)
+
+
+def test_proxies_get_a_new_client_after_eviction():
+    class Database(object):
+
+        def __init__(self, client, name):
+            self.client = client
+            self.name = name
+
+        def __getitem__(self, collection):
+            return collection
+
+    class Client(FakeClient):
+
+        def __getitem__(self, name):
+            return Database(self, name)
+
+    registry = ClientRegistry(Client, closer=lambda c: c.close())
+    proxy = MongoDBProxy(None, (registry, 'mongodb://localhost:27017/', {}, 'test'))
+
+    client = proxy._db.client
+    assert client is proxy._db.client
+    assert 2 == registry.stats()[0]['acquired']
+
+    assert 1 == registry.evict_idle(-1)
+    assert client.closed
+    assert proxy._db.client is not client
+    assert not proxy._db.client.closed
+    assert 'test' == proxy._db.name
@@ -0,0 +1,29 @@
+import json
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from peach.rest.encoders import load_encoder, StdlibEncoder, OrjsonEncoder, orjson
+
+
+@pytest.mark.parametrize('name', ['stdlib', 'orjson'])
+def test_mongo_types(name):
+    if name == 'orjson' and orjson is None:
+        pytest.skip("orjson is not installed")
+
+    encoder = load_encoder(name)
+    id = ObjectId()
+
+    encoded = encoder.encode({'_id': id, 'created': datetime(2018, 6, 11, 10, 30), 'name': 'Fóo', 'tags': {1}})
+
+    assert isinstance(encoded, bytes)
+    assert {'_id': str(id), 'created': '2018-06-11T10:30:00', 'name': 'Fóo', 'tags': [1]} == json.loads(encoded)
+
+
+def test_load_encoder():
+    assert isinstance(load_encoder('stdlib'), StdlibEncoder)
+    assert isinstance(load_encoder(), StdlibEncoder)
+    assert isinstance(load_encoder('auto'), OrjsonEncoder if orjson else StdlibEncoder)
+    assert isinstance(load_encoder('peach.rest.encoders.StdlibEncoder'), StdlibEncoder)
+
+    with pytest.raises(ValueError):
+        load_encoder('unknown')
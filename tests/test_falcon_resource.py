@@ -12,6 +12,7 @@ test_config = {
             'version': '0.0.1',
             'pagination': 'peach.rest.pagination.Pagination',
             'response_factory': 'peach.rest.response.ResponseDocumentFactory',
+            'tracing': True,
             'endpoints': [
                 {
                     'name': 'people',
@@ -20,6 +21,13 @@ test_config = {
                         '/people',
                         '/people/{ids}'
                     ]
+                },
+                {
+                    'name': 'people-stream',
+                    'class': 'tests.test_falcon_resource.StreamingPeopleResource',
+                    'urls': [
+                        '/people-stream'
+                    ]
                 }
             ]
         },
@@ -91,6 +99,10 @@ class PeopleResource(FalconBaseResource):
     filters = [NameFilter, AgeFilter]
 
 
+class StreamingPeopleResource(PeopleResource):
+    stream = True
+
+
 @pytest.fixture
 def tester(request):
 
@@ -153,3 +165,34 @@ def test_get_sorted(tester):
     assert response['data'][0]['name'] == 'Paul'
     assert response['data'][-1]['name'] == 'David'
 
+
+
+def test_get_streamed(tester):
+    response = tester.simulate_get('/api/people-stream', query_string='page[size]=4&page[total]=none&sort=<age')
+    content = json.loads(response.content)
+
+    assert [44, 36, 27, 22] == [p['age'] for p in content['data']]
+    assert 'total-items' not in content['meta']['pagination']
+    assert 'next-page' in content['links']
+
+
+def test_server_timing(tester):
+    response = tester.simulate_get('/api/people', query_string='sort=name')
+    stages = [t.split(';')[0] for t in response.headers['Server-Timing'].split(', ')]
+
+    assert ['parse', 'db', 'serialize', 'document', 'encode', 'total'] == stages
+    assert 'stage="total"' in tester.simulate_get('/api/_metrics').text
+
+
+def test_querystring_parser(tester):
+    config = dict(test_config, APIS={'api': dict(test_config['APIS']['api'], parser='querystring')})
+    webargs = testing.TestClient(FalconHandler().create_app(test_config))
+    fast = testing.TestClient(FalconHandler().create_app(config))
+
+    for query in ['filter[age]=22&sort=<name', 'page[size]=2&page[number]=2&sort=name', 'fields[people]=name']:
+        assert webargs.simulate_get('/api/people', query_string=query).json == \
+            fast.simulate_get('/api/people', query_string=query).json
+
+    invalid = [c.simulate_get('/api/people', query_string='page[number]=x&filter[age]=a') for c in (webargs, fast)]
+    assert [422, 422] == [r.status_code for r in invalid]
+    assert invalid[0].json == invalid[1].json
@@ -13,6 +13,7 @@ test_config = {
             'version': '0.0.1',
             'pagination': 'peach.rest.pagination.Pagination',
             'response_factory': 'peach.rest.response.ResponseDocumentFactory',
+            'tracing': True,
             'endpoints': [
                 {
                     'name': 'people',
@@ -20,6 +21,17 @@ test_config = {
                     'urls': [
                         '/people',
                         '/people/<string:ids>'
+                    ],
+                    'query': {
+                        'max_time_ms': 2000,
+                        'batch_size': 100
+                    }
+                },
+                {
+                    'name': 'people-stream',
+                    'class': 'tests.test_flask_resource.StreamingPeopleResource',
+                    'urls': [
+                        '/people-stream'
                     ]
                 }
             ]
@@ -44,6 +56,9 @@ from peach.filters import BaseFilter
 from peach.models import BaseModel
 from peach.handlers.flask.resource import FlaskBaseResource
 from peach.filters.mongo import NameFilter
+from peach.database.proxy import QueryTimeout
+from peach.rest.resource import query_overruns
+from peach.rest.tracing import current_tracer
 
 
 class People(BaseModel):
@@ -91,6 +106,10 @@ class PeopleResource(FlaskBaseResource):
     filters = [NameFilter, AgeFilter]
 
 
+class StreamingPeopleResource(PeopleResource):
+    stream = True
+
+
 @pytest.fixture
 def tester(request):
 
@@ -118,6 +137,13 @@ def test_get_all(tester):
     assert all([name in response_people_names for name in ['Foo', 'John', 'Paul', 'David', 'Maria', 'Jean']])
 
 
+def test_delete_by_object_ids(tester):
+    ids = [str(p.id) for p in People.by_attr('age', 22)]
+
+    assert 204 == tester.delete('/api/people/{}'.format(','.join(ids))).status_code
+    assert 4 == len(json.loads(tester.get('/api/people').data)['data'])
+
+
 def test_get_by_name(tester):
     response = json.loads(tester.get('/api/people?filter[name]=Foo').data)
 
@@ -152,3 +178,124 @@ def test_get_sorted(tester):
 
     assert response['data'][0]['name'] == 'Paul'
     assert response['data'][-1]['name'] == 'David'
+
+
+def test_get_without_total(tester):
+    response = json.loads(tester.get('/api/people?page[size]=4&page[total]=none').data)
+
+    assert 4 == len(response['data'])
+    assert 'total-items' not in response['meta']['pagination']
+    assert 'next-page' in response['links']
+    assert 'last-page' not in response['links']
+
+    response = json.loads(tester.get('/api/people?page[size]=4&page[number]=1&page[total]=none').data)
+
+    assert 2 == len(response['data'])
+    assert 'next-page' not in response['links']
+
+
+def test_get_with_estimated_total(tester):
+    response = json.loads(tester.get('/api/people?page[size]=4&page[total]=estimated').data)
+
+    assert 6 == response['meta']['pagination']['total-items']
+    assert response['meta']['pagination']['estimated-total']
+
+
+def test_get_sparse_fields(tester):
+    response = json.loads(tester.get('/api/people?fields[people]=name,age&sort=address').data)
+
+    assert 6 == len(response['data'])
+    assert all([{'name', 'age'} == set(p.keys()) for p in response['data']])
+
+    response = tester.get('/api/people?fields[people]=name,password')
+
+    assert 400 == response.status_code
+
+
+def test_get_by_ids(tester):
+    ids = [str(next(People.by_attr('name', name, many=False)).id) for name in ['Paul', 'Foo', 'Maria']]
+    response = json.loads(tester.get('/api/people/{}'.format(','.join(ids + ['5b1e3d9f0000000000000000']))).data)
+
+    assert ['Paul', 'Foo', 'Maria'] == [p['name'] for p in response['data']]
+
+
+def test_get_streamed(tester):
+    response = tester.get('/api/people-stream?page[size]=3&sort=name&filter[name]=a')
+    content = json.loads(response.data)
+
+    assert 'application/json' == response.mimetype
+    assert ['David', 'Jean', 'Maria'] == [p['name'] for p in content['data']]
+    assert 4 == content['meta']['pagination']['total-items']
+    assert 'next-page' in content['links']
+
+
+def test_get_streamed_applies_filter(tester, monkeypatch):
+    # filters can customize how they query, streamed pages have to go through them as well
+    older_than = classmethod(lambda cls, model, age, **kwargs: model.find({'age': {'$gt': age}}, **kwargs))
+    monkeypatch.setattr(AgeFilter, 'apply', older_than)
+
+    response = tester.get('/api/people-stream?sort=age&filter[age]=27&page[total]=none')
+
+    assert ['Jean', 'Paul'] == [p['name'] for p in json.loads(response.data)['data']]
+
+
+def test_query_timeout(tester, monkeypatch):
+    def find_with_count(condition, **kwargs):
+        assert 2000 == kwargs['max_time_ms']
+        raise QueryTimeout("operation exceeded time limit")
+
+    monkeypatch.setattr(People, 'find_with_count', find_with_count)
+    overruns = query_overruns[('PeopleResource', ('age',))]
+
+    response = tester.get('/api/people?filter[age]=22')
+
+    assert 504 == response.status_code
+    assert ['age'] == json.loads(response.data)['meta']['filters']
+    assert overruns + 1 == query_overruns[('PeopleResource', ('age',))]
+
+
+def test_query_timeout_streamed(tester, monkeypatch):
+    def find(condition, **kwargs):
+        yield People(name='Foo', age=22)
+        raise QueryTimeout("operation exceeded time limit")
+
+    monkeypatch.setattr(People, 'find', find)
+    overruns = query_overruns[('StreamingPeopleResource', ())]
+
+    content = json.loads(tester.get('/api/people-stream?page[total]=none').data)
+
+    assert ['Foo'] == [p['name'] for p in content['data']]
+    assert [504] == [e['status'] for e in content['errors']]
+    assert 'links' not in content
+    assert overruns + 1 == query_overruns[('StreamingPeopleResource', ())]
+
+
+    def find_timing_out(condition, **kwargs):
+        raise QueryTimeout("operation exceeded time limit")
+        yield
+
+    monkeypatch.setattr(People, 'find', find_timing_out)
+
+    assert 504 == tester.get('/api/people-stream?page[total]=none').status_code
+
+
+def test_server_timing(tester):
+    response = tester.get('/api/people?filter[age]=22')
+    stages = [t.split(';')[0] for t in response.headers['Server-Timing'].split(', ')]
+
+    assert ['parse', 'db', 'serialize', 'document', 'encode', 'total'] == stages
+
+    metrics = tester.get('/api/_metrics').data.decode()
+    assert 'peach_request_duration_ms_count{endpoint="people",stage="db"}' in metrics
+
+
+def test_tracer_reset_when_request_fails(tester, monkeypatch):
+    def find_with_count_failing(condition, **kwargs):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(People, 'find_with_count', find_with_count_failing)
+
+    with pytest.raises(RuntimeError):
+        tester.get('/api/people?filter[age]=22')
+
+    assert current_tracer.get() is None
@@ -0,0 +1,85 @@
+import pytest
+from peach.database.proxy import load_db_proxy
+from peach.database.memory_proxy import drop_database
+from peach.database.instrumentation import InstrumentedDBProxy, Histogram, query_shape, query_stats
+from tests.test_memory_proxy import Item
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.events = []
+
+    def export(self, event):
+        self.events.append(event)
+
+
+db_config = {
+    'proxy': 'peach.database.memory_proxy.MemoryDBProxy',
+    'name': 'instrumented',
+    'instrumentation': {'bytes': True, 'exporters': ['tests.test_instrumentation.Recorder']}
+}
+
+
+@pytest.fixture
+def db(request):
+    db = load_db_proxy(db_config)
+    db.add_many(Item, [Item(_id=i, name='item-{}'.format(i), age=i) for i in range(5)])
+    query_stats.reset()
+
+    request.addfinalizer(lambda: drop_database('instrumented'))
+
+    return db
+
+
+def events(db):
+    return db.instrumentation.exporters[1].events
+
+
+def test_query_shape():
+    assert query_shape({'age': {'$gt': 20}, 'name': 'foo'}) == query_shape({'name': 'bar', 'age': {'$gt': 1}})
+    assert '{"$or": [{"a": "?"}, {"b": {"$in": "?"}}]} sort=<a' == query_shape({'$or': [{'a': 1}, {'b': {'$in': [1]}}]},
+                                                                               sort=['<a'])
+
+
+def test_calls_are_recorded(db):
+    assert isinstance(db, InstrumentedDBProxy)
+
+    assert 3 == len(list(db.find(Item, {'age': {'$lt': 3}})))
+    db.by_id(Item, 4)
+    db.count(Item, {'age': 1})
+
+    find, by_id, count = events(db)[-3:]
+
+    assert ('items', 'find', 3) == (find.collection, find.operation, find.documents)
+    assert find.bytes > 0
+    assert ('by_id', 1) == (by_id.operation, by_id.documents)
+    assert ('count', None, '{"age": "?"}') == (count.operation, count.documents, count.shape)
+
+
+def test_stats_by_query_shape(db):
+    for i in range(5):
+        db.by_id(Item, i)
+        list(db.find(Item, {'age': i}))
+
+    stats = query_stats.top(2, by='count')
+
+    assert {'by_id', 'find'} == {s.operation for s in stats}
+    assert [5, 5] == [s.count for s in stats]
+
+
+def test_errors_are_recorded(db):
+    with pytest.raises(Exception):
+        db.add(Item, Item(_id=1))
+
+    assert events(db)[-1].error is not None
+
+
+def test_histogram():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.record(value)
+
+    assert 100 == histogram.count
+    assert 50 == histogram.percentile(50)
+    assert 100 == histogram.percentile(99)
@@ -0,0 +1,129 @@
+import pytest
+from peach.utils import ObjectDict
+from peach.database.proxy import DBProxy
+from peach.database.memory_proxy import MemoryDBProxy, DuplicateKeyError, drop_database, matches
+
+
+class Item(ObjectDict):
+
+    collection_name = 'items'
+    memory_indexes = [('age', 'sorted'), ('name', 'hash')]
+
+    @property
+    def id(self):
+        return self._id
+
+    @classmethod
+    def build(cls, doc):
+        return Item(**doc) if doc else None
+
+
+@pytest.fixture
+def db(request):
+    db = MemoryDBProxy.build(name='testing')
+    db.add_many(Item, [Item(_id=i, name='item-{}'.format(i % 5), age=i, tags=['t{}'.format(i % 3)])
+                       for i in range(20)])
+
+    request.addfinalizer(lambda: drop_database('testing'))
+
+    return db
+
+
+def test_matches():
+    doc = {'name': 'Foo', 'age': 22, 'address': {'city': 'Paris'}, 'tags': ['a', 'b']}
+
+    assert matches(doc, {'name': 'Foo', 'age': {'$gte': 20, '$lte': 22}})
+    assert matches(doc, {'address.city': {'$regex': '^par', '$options': 'i'}})
+    assert matches(doc, {'tags': 'a', 'age': {'$in': [1, 22]}})
+    assert matches(doc, {'$or': [{'name': 'Bar'}, {'age': {'$gt': 21}}]})
+    assert not matches(doc, {'age': {'$gt': '1'}})
+    assert not matches(doc, {'name': 'Foo', 'email': {'$exists': True}})
+
+
+def test_find(db):
+    assert 4 == db.count(Item, {'name': 'item-1'})
+    assert [5, 6, 7] == [i.age for i in db.find(Item, {'age': {'$gte': 5, '$lt': 8}})]
+    assert [19, 14, 9] == [i.age for i in db.find(Item, {'name': 'item-4'}, sort=['<age'], limit=3)]
+    assert [7, 10] == [i.age for i in db.find(Item, {'tags': 't1', 'age': {'$lte': 10}}, skip=2, limit=2)]
+    assert [{'_id': 3, 'name': 'item-3'}] == list(db.find(Item, {'age': 3}, fields=['name']))
+
+
+def test_find_after(db):
+    condition = {'name': {'$in': ['item-0', 'item-1']}}
+    page, total = db.find_with_count(Item, condition, sort=['<age', '_id'], after=[15, 15], limit=3)
+
+    assert [11, 10, 6] == [i.age for i in page]
+    assert 8 == total
+
+
+@pytest.mark.parametrize('sort', [['nickname', '_id'], ['<nickname', '_id'], ['<nickname', '<_id']])
+def test_find_after_null_values(db, sort):
+    # items without nickname (missing or null) sort before the others
+    db.upsert(Item, *[Item(_id=i, nickname=['b', None, 'a'][i % 3]) for i in range(0, 20, 2)])
+    expected = [i.id for i in db.find(Item, {}, sort=sort)]
+
+    ids, after = [], None
+    while True:
+        page = list(db.find(Item, {}, sort=sort, after=after, limit=3))
+        if not page:
+            break
+
+        ids += [i.id for i in page]
+        after = [page[-1].get(s.lstrip('<>')) for s in sort]
+
+    assert expected == ids and 20 == len(ids)
+
+
+def test_indexes_match_scans(db):
+    conditions = [
+        {'age': {'$gt': 3, '$lte': 9}},
+        {'name': {'$in': ['item-2', 'item-3']}, 'age': {'$lt': 12}},
+        {'$or': [{'name': 'item-0'}, {'age': 1}]},
+        {'name': {'$regex': '^item-[12]'}},
+    ]
+
+    for condition in conditions:
+        expected = [i for i in range(20) if matches(db.by_id(Item, i), condition)]
+        assert expected == [i.id for i in db.find(Item, condition)]
+
+
+def test_writes_update_indexes(db):
+    db.upsert(Item, Item(_id=3, name='item-new', age=100))
+    db.delete(Item, 4, 5)
+
+    assert [3] == [i.id for i in db.find(Item, {'age': {'$gte': 100}})]
+    assert [] == list(db.find(Item, {'age': {'$in': [4, 5]}}))
+    assert 0 == db.count(Item, {'name': 'item-3', 'age': 3})
+    assert 18 == db.estimated_count(Item)
+
+
+def test_duplicated_ids(db):
+    with pytest.raises(DuplicateKeyError):
+        db.add(Item, Item(_id=1, name='other'))
+
+    results = db.add_many(Item, [Item(_id=1), Item(_id=50)])
+    assert 1 == results[0].inserted
+    assert [0] == [e['index'] for e in results[0].errors]
+
+
+def test_stored_documents_are_copies(db):
+    item = db.by_id(Item, 1)
+    item.tags.append('changed')
+
+    assert ['t1'] == db.by_id(Item, 1).tags
+
+
+def test_find_with_count_passes_count_options():
+    class Proxy(DBProxy):
+
+        def find(self, model, condition, **kwargs):
+            return iter([])
+
+        def count(self, model, condition, **kwargs):
+            self.count_options = kwargs
+            return 0
+
+    proxy = Proxy()
+    proxy.find_with_count(Item, {}, limit=3, max_time_ms=100, batch_size=10, read={'preference': 'secondary'})
+
+    assert {'max_time_ms': 100, 'read': {'preference': 'secondary'}} == proxy.count_options
@@ -0,0 +1,231 @@
+import bson
+import asyncio
+import pytest
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+# sets up peach, which the models need before being imported
+from tests.test_flask_resource import People, PeopleSerializer, test_config
+from peach.models import CompactModel, LazyModel
+from peach.rest.encoders import StdlibEncoder
+from peach.database.loader import ModelLoader, AsyncModelLoader
+from peach.database.memory_proxy import MemoryDBProxy, drop_database
+from peach.filters.search import PrefixSearch
+
+
+class CompactPeople(CompactModel):
+
+    collection_name = 'people'
+    fields = ('name', 'age', 'address')
+
+
+class PeopleListing(LazyModel):
+
+    collection_name = 'people'
+
+
+@pytest.fixture
+def items(request):
+    def fin():
+        MongoClient(test_config['DATABASE']['uri']).drop_database(test_config['DATABASE']['name'])
+
+    request.addfinalizer(fin)
+
+    return [People(_id=i, name='item-{}'.format(i), age=i) for i in range(10)]
+
+
+def test_add_many_in_batches(items):
+    results = People.add_many(items, batch_size=4)
+
+    assert [4, 4, 2] == [r.inserted for r in results]
+    assert 10 == People.count()
+
+
+def test_bulk_upsert(items):
+    People.add_many(items[:5])
+
+    for item in items:
+        item.name = item.name.upper()
+
+    results = People.upsert(*items, batch_size=5)
+
+    assert [5, 0] == [r.modified for r in results]
+    assert [0, 5] == [r.upserted for r in results]
+    assert 10 == People.count({'name': {'$regex': '^ITEM'}})
+
+
+def test_bulk_delete(items):
+    People.add_many(items)
+
+    results = People.delete(*[i.id for i in items[:7]], batch_size=3)
+
+    assert [3, 3, 1] == [r.deleted for r in results]
+    assert 3 == People.count()
+
+
+def test_find_with_count(items):
+    People.add_many(items)
+
+    data, total = People.find_with_count({'age': {'$gte': 4}}, skip=2, limit=3, sort=['<age'])
+
+    assert 6 == total
+    assert [7, 6, 5] == [p.age for p in data]
+
+
+def test_find_with_count_falls_back_when_aggregating_fails(items, monkeypatch):
+    People.add_many(items)
+
+    def aggregate(*args, **kwargs):
+        raise OperationFailure("Sort exceeded memory limit", code=292)
+
+    monkeypatch.setattr(type(People.db.collection(People)), 'aggregate', aggregate)
+    data, total = People.find_with_count({'age': {'$gte': 4}}, skip=2, limit=3, sort=['<age'])
+
+    assert 6 == total
+    assert [7, 6, 5] == [p.age for p in data]
+
+
+def test_find_with_count_without_matches(items):
+    data, total = People.find_with_count({'age': {'$gte': 100}}, limit=3)
+
+    assert 0 == total
+    assert [] == data
+
+
+def test_by_ids_keeps_order(items):
+    People.add_many(items)
+
+    assert [7, 2, 5] == [p.id for p in People.by_ids([7, 2, 99, 5])]
+
+
+def test_loader_batches_lookups(items, monkeypatch):
+    People.add_many(items)
+    queries = []
+    by_ids = People.by_ids
+    monkeypatch.setattr(People, 'by_ids', lambda ids: queries.append(ids) or by_ids(ids))
+
+    loader = ModelLoader(People)
+    deferred = [loader.load(i) for i in [3, 1, 3, 42]]
+
+    assert [3, 1, 3, None] == [d.get() and d.get().id for d in deferred]
+    assert [1, 8] == [p.id for p in loader.load_many([1, 8])]
+    assert [[3, 1, 42], [8]] == queries
+
+
+def test_async_loader_retries_failed_lookups():
+    class Flaky(object):
+        calls = []
+
+        def __init__(self, id):
+            self.id = id
+
+        @classmethod
+        async def aby_ids(cls, ids):
+            cls.calls.append(ids)
+            if len(cls.calls) == 1:
+                raise ConnectionError()
+
+            return [cls(id) for id in ids]
+
+    async def load_twice():
+        loader = AsyncModelLoader(Flaky)
+
+        with pytest.raises(ConnectionError):
+            await loader.load(1)
+
+        return await loader.load(1)
+
+    assert 1 == asyncio.run(load_twice()).id
+    assert [[1], [1]] == Flaky.calls
+
+
+def test_search_fields_filled_on_writes(items, monkeypatch):
+    monkeypatch.setattr(People, 'searches', [PrefixSearch('name')])
+    People.add_many(items)
+
+    assert ['item-3'] == People.by_id(3)._search_name
+    assert [3] == [p.id for p in People.by_attr('name', 'ITEM-3', exact=False)]
+
+
+def test_compact_model_attributes():
+    person = CompactPeople.build({'_id': 1, 'name': 'Foo', 'age': 22, '_search_name': ['foo']})
+    person.address = 'Main St'
+
+    assert not hasattr(person, '__dict__')
+    assert (1, 'Foo', 22, 'Main St') == (person.id, person.name, person['age'], person.address)
+    assert ['foo'] == person._search_name
+    assert {'_id': 1, 'name': 'Foo', 'age': 22, 'address': 'Main St', '_search_name': ['foo']} == dict(person)
+    assert 'email' not in person and person.get('email') is None
+
+    with pytest.raises(AttributeError):
+        person.email
+
+    del person['age']
+    assert 'age' not in person and 4 == len(person)
+
+
+def test_compact_model_fields_cant_replace_model_attributes():
+    with pytest.raises(ValueError):
+        class Event(CompactModel):
+            fields = ('name', 'type', 'count')
+
+
+def test_compact_model_serializes_as_base_model():
+    doc = {'_id': 1, 'name': 'Foo', 'age': 22, 'address': None}
+
+    assert PeopleSerializer.serialize(People(**doc))[0] == PeopleSerializer.serialize(CompactPeople(doc))[0]
+
+
+def test_compact_model_round_trip():
+    db = MemoryDBProxy.build(name='compact')
+    db.add_many(CompactPeople, [CompactPeople(_id=i, name='item-{}'.format(i), age=i) for i in range(3)])
+
+    try:
+        person = db.by_id(CompactPeople, 2)
+
+        assert isinstance(person, CompactPeople)
+        assert ('item-2', 2) == (person.name, person.age)
+        assert [1, 0] == [p.id for p in db.find(CompactPeople, {'age': {'$lt': 2}}, sort=['<age'])]
+    finally:
+        drop_database('compact')
+
+
+def test_by_attr_builds_models_once(items, monkeypatch):
+    People.add_many(items)
+    built = []
+    build = People.build
+    monkeypatch.setattr(People, 'build', lambda doc: built.append(doc['_id']) or build(doc))
+
+    assert [1, 2] == [p.id for p in People.by_attr('age', {'$in': [1, 2]}, sort=['>age'])]
+    assert [3] == [p.id for p in People.all(skip=3, limit=1, sort=['>age'])]
+    assert [1, 2, 3] == built
+
+
+def test_lazy_model_decodes_on_access():
+    doc = {'_id': bson.ObjectId(), 'name': 'Foo', 'age': 22, 'address': {'city': 'Paris'}}
+    person = PeopleListing.build(RawBSONDocument(bson.encode(doc)))
+
+    assert person._fields is None
+    assert bson.encode(doc) == person.raw
+    assert ('Foo', doc['_id']) == (person.name, person.id)
+    assert {'city': 'Paris'} == person.address
+
+    assert [{'name': 'Foo', 'age': 22}] == PeopleSerializer.serialize([person], filters=['name', 'age'], many=True)[0]
+    assert b'{"city":"Paris"}' == StdlibEncoder().encode(person.address)
+
+    with pytest.raises(AttributeError):
+        person.name = 'Bar'
+
+
+def test_lazy_model_from_dicts():
+    db = MemoryDBProxy.build(name='lazy')
+    db.add_many(PeopleListing, [{'_id': i, 'name': 'item-{}'.format(i), 'age': i} for i in range(3)])
+
+    try:
+        people = list(db.find(PeopleListing, {'age': {'$gte': 1}}, sort=['>age']))
+
+        assert [1, 2] == [p.id for p in people]
+        assert {'_id': 1, 'name': 'item-1', 'age': 1} == dict(people[0])
+        assert None is people[0].raw
+    finally:
+        drop_database('lazy')
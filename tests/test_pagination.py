@@ -0,0 +1,106 @@
+import pytest
+import urllib
+from peach.rest.pagination import Pagination, CursorPagination, InvalidPageCursor
+from peach.rest.response import ResponseDocumentFactory
+from peach.database.mongo_proxy import MongoDBProxy
+
+
+def test_pagination_skip():
+    assert 0 == Pagination(page_number=0, page_size=10).skip
+    assert 30 == Pagination(page_number=3, page_size=10).skip
+    assert Pagination().after(['name']) is None
+
+
+def test_cursor_sort_adds_id():
+    pagination = CursorPagination()
+
+    assert ['_id'] == pagination.sort(None)
+    assert ['<name', '_id'] == pagination.sort(['<name'])
+    assert ['>_id'] == pagination.sort(['>_id'])
+
+
+def test_cursor_round_trip():
+    cursor = CursorPagination.encode_cursor(['name', '_id'], ['Foo', 12])
+
+    assert (['name', '_id'], ['Foo', 12]) == CursorPagination.decode_cursor(cursor)
+    assert ['Foo', 12] == CursorPagination(after=cursor).after(['name'])
+
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidPageCursor):
+        CursorPagination(after='not-a-cursor').after(None)
+
+    # Cursor built for a different sorting
+    cursor = CursorPagination.encode_cursor(['name', '_id'], ['Foo', 12])
+    with pytest.raises(InvalidPageCursor):
+        CursorPagination(after=cursor).after(['age'])
+
+    # Values that don't match the sorting
+    for values in [['Foo'], 'Foo', None]:
+        cursor = CursorPagination.encode_cursor(['name', '_id'], values)
+        with pytest.raises(InvalidPageCursor):
+            CursorPagination(after=cursor).after(['name'])
+
+
+def test_next_cursor_only_when_there_are_more_results():
+    pagination = CursorPagination(page_size=2)
+    pagination.set_results([{'_id': 1, 'name': 'A'}], ['name'])
+
+    assert pagination.next is None
+
+    pagination.set_results([{'_id': 1, 'name': 'A'}, {'_id': 2, 'name': 'B'}], ['name'])
+
+    assert pagination.next is None
+
+    # The page is fetched with an extra element to find out if there's a next page
+    page = pagination.set_results([{'_id': 1, 'name': 'A'}, {'_id': 2, 'name': 'B'}, {'_id': 3, 'name': 'C'}],
+                                  ['name'])
+
+    assert 2 == len(page)
+    assert ['B', 2] == CursorPagination(after=pagination.next).after(['name'])
+
+
+def test_keyset_condition():
+    condition = MongoDBProxy(None)._keyset_condition({'age': 22}, ['<name', '_id'], ['Foo', 3])
+
+    assert {
+        '$and': [
+            {'age': 22},
+            {'$or': [
+                {'name': {'$lt': 'Foo'}},
+                {'name': None},
+                {'name': 'Foo', '_id': {'$gt': 3}}
+            ]}
+        ]
+    } == condition
+
+
+def test_find_with_count_pipeline_sorts_before_facet():
+    pipeline = MongoDBProxy(None)._find_with_count_pipeline({'age': 22}, skip=10, limit=5, sort=['<name'],
+                                                            fields=['name'])
+
+    assert [{'$match': {'age': 22}}, {'$sort': {'name': -1}}, {'$project': {'name': True}}] == pipeline[:3]
+    assert [{'$skip': 10}, {'$limit': 5}] == pipeline[3]['$facet']['data']
+
+
+def test_cursor_links():
+    pagination = CursorPagination(page_size=2, after='abc', total_items=10)
+    pagination.set_results([{'_id': 1}, {'_id': 2}, {'_id': 3}], None)
+
+    doc = ResponseDocumentFactory.data_response('test',
+                                                '/api/test/',
+                                                'filter[name]=foo&page[after]=abc',
+                                                [],
+                                                pagination=pagination).data()
+
+    assert 'current-page' not in doc['meta']['pagination']
+    assert {'first-page', 'next-page'} == set(doc['links'].keys())
+
+    next_page = urllib.parse.unquote_plus(doc['links']['next-page'])
+    assert 'page[after]={}'.format(pagination.next) in next_page
+    assert 'page[after]=abc' not in next_page
+    assert 'filter[name]=foo' in next_page
+
+    first_page = urllib.parse.unquote_plus(doc['links']['first-page'])
+    assert 'page[after]' not in first_page
+    assert 'page[size]=2' in first_page
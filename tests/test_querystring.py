@@ -0,0 +1,43 @@
+import pytest
+from marshmallow import ValidationError
+from werkzeug.datastructures import MultiDict
+from peach.rest.querystring import QueryStringParser
+from peach.rest.pagination import Pagination
+from tests.test_flask_resource import PeopleResource
+
+
+request_args = PeopleResource.compile_request_args(Pagination)
+parser = QueryStringParser.build(request_args.args)
+
+
+def webargs_result(params):
+    try:
+        return request_args.schema().load(params).data
+    except ValidationError as e:
+        return e.messages
+
+
+def parsed(params):
+    try:
+        return parser.parse(params)
+    except ValidationError as e:
+        return e.messages
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'filter[name]': 'Foo,Bar', 'filter[age]': '22', 'sort': '<age,name', 'fields[people]': 'name'},
+    {'page[number]': '2', 'page[size]': '10', 'page[total]': 'estimated', 'unknown': 'x'},
+    {'page[number]': 'x', 'page[total]': 'all', 'filter[age]': ''},
+    {'filter[name]': ['Foo', 'Bar'], 'filter[age]': ['1', '2']},
+    MultiDict([('filter[age]', '1'), ('filter[age]', 'a'), ('sort', 'name')]),
+])
+def test_same_results_as_webargs(params):
+    assert webargs_result(params) == parsed(params)
+
+
+def test_needs_webargs_for_other_locations():
+    from webargs import fields
+
+    assert QueryStringParser.build({'name': fields.Str(location='json')}) is None
+    assert QueryStringParser.build({'name': fields.Str(location='query')}) is not None
@@ -1,4 +1,5 @@
 import pytest
+import json
 import urllib
 from peach.rest.pagination import Pagination
 from peach.rest.response import ResponseDocumentFactory
@@ -138,3 +139,16 @@ def check_pagination_string(pagination_str, base_url, pagination, page_number, p
     assert pagination_number_str in new_querystring
     # Make sure it only appears once
     assert new_querystring.find(pagination_number_str) == new_querystring.rfind(pagination_number_str)
+
+
+def test_streamed_document():
+    pagination = Pagination(page_size=3, total_mode=Pagination.TOTAL_NONE)
+    data = pagination.iter_results(({'n': i} for i in range(4)))
+    document = ResponseDocumentFactory.stream_response('test', '/api/test', '', data=data, pagination=pagination)
+    document._chunk_size = 1
+
+    chunks = list(document.chunks())
+
+    assert 4 == len(chunks)
+    assert [{'n': 0}, {'n': 1}, {'n': 2}] == json.loads(b''.join(chunks))['data']
+    assert 'next-page' in json.loads(b''.join(chunks))['links']
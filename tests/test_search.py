@@ -0,0 +1,75 @@
+import pytest
+from peach.database.indexes import Index
+from peach.database.memory_proxy import MemoryDBProxy, drop_database
+from peach.filters.search import SearchFilter, PrefixSearch, NGramSearch, TextSearch, RegexSearch, normalize
+from peach.filters.mongo import NameFilter
+from peach.rest.resource import BaseResource
+from peach.utils import ObjectDict
+from tests.test_memory_proxy import Item
+
+
+NAMES = ['José Martínez', 'Paul Smith', 'Maria Jose Paulo', 'John Doe', 'Ana Maria']
+
+
+@pytest.fixture
+def db(request):
+    request.addfinalizer(lambda: drop_database('search'))
+    return MemoryDBProxy.build(name='search')
+
+
+def search(db, strategy, *terms):
+    db.create_indexes(Item, strategy.indexes)
+    db.add_many(Item, [strategy.prepare(Item(_id=i, name=n)) for i, n in enumerate(NAMES)])
+    return [i.name for i in db.find(Item, strategy.condition(*terms), sort=['_id'])]
+
+
+def test_normalize():
+    assert 'jose martinez' == normalize('  José   MARTÍNEZ ')
+
+
+def test_prefix_search(db):
+    assert ['José Martínez', 'Maria Jose Paulo'] == search(db, PrefixSearch('name'), 'jose')
+    assert ['Paul Smith', 'Maria Jose Paulo', 'John Doe'] == search(db, PrefixSearch('name'), 'PAUL', 'john d')
+
+
+def test_ngram_search(db):
+    assert ['Paul Smith', 'Maria Jose Paulo'] == search(db, NGramSearch('name'), 'aul')
+    assert ['Paul Smith'] == search(db, NGramSearch('name'), 'l sm')
+    assert ['Ana Maria'] == search(db, NGramSearch('name'), 'na')
+    assert ['José Martínez', 'Maria Jose Paulo'] == search(db, NGramSearch('name'), 'jose')
+    assert ['José Martínez'] == search(db, NGramSearch('name'), 'MARTÍN')
+
+
+def test_search_filter_declares_indexes():
+    class NameSearchFilter(SearchFilter):
+        name = 'name'
+        search = PrefixSearch('name', 'nickname')
+
+    assert [Index('_search_name'), Index('_search_nickname')] == NameSearchFilter.indexes
+    assert [Index.text('name')] == TextSearch('name').indexes
+    assert {'$text': {'$search': 'foo bar'}} == TextSearch('name').condition('foo', 'bar')
+    assert {'$text': {'$search': 'foo'}} == TextSearch('name').condition('foo', attrs=['name'])
+
+    with pytest.raises(ValueError):
+        TextSearch('name').condition('foo', attrs=['address'])
+
+    assert [] == NameFilter.indexes
+    assert NameFilter.condition('Foo') == RegexSearch('name').condition('Foo')
+
+
+def test_multi_term_search_filters_are_combined(db):
+    class NameSearchFilter(SearchFilter):
+        name = 'name'
+        search = RegexSearch('name')
+
+    class NicknameSearchFilter(SearchFilter):
+        name = 'nickname'
+        search = RegexSearch('nickname')
+
+    db.add_many(Item, [Item(_id=i, name=n, nickname=n.split()[-1]) for i, n in enumerate(NAMES)])
+    condition = BaseResource.filters_condition({
+        'name': ObjectDict(filter_cls=NameSearchFilter, value=['jose', 'paul']),
+        'nickname': ObjectDict(filter_cls=NicknameSearchFilter, value=['smith', 'paulo', 'doe'])
+    })
+
+    assert ['Paul Smith', 'Maria Jose Paulo'] == [i.name for i in db.find(Item, condition, sort=['_id'])]
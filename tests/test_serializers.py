@@ -0,0 +1,99 @@
+import pytest
+from marshmallow import fields
+from peach.utils import ObjectDict
+from peach.rest import serializers
+from peach.rest.serializers import ModelSerializer, compile_dumper, cached_dumper, MAX_CACHED_FIELDSETS
+
+
+class Person(ObjectDict):
+
+    @property
+    def id(self):
+        return self._id
+
+    @classmethod
+    def build(cls, data):
+        return Person(**data)
+
+
+class PersonSerializer(ModelSerializer):
+
+    model = Person
+
+    id = fields.Str()
+    name = fields.Str(required=True)
+    age = fields.Int()
+    height = fields.Float(dump_to='height-cm')
+    active = fields.Boolean(default=True)
+    nickname = fields.Str(attribute='alias')
+    extra = fields.Raw()
+    password = fields.Str(load_only=True)
+
+
+class GroupSerializer(ModelSerializer):
+
+    name = fields.Str()
+    members = fields.Nested(PersonSerializer, many=True)
+
+
+people = [
+    Person(_id=1, name='Foo', age=22, height=180, active=1, alias='F', extra={'a': [1]}, password='x'),
+    Person(_id='2', name=b'Bar', age='33', height=None, active='false'),
+    Person(_id=3, name=None, age=44.7, active=None, extra=None),
+]
+
+
+def marshmallow_dump(data, only=None, many=True):
+    return PersonSerializer(many=many, only=only).dump(data).data
+
+
+@pytest.mark.parametrize('only', [None, ('name',), ('age', 'height', 'id')])
+def test_compiled_dumper_matches_marshmallow(only):
+    data, errors = PersonSerializer.serialize(people, filters=only, many=True)
+
+    assert PersonSerializer.dumper(PersonSerializer._only(only)) is not None
+    assert {} == errors
+    assert marshmallow_dump(people, only) == data
+
+
+def test_fallback_to_marshmallow():
+    assert compile_dumper(GroupSerializer()) is None
+
+    # age can't be dumped as an int, marshmallow reports it
+    data, errors = PersonSerializer.serialize(Person(name='Foo', age='old'))
+    assert 'age' in errors
+
+    # only the element that can't be dumped goes through marshmallow
+    data, errors = PersonSerializer.serialize([Person(name='Foo', age=1), Person(name='Bar', age='old')], many=True)
+    assert [1] == list(errors) and 'age' in errors[1]
+    assert {'name': 'Foo', 'age': 1, 'active': True} == data[0]
+
+    obj = type('Obj', (object,), {'name': 'Foo', 'age': 3})()
+    assert marshmallow_dump(obj, many=False) == PersonSerializer.serialize(obj)[0]
+
+
+def test_schemas_are_cached():
+    assert PersonSerializer.schema(many=True) is PersonSerializer.schema(many=True)
+    assert PersonSerializer.schema(only=('name',)) is not PersonSerializer.schema()
+
+
+def test_cached_fieldsets_are_bounded():
+    names = tuple(PersonSerializer.field_names())
+    for i in range(MAX_CACHED_FIELDSETS + 10):
+        only = tuple(n for j, n in enumerate(names) if i >> j & 1) or None
+        PersonSerializer.serialize(people, filters=only, many=True)
+
+    assert MAX_CACHED_FIELDSETS >= cached_dumper.cache_info().currsize
+    assert MAX_CACHED_FIELDSETS >= len(serializers._schemas.cache)
+
+
+def test_iter_serialize():
+    assert marshmallow_dump(people, ('name',)) == list(PersonSerializer.iter_serialize(iter(people), ['name']))
+
+
+def test_deserialize():
+    person, errors = PersonSerializer.deserialize({'name': 'Foo', 'age': 22})
+
+    assert {} == errors
+    assert isinstance(person, Person)
+    assert 22 == person.age